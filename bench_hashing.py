@@ -0,0 +1,110 @@
+# bench_hashing.py
+"""Сравнение скорости: старый pHash (полное декодирование + imagehash) и hashing.image_hashes.
+
+    python bench_hashing.py [папка с картинками] [--album 10] [--repeat 3]
+
+Без папки берутся файлы из MEDIA_DIR, а если там пусто — генерируются
+синтетические JPEG 1280×960. Кроме скорости печатается, насколько новые
+pHash расходятся со старыми (в битах), чтобы было видно, что пороги
+IMAGE_DUPLICATE_THRESHOLD менять не нужно.
+
+Боту imagehash больше не нужен, он есть только здесь, для сравнения:
+pip install ImageHash.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import imagehash
+from PIL import Image, ImageDraw, ImageFilter
+
+import hashing
+from config import MEDIA_DIR
+
+_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def legacy_phash(path):
+    """Прежний calc_image_hash: декодирование в полном разрешении."""
+    try:
+        return str(imagehash.phash(Image.open(path)))
+    except Exception:
+        return None
+
+
+def _synthetic(folder, count=30):
+    rnd = random.Random(0)
+    paths = []
+    for i in range(count):
+        img = Image.new("RGB", (1280, 960), tuple(rnd.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(15):
+            x, y = rnd.randrange(1200), rnd.randrange(900)
+            w, h = rnd.randrange(50, 600), rnd.randrange(50, 600)
+            draw.ellipse([x, y, x + w, y + h], fill=tuple(rnd.randrange(256) for _ in range(3)))
+        img = img.filter(ImageFilter.GaussianBlur(2))
+        path = os.path.join(folder, f"bench_{i}.jpg")
+        img.save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def _collect(folder):
+    if not folder or not os.path.isdir(folder):
+        return []
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(_EXTS)
+    )
+
+
+def _timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("folder", nargs="?", default=MEDIA_DIR)
+    ap.add_argument("--album", type=int, default=10, help="картинок в одной пачке (как в альбоме)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = None
+    paths = _collect(args.folder)
+    if not paths:
+        tmp = tempfile.TemporaryDirectory()
+        paths = _synthetic(tmp.name)
+        print(f"[BENCH] В {args.folder} нет картинок, сгенерировано {len(paths)} JPEG 1280×960")
+
+    albums = [paths[i:i + args.album] for i in range(0, len(paths), args.album)]
+    old_time, old = _timed(lambda: [legacy_phash(p) for p in paths], args.repeat)
+    new_time, new = _timed(lambda: [h for album in albums for h in hashing.image_hashes(album)], args.repeat)
+
+    n = len(paths)
+    print(f"[BENCH] Картинок: {n}, пачка: {args.album}, лучший из {args.repeat} прогонов")
+    print(f"  imagehash.phash (полное декодирование): {old_time * 1000:8.1f} мс, {n / old_time:7.1f} шт/с")
+    print(f"  hashing.image_hashes (pHash + dHash):   {new_time * 1000:8.1f} мс, {n / new_time:7.1f} шт/с")
+    print(f"  ускорение: ×{old_time / new_time:.1f}")
+
+    dists = [
+        imagehash.hex_to_hash(o) - imagehash.hex_to_hash(h[0])
+        for o, h in zip(old, new) if o and h
+    ]
+    if dists:
+        print(f"  расхождение pHash со старым: среднее {sum(dists) / len(dists):.2f} бит, "
+              f"максимум {max(dists)} бит")
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_publish.py
+"""Пропускная способность публикации против fake_bot_api.py — без сети и без Telegram.
+
+    python bench_publish.py [--posts 30] [--workers 2] [--media 0] [--via-owner]
+                            [--latency 80] [--jitter 30] [--group-per-minute 20] [--local]
+
+Поднимает FakeBotAPI на свободном порту, направляет на него бота
+(BOT_API_URL), создаёт посты во временной базе и публикует их через
+bot.publish_post в --workers потоков (как пул модерации). С --via-owner
+пост сначала уходит владельцу (send_post_for_approval), а публикуется
+копированием. С --local сервер и бот работают как с локальным Bot API
+(BOT_API_LOCAL): медиа передаются путями file://, а не загрузкой. В конце — посты/мин, p50/p95 времени публикации, сколько раз
+сервер ответил 429 и сколько повторов сделал бот.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from fake_bot_api import FakeBotAPI
+
+
+def _make_images(folder, post_idx, count):
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"bench_{post_idx}_{i}.jpg")
+        Image.new("RGB", (640, 480), (post_idx * 37 % 256, i * 50 % 256, 128)).save(path, quality=80)
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--posts", type=int, default=30)
+    ap.add_argument("--workers", type=int, default=config.MODERATION_WORKERS)
+    ap.add_argument("--media", type=int, default=0, help="фото в каждом посте (0 — только текст)")
+    ap.add_argument("--via-owner", action="store_true", help="сначала отправлять владельцу, потом копировать")
+    ap.add_argument("--latency", type=float, default=80, help="задержка ответа сервера, мс")
+    ap.add_argument("--jitter", type=float, default=30)
+    ap.add_argument("--chat-rate", type=float, default=1.0)
+    ap.add_argument("--group-per-minute", type=float, default=20)
+    ap.add_argument("--global-rate", type=float, default=30)
+    ap.add_argument("--local", action="store_true", help="медиа путями file:// вместо загрузки")
+    args = ap.parse_args()
+
+    fake = FakeBotAPI(port=0, latency_ms=args.latency, jitter_ms=args.jitter, chat_rate=args.chat_rate,
+                      group_per_minute=args.group_per_minute, global_rate=args.global_rate,
+                      local=args.local).start()
+    # до импорта bot: он читает BOT_API_URL и BOT_API_LOCAL при загрузке
+    config.BOT_API_URL = fake.api_url
+    config.BOT_API_LOCAL = args.local
+    os.environ["NO_PROXY"] = "localhost,127.0.0.1,::1"
+
+    tmp = tempfile.TemporaryDirectory()
+    import database
+    database.DB_FILE = os.path.join(tmp.name, "bench.db")
+    database.init_db()
+    import bot
+
+    post_ids = []
+    for i in range(args.posts):
+        media = _make_images(tmp.name, i, args.media) if args.media else []
+        text = f"Бенчмарк публикации #{i}\nСкидка {i % 90 + 5}% по ссылке https://example.com/{i}"
+        post_ids.append(database.save_post("bench", i, text, media, False, raw_text=text, entities=[],
+                                           status="queued", image_hashes=[]))
+    if args.via_owner:
+        for pid in post_ids:
+            bot.send_post_for_approval(pid, media_paths=database.get_media_paths(pid))
+
+    took = {}
+
+    def publish(pid):
+        started = time.perf_counter()
+        ok = bot.publish_post(pid)
+        took[pid] = time.perf_counter() - started
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(publish, post_ids))
+    wall = time.perf_counter() - started
+
+    durations = sorted(took.values())
+    p = lambda q: durations[min(len(durations) - 1, int(len(durations) * q))]
+    stats = fake.stats()
+    print(f"[BENCH] Постов: {args.posts}, фото в посте: {args.media}, потоков: {args.workers}, "
+          f"задержка {args.latency:.0f}±{args.jitter:.0f} мс, канал {args.group_per_minute:.0f}/мин, "
+          f"медиа {'путями file://' if args.local else 'загрузкой'}")
+    print(f"  опубликовано: {sum(results)}/{len(results)} за {wall:.1f} с "
+          f"({60 * sum(results) / wall:.1f} постов/мин)")
+    print(f"  время публикации поста: p50 {p(0.5) * 1000:.0f} мс, p95 {p(0.95) * 1000:.0f} мс, "
+          f"макс. {durations[-1] * 1000:.0f} мс")
+    print(f"  ответов 429: {sum(stats['flood_429'].values())} {stats['flood_429']}")
+    print(f"  повторов после 429: {bot.flood_stats['retries']}, ждали {bot.flood_stats['waited']:.0f} с, "
+          f"сдались: {bot.flood_stats['gave_up']}")
+    print(f"  запросы: {stats['requests']}")
+    fake.stop()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,99 @@
 # bot.py
 import os
+import re
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from urllib.parse import urlsplit
+import requests
 from telebot import TeleBot, types
 from telebot import apihelper
 from config import (
-    bot_token, owner_id, target_channel, SEND_LOGS, AUTO_MODE,
-    TELEGRAM_PROXY_URL
+    bot_token, owner_id, target_channel, SEND_LOGS,
+    TELEGRAM_PROXY_URL, BOT_API_URL, BOT_API_LOCAL, BOT_API_RETRY_429, BOT_API_MAX_RETRY_AFTER, PENDING_PAGE_SIZE, PUBLISH_QUEUE_MAX, PROFILE_MAX_SECONDS,
+    BOT_HANDLER_THREADS, MODERATION_WORKERS, SEARCH_PAGE_SIZE, MEDIA_DIR, RETENTION_DAYS,
+    FRESHNESS_P95_LIMIT_SECONDS, FRESHNESS_WINDOW_MINUTES, FRESHNESS_MIN_POSTS,
+    FRESHNESS_ALERT_COOLDOWN_MINUTES
 )
 from database import (
     get_post, update_status, set_owner_message_ids, get_owner_message_ids,
-    get_status_counts, get_auto_mode, set_auto_mode, list_recent_reviewed_posts
+    get_status_counts, list_recent_reviewed_posts,
+    list_pending_page, bulk_update_status, get_owner_message_ids_bulk,
+    enqueue_publication, get_publish_queue_size, PRIORITY_HIGH,
+    get_rollup_counts, get_media_paths, set_media_file_ids, get_freshness_stats,
+    search_posts
 )
+import entities
+import settings
+from loop_watchdog import get_watchdog_stats
+from ingest import get_ingest_stats
+from channels import get_channel_stats
+import profiler
 
-apihelper.proxy = {
-    "http": TELEGRAM_PROXY_URL,
-    "https": TELEGRAM_PROXY_URL
-}
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+if BOT_API_URL:
+    apihelper.API_URL = BOT_API_URL
+if not BOT_API_URL or urlsplit(BOT_API_URL).hostname not in _LOCAL_HOSTS:
+    apihelper.proxy = {
+        "http": TELEGRAM_PROXY_URL,
+        "https": TELEGRAM_PROXY_URL
+    }
+
+_http = threading.local()
+_flood_lock = threading.Lock()
+flood_stats = {"retries": 0, "waited": 0.0, "gave_up": 0}
+
+
+def _rewind_files(files):
+    for value in (files or {}).values():
+        f = value[1] if isinstance(value, tuple) and len(value) > 1 else value
+        if hasattr(f, "seek"):
+            f.seek(0)
+
+
+def _send_request(method, url, **kwargs):
+    """Запрос к Bot API для telebot (apihelper.CUSTOM_REQUEST_SENDER).
+
+    На 429 Too Many Requests ждёт parameters.retry_after и повторяет запрос
+    (до BOT_API_RETRY_429 раз), поэтому публикация пачкой не падает в
+    fallback и не теряет посты из-за флуд-лимита. Сессия своя у каждого потока.
+    """
+    session = getattr(_http, "session", None)
+    if session is None:
+        session = _http.session = requests.Session()
+    attempt = 0
+    while True:
+        result = session.request(method, url, **kwargs)
+        if result.status_code != 429:
+            return result
+        try:
+            retry_after = int(result.json()["parameters"]["retry_after"])
+        except Exception:
+            retry_after = 1
+        if attempt >= BOT_API_RETRY_429 or retry_after > BOT_API_MAX_RETRY_AFTER:
+            with _flood_lock:
+                flood_stats["gave_up"] += 1
+            return result
+        attempt += 1
+        with _flood_lock:
+            flood_stats["retries"] += 1
+            flood_stats["waited"] += retry_after
+        print(f"[BOT API] 429 на {url.rsplit('/', 1)[-1]}, повтор через {retry_after} с")
+        time.sleep(retry_after)
+        _rewind_files(kwargs.get("files"))
 
-bot = TeleBot(bot_token, parse_mode='HTML')
+
+apihelper.CUSTOM_REQUEST_SENDER = _send_request
+
+# локальный Bot API читает медиа с диска сам
+_local_files = bool(BOT_API_URL and BOT_API_LOCAL)
+# 400 из-за пути к файлу (а не подписи, сущностей или чата) — повод загрузить файлы
+_FILE_ERROR_RE = re.compile(r"file|path|url content", re.IGNORECASE)
+
+bot = TeleBot(bot_token, parse_mode='HTML', num_threads=BOT_HANDLER_THREADS)
 
 
 def _make_controls(post_id: int):
@@ -29,17 +105,158 @@ def _make_controls(post_id: int):
     return markup
 
 
-def _format_stats_text():
+_DUP_REASONS = ("dup_image", "dup_photo_id", "dup_product", "dup_text")
+
+
+def _parse_period(arg: str):
+    """'24h' / '7d' / '90m' / 'all' -> секунды (None — за всё время)."""
+    arg = (arg or "24h").strip().lower()
+    if arg == "all":
+        return None
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if arg[-1:] in units and arg[:-1].isdigit():
+        return int(arg[:-1]) * units[arg[-1]]
+    if arg.isdigit():
+        return int(arg) * 3600
+    raise ValueError(arg)
+
+
+def _format_channel_stats(period_seconds, period_label):
+    since = int(time.time()) - period_seconds if period_seconds else None
+    per_channel = {}
+    skip_reasons = {}
+    for r in get_rollup_counts(since):
+        ch = per_channel.setdefault(r["channel"] or "?", {"seen": 0, "published": 0, "dup": 0})
+        ch["seen"] += r["cnt"]
+        if r["status"] == "published":
+            ch["published"] += r["cnt"]
+        if r["status"] == "skipped":
+            skip_reasons[r["reason"]] = skip_reasons.get(r["reason"], 0) + r["cnt"]
+            if r["reason"] in _DUP_REASONS:
+                ch["dup"] += r["cnt"]
+
+    lines = [f"\n\n📈 <b>По каналам за {escape(period_label)}</b> (всего | ✅ опубл. | ♻️ дубли)"]
+    if not per_channel:
+        lines.append("нет данных")
+    for name, ch in sorted(per_channel.items(), key=lambda kv: -kv[1]["seen"]):
+        seen = ch["seen"] or 1
+        lines.append(
+            f"{escape(name)}: {ch['seen']} | "
+            f"{100 * ch['published'] // seen}% | {100 * ch['dup'] // seen}%"
+        )
+    if skip_reasons:
+        reasons = ", ".join(f"{k}: {v}" for k, v in sorted(skip_reasons.items(), key=lambda kv: -kv[1]))
+        lines.append(f"Пропущено: {escape(reasons)}")
+    return "\n".join(lines)
+
+
+def _format_stats_text(period: str = None):
     counts = get_status_counts()
-    mode_now = "Авто" if get_auto_mode(default=AUTO_MODE) else "Ручной"
-    return (
+    mode_now = "Авто" if settings.current().auto_mode else "Ручной"
+    text = (
         "📊 <b>Статистика</b>\n"
         f"Режим: <b>{mode_now}</b>\n"
         f"Pending: <b>{counts.get('pending', 0)}</b>\n"
+        f"Queued: <b>{counts.get('queued', 0)}</b> (в очереди публикаций: {get_publish_queue_size()})\n"
         f"Published: <b>{counts.get('published', 0)}</b>\n"
         f"Rejected: <b>{counts.get('rejected', 0)}</b>\n"
         f"Error: <b>{counts.get('error', 0)}</b>"
     )
+    wd = get_watchdog_stats()
+    if wd:
+        text += f"\nLoop: макс. задержка <b>{wd['max_lag_ms']}</b> мс, зависаний: <b>{wd['stall_count']}</b>"
+        if wd["recent"]:
+            ts, ms, culprit = wd["recent"][-1]
+            text += f"\nПоследнее: {ms} мс — <code>{escape(culprit)}</code>"
+    ing = get_ingest_stats()
+    if ing:
+        text += (
+            f"\nВходящие: в очереди <b>{ing['depth']}</b> (макс. {ing['max_depth']}), "
+            f"ожидание ср. {ing['wait_avg_ms']} / p95 {ing['wait_p95_ms']} мс, "
+            f"сброшено: <b>{ing['dropped']}</b>"
+        )
+    sources = get_channel_stats()
+    if sources:
+        silent = [c["label"] for c in sources if not c["received"]]
+        text += (
+            f"\nКаналы: подписка на <b>{len(sources)}</b>, "
+            f"сообщений с запуска: <b>{sum(c['received'] for c in sources)}</b>"
+        )
+        if silent:
+            text += f"\nМолчат с запуска: {escape(', '.join(sorted(silent)))}"
+    label = period or "24h"
+    return text + _format_channel_stats(_parse_period(label), label)
+
+
+_STAGE_LABELS = {
+    "received": "доставка и вход в обработку",
+    "media": "проверки и скачивание медиа",
+    "dedup": "проверки дублей",
+    "saved": "сохранение",
+    "sent": "до отправки владельцу / в очередь",
+    "published": "модерация и очередь публикаций",
+}
+
+
+def _fmt_duration(seconds) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 60:
+        return f"{seconds:.0f} с" if seconds >= 10 else f"{seconds:.1f} с"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def _format_freshness_text(period_seconds, period_label):
+    stats = get_freshness_stats(int(time.time()) - period_seconds if period_seconds else None)
+    overall = stats["overall"]
+    lines = [f"⏱ <b>Свежесть за {escape(period_label)}</b> (от поста в источнике до публикации)"]
+    if not overall["count"]:
+        lines.append("нет опубликованных постов с замерами")
+        return "\n".join(lines)
+    lines.append(
+        f"Постов: <b>{overall['count']}</b>, p50 <b>{_fmt_duration(overall['p50'])}</b>, "
+        f"p95 <b>{_fmt_duration(overall['p95'])}</b>, макс. {_fmt_duration(overall['max'])}"
+    )
+    lines.append("\n<b>По каналам</b> (постов | p50 | p95)")
+    for name, ch in sorted(stats["channels"].items(), key=lambda kv: -(kv[1]["p95"] or 0)):
+        lines.append(f"{escape(name)}: {ch['count']} | {_fmt_duration(ch['p50'])} | {_fmt_duration(ch['p95'])}")
+    lines.append("\n<b>Этапы</b> (p50 | p95)")
+    for stage, st in stats["stages"].items():
+        lines.append(f"{_STAGE_LABELS.get(stage, stage)}: {_fmt_duration(st['p50'])} | {_fmt_duration(st['p95'])}")
+    return "\n".join(lines)
+
+
+_freshness_lock = threading.Lock()
+_freshness_alert_at = 0
+
+
+def _check_freshness_alert():
+    """После публикации: алерт, если p95 свежести за окно выше FRESHNESS_P95_LIMIT_SECONDS."""
+    global _freshness_alert_at
+    if not FRESHNESS_P95_LIMIT_SECONDS:
+        return
+    now = time.time()
+    with _freshness_lock:
+        if now - _freshness_alert_at < FRESHNESS_ALERT_COOLDOWN_MINUTES * 60:
+            return
+        stats = get_freshness_stats(int(now) - FRESHNESS_WINDOW_MINUTES * 60)
+        overall = stats["overall"]
+        if overall["count"] < FRESHNESS_MIN_POSTS or overall["p95"] <= FRESHNESS_P95_LIMIT_SECONDS:
+            return
+        _freshness_alert_at = now
+
+    slow = sorted(stats["channels"].items(), key=lambda kv: -(kv[1]["p95"] or 0))[:3]
+    text = (
+        f"🐢 Посты запаздывают: p95 свежести за {FRESHNESS_WINDOW_MINUTES} мин — "
+        f"<b>{_fmt_duration(overall['p95'])}</b> (порог {_fmt_duration(FRESHNESS_P95_LIMIT_SECONDS)}, "
+        f"постов: {overall['count']})\n"
+        + "\n".join(f"{escape(name)}: p95 {_fmt_duration(ch['p95'])}" for name, ch in slow)
+        + "\nПодробнее: /freshness"
+    )
+    print(f"[FRESHNESS] p95 {overall['p95']:.0f} с > {FRESHNESS_P95_LIMIT_SECONDS} с")
+    send_alert(text)
 
 
 def _short20(text: str) -> str:
@@ -58,8 +275,17 @@ def start_handler(message):
         "Команды:\n"
         "/mode auto — автопубликация\n"
         "/mode manual — модерация вручную\n"
-        "/stats — статистика\n"
-        "/last50 — последние 50 постов"
+        "/stats [24h|7d|all] — статистика и разбивка по каналам\n"
+        "/freshness [24h|7d] — задержка от поста в источнике до публикации\n"
+        "/last50 — последние 50 постов\n"
+        "/search &lt;слова&gt; — поиск по истории постов\n"
+        "/pending — очередь модерации (массовое одобрение/отклонение)\n"
+        "/profile [сек] — сэмплирующий профиль всех потоков\n"
+        "/memsnap — снимок памяти (tracemalloc), /memsnap stop — выключить\n"
+        "/list — списки правил (каналы, blacklist, стоп-слова, алерты)\n"
+        "/list stop add &lt;фраза&gt; | /list stop del &lt;фраза&gt;\n"
+        "/set window &lt;часы&gt; | /set threshold &lt;число&gt;\n"
+        "/reload — перечитать настройки"
     )
 
 
@@ -67,7 +293,101 @@ def start_handler(message):
 def stats_handler(message):
     if message.from_user.id != owner_id:
         return
-    bot.send_message(message.chat.id, _format_stats_text())
+    parts = (message.text or "").split(maxsplit=1)
+    try:
+        text = _format_stats_text(parts[1] if len(parts) > 1 else None)
+    except ValueError:
+        bot.send_message(message.chat.id, "Используй: /stats [24h|7d|90m|all]")
+        return
+    _send_long_message(message.chat.id, text)
+
+
+@bot.message_handler(commands=['freshness'])
+def freshness_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    parts = (message.text or "").split(maxsplit=1)
+    label = parts[1].strip() if len(parts) > 1 else "24h"
+    try:
+        text = _format_freshness_text(_parse_period(label), label)
+    except ValueError:
+        bot.send_message(message.chat.id, "Используй: /freshness [24h|7d|90m|all]")
+        return
+    _send_long_message(message.chat.id, text)
+
+
+def _pre_chunks(text, limit=4096):
+    """Текст -> сообщения <pre>…</pre> не длиннее limit.
+
+    Режем исходный текст по строкам и только потом экранируем и оборачиваем
+    каждый кусок: разрезанный после обёртки <pre> Telegram не примет.
+    """
+    room = limit - len("<pre></pre>")
+    chunks, cur = [], ""
+    for line in text.splitlines(keepends=True):
+        # слишком длинная строка режется посимвольно с запасом на экранирование
+        while len(escape(line)) > room:
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            cut = room
+            while len(escape(line[:cut])) > room:
+                cut = min(cut - 1, cut * room // len(escape(line[:cut])))
+            chunks.append(line[:cut])
+            line = line[cut:]
+        if cur and len(escape(cur + line)) > room:
+            chunks.append(cur)
+            cur = ""
+        cur += line
+    if cur or not chunks:
+        chunks.append(cur)
+    return [f"<pre>{escape(c)}</pre>" for c in chunks]
+
+
+def _send_report_file(chat_id, path, summary):
+    if path:
+        with open(path, "rb") as f:
+            bot.send_document(chat_id, f, caption=os.path.basename(path))
+    for part in _pre_chunks(summary):
+        bot.send_message(chat_id, part)
+
+
+def _profile_job(chat_id, seconds):
+    try:
+        path, summary = profiler.run_profile(seconds)
+        _send_report_file(chat_id, path, summary)
+    except Exception as e:
+        bot.send_message(chat_id, f"❌ Ошибка профилирования: {escape(str(e))}")
+
+
+@bot.message_handler(commands=['profile'])
+def profile_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    parts = (message.text or "").split()
+    try:
+        seconds = int(parts[1]) if len(parts) > 1 else 10
+    except ValueError:
+        bot.send_message(message.chat.id, "Используй: /profile [секунды]")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    bot.send_message(message.chat.id, f"⏱ Профилирую {seconds} с…")
+    # отдельный поток: поток бота сам попадает в профиль и не блокируется
+    threading.Thread(target=_profile_job, args=(message.chat.id, seconds),
+                     name="profiler", daemon=True).start()
+
+
+@bot.message_handler(commands=['memsnap'])
+def memsnap_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    parts = (message.text or "").split()
+    if len(parts) > 1 and parts[1].lower() == "stop":
+        profiler.stop_memory_tracing()
+        bot.send_message(message.chat.id, "tracemalloc остановлен")
+        return
+    path, summary = profiler.memory_snapshot()
+    _send_report_file(message.chat.id, path, summary)
 
 
 @bot.message_handler(commands=['mode'])
@@ -77,7 +397,7 @@ def mode_handler(message):
 
     parts = (message.text or "").split(maxsplit=1)
     if len(parts) < 2:
-        mode_now = "auto" if get_auto_mode(default=AUTO_MODE) else "manual"
+        mode_now = "auto" if settings.current().auto_mode else "manual"
         bot.send_message(
             message.chat.id,
             f"Текущий режим: <b>{mode_now}</b>\n"
@@ -87,11 +407,11 @@ def mode_handler(message):
 
     mode = parts[1].strip().lower()
     if mode in ("auto", "on", "1"):
-        set_auto_mode(True)
+        settings.set_value("auto_mode", True)
         bot.send_message(message.chat.id, "✅ Режим обновлён: <b>автопубликация</b>")
         return
     if mode in ("manual", "off", "0"):
-        set_auto_mode(False)
+        settings.set_value("auto_mode", False)
         bot.send_message(message.chat.id, "✅ Режим обновлён: <b>ручная модерация</b>")
         return
 
@@ -120,6 +440,88 @@ def last50_handler(message):
     _send_long_message(message.chat.id, "\n".join(lines))
 
 
+_LIST_NAMES = {
+    "channels": "channels_to_parse",
+    "blacklist": "blacklist_words",
+    "stop": "stop_words",
+    "alert": "alert_words",
+}
+
+_SCALAR_NAMES = {
+    "window": "duplicate_window_hours",
+    "threshold": "image_duplicate_threshold",
+}
+
+
+@bot.message_handler(commands=['list'])
+def list_handler(message):
+    if message.from_user.id != owner_id:
+        return
+
+    parts = (message.text or "").split(maxsplit=3)
+    rules = settings.current()
+    if len(parts) < 2 or parts[1].lower() not in _LIST_NAMES:
+        lines = ["📋 <b>Списки правил</b>"]
+        for name, key in _LIST_NAMES.items():
+            lines.append(f"{name}: {len(rules.values[key])}")
+        lines.append("Используй: /list &lt;имя&gt; [add|del &lt;значение&gt;]")
+        bot.send_message(message.chat.id, "\n".join(lines))
+        return
+
+    key = _LIST_NAMES[parts[1].lower()]
+    if len(parts) == 2:
+        items = rules.values[key]
+        body = "\n".join(f"• {escape(i)}" for i in items) or "(пусто)"
+        _send_long_message(message.chat.id, f"📋 <b>{parts[1].lower()}</b>\n{body}")
+        return
+
+    action = parts[2].lower()
+    value = parts[3].strip() if len(parts) > 3 else ""
+    if action not in ("add", "del") or not value:
+        bot.send_message(message.chat.id, "Используй: /list &lt;имя&gt; add|del &lt;значение&gt;")
+        return
+
+    if action == "add":
+        changed = settings.add_to_list(key, value)
+        reply = "✅ Добавлено" if changed else "Уже в списке"
+    else:
+        changed = settings.remove_from_list(key, value)
+        reply = "✅ Удалено" if changed else "Нет в списке"
+    bot.send_message(message.chat.id, f"{reply}: {escape(value)}")
+
+
+@bot.message_handler(commands=['set'])
+def set_handler(message):
+    if message.from_user.id != owner_id:
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) != 3 or parts[1].lower() not in _SCALAR_NAMES:
+        rules = settings.current()
+        bot.send_message(
+            message.chat.id,
+            f"window = <b>{rules.duplicate_window_hours}</b> ч\n"
+            f"threshold = <b>{rules.image_duplicate_threshold}</b>\n"
+            "Используй: /set window &lt;часы&gt; или /set threshold &lt;число&gt;"
+        )
+        return
+
+    try:
+        settings.set_value(_SCALAR_NAMES[parts[1].lower()], parts[2])
+    except (TypeError, ValueError):
+        bot.send_message(message.chat.id, "Значение должно быть неотрицательным числом")
+        return
+    bot.send_message(message.chat.id, f"✅ {parts[1].lower()} = <b>{escape(parts[2])}</b>")
+
+
+@bot.message_handler(commands=['reload'])
+def reload_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    settings.reload(force=True)
+    bot.send_message(message.chat.id, "🔄 Настройки перечитаны")
+
+
 def _split_text(text, limit=4096):
     """Split by safe boundary (space) to avoid breaking tags in the middle if possible."""
     if len(text) <= limit:
@@ -150,60 +552,477 @@ def _send_long_message(chat_id, text, reply_markup=None):
     return ids
 
 
-def send_post_for_approval(post_id: int, text: str, media_paths=None):
-    """Send post to owner for moderation and save message ids."""
+def _open_media(path, upload=True):
+    """(открытый файл или None, InputMedia) для альбома.
+
+    upload=False — без загрузки: локальный Bot API сам читает файл по file://.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    media_cls = types.InputMediaVideo if ext in ('.mp4', '.mov', '.mkv', '.webm') else types.InputMediaPhoto
+    if not upload:
+        return None, media_cls("file://" + os.path.abspath(path))
+    f = open(path, 'rb')
+    return f, media_cls(f)
+
+
+def _message_entities(ents):
+    """Словари Bot API -> MessageEntity для telebot.
+
+    text_mention уходит как text_link на tg://user?id=… (как в entities.to_html):
+    telebot ждёт в user объект User, а не словарь, да и упомянуть пользователя,
+    которого бот не видел, Telegram всё равно не даст.
+    """
+    result = []
+    for e in ents or []:
+        if e.get("type") == "text_mention":
+            user_id = (e.get("user") or {}).get("id")
+            e = {"type": "text_link", "offset": e["offset"], "length": e["length"],
+                 "url": f"tg://user?id={user_id}"}
+        result.append(types.MessageEntity(**e))
+    return result or None
+
+
+def _send_media_group(chat_id, media_paths, caption=None, caption_entities=None):
+    """Альбом из локальных файлов, подпись — у первого элемента.
+
+    caption_entities=None — подпись в HTML (parse_mode бота), иначе — текст как есть
+    с готовыми сущностями. С BOT_API_LOCAL файлы передаются путями; если сервер
+    отверг именно путь к файлу, этот альбом уходит загрузкой. Остальные ошибки
+    (длинная подпись, чат не найден) поднимаются как есть.
+    """
+    if _local_files:
+        try:
+            return _build_and_send_album(chat_id, media_paths, caption, caption_entities, upload=False)
+        except apihelper.ApiTelegramException as e:
+            if e.error_code != 400 or not _FILE_ERROR_RE.search(e.description or ""):
+                raise
+            print(f"[BOT API] ⚠️ Сервер не принял file:// ({e.description}) — альбом в {chat_id} "
+                  f"уходит загрузкой; проверьте, что telegram-bot-api запущен с --local и видит {MEDIA_DIR}/")
+    return _build_and_send_album(chat_id, media_paths, caption, caption_entities, upload=True)
+
+
+def _build_and_send_album(chat_id, media_paths, caption, caption_entities, upload):
+    media_group = []
+    files = []
     try:
-        media_paths = [p for p in (media_paths or []) if p and os.path.exists(p)]
-        sent_ids = []
+        for i, path in enumerate(media_paths):
+            f, media = _open_media(path, upload)
+            if f is not None:
+                files.append(f)
+            if i == 0 and caption:
+                media.caption = caption
+                if caption_entities is not None:
+                    media.parse_mode = ""
+                    media.caption_entities = _message_entities(caption_entities)
+            media_group.append(media)
+        return bot.send_media_group(chat_id, media_group)
+    finally:
+        for f in files:
+            try:
+                f.close()
+            except:
+                pass
+
+
+def _post_body(post, html_text=None):
+    """(текст, сущности) поста; сущности None — старый пост, у которого есть только HTML."""
+    if post and post.get("raw_text") is not None:
+        try:
+            return post["raw_text"], json.loads(post.get("entities") or "[]")
+        except Exception:
+            pass
+    return (html_text if html_text is not None else (post or {}).get("text") or ""), None
+
 
+def _send_post_body(chat_id, text, ents, media_paths=None, reply_markup=None):
+    """Отправляет текст поста (с альбомом, если есть медиа). Возвращает отправленные сообщения.
+
+    Текст режется по UTF-16: первый кусок идёт подписью (до 1024), остальные —
+    сообщениями до 4096; сущности переносятся в свой кусок без HTML.
+    """
+    sent = []
+    if ents is None:
+        # старый пост: HTML, как раньше
         if media_paths:
-            media_group = []
-            files = []
-            try:
-                for i, path in enumerate(media_paths):
-                    ext = os.path.splitext(path)[1].lower()
-                    f = open(path, 'rb')
-                    files.append(f)
-                    if ext in ('.mp4', '.mov', '.mkv', '.webm'):
-                        media = types.InputMediaVideo(f)
-                    else:
-                        media = types.InputMediaPhoto(f)
-                    if i == 0:
-                        caption = text[:1024] + ("…" if len(text) > 1024 else "")
-                        media.caption = caption
-                    media_group.append(media)
-
-                sent = bot.send_media_group(owner_id, media_group)
-                sent_ids.extend([m.message_id for m in sent])
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
+            caption = text[:1024] + ("…" if len(text) > 1024 else "")
+            sent.extend(_send_media_group(chat_id, media_paths, caption))
+            text = text[1024:]
+        for i, part in enumerate(_split_text(text) if text else []):
+            sent.append(bot.send_message(chat_id, part,
+                                         reply_markup=reply_markup if i == 0 and not media_paths else None))
+        return sent
+
+    chunks = entities.split(text, ents, first_limit=entities.CAPTION_LIMIT if media_paths else None)
+    if media_paths:
+        caption, caption_ents = chunks.pop(0) if chunks else (None, None)
+        sent.extend(_send_media_group(chat_id, media_paths, caption, caption_ents or []))
+    for i, (part, part_ents) in enumerate(chunks):
+        sent.append(bot.send_message(
+            chat_id, part, parse_mode="", entities=_message_entities(part_ents),
+            reply_markup=reply_markup if i == 0 and not media_paths else None
+        ))
+    return sent
+
+
+def _file_id(message):
+    if getattr(message, "photo", None):
+        return message.photo[-1].file_id
+    if getattr(message, "video", None):
+        return message.video.file_id
+    return None
 
-            if len(text) > 1024:
-                extra = text[1024:]
-                sent_ids.extend(_send_long_message(owner_id, extra))
 
+def send_post_for_approval(post_id: int, text: str = None, media_paths=None):
+    """Send post to owner for moderation and save message ids."""
+    try:
+        media_paths = [p for p in (media_paths or []) if p and os.path.exists(p)]
+        post = get_post(post_id)
+        body, ents = _post_body(post, text)
+        body_ids, control_ids = [], []
+
+        if media_paths:
+            sent = _send_post_body(owner_id, body, ents, media_paths)
+            body_ids.extend(m.message_id for m in sent)
+            set_media_file_ids(post_id, [_file_id(m) for m in sent[:len(media_paths)]])
             info = bot.send_message(
                 owner_id,
-                f"🆔 <b>Post ID:</b> {post_id}\nИсточник: {get_post(post_id)['channel']}",
+                f"🆔 <b>Post ID:</b> {post_id}\nИсточник: {post['channel']}",
                 reply_markup=_make_controls(post_id)
             )
-            sent_ids.append(info.message_id)
+            control_ids.append(info.message_id)
         else:
-            msg_ids = _send_long_message(owner_id, f"<b>Post ID:</b> {post_id}\n\n{text}",
-                                         reply_markup=_make_controls(post_id))
-            sent_ids.extend(msg_ids)
+            # текст с заголовком «Post ID» и кнопками — служебные сообщения, в канал не копируются
+            if ents is None:
+                sent = _send_post_body(owner_id, f"<b>Post ID:</b> {post_id}\n\n{body}", None,
+                                       reply_markup=_make_controls(post_id))
+            else:
+                label = "Post ID:"
+                header = f"{label} {post_id}\n\n"
+                ents = [{"type": "bold", "offset": 0, "length": entities.utf16_len(label)}] + \
+                    entities.shift(ents, entities.utf16_len(header))
+                sent = _send_post_body(owner_id, header + body, ents, reply_markup=_make_controls(post_id))
+            control_ids.extend(m.message_id for m in sent)
 
-        set_owner_message_ids(post_id, sent_ids)
-        return sent_ids
+        set_owner_message_ids(post_id, body_ids, control_ids)
+        return body_ids + control_ids
 
     except Exception as e:
         bot.send_message(owner_id, f"❌ Ошибка при отправке поста: {e}")
 
 
+# ===============================================================
+# ============= /pending: ПОСТРАНИЧНАЯ МОДЕРАЦИЯ ==================
+# ===============================================================
+
+# (chat_id, message_id) -> {"start": (created_at, id), "ids": [...], "selected": set()}
+_pending_views = {}
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _preview(text: str, limit: int = 60) -> str:
+    clean = " ".join(_TAG_RE.sub("", text or "").split())
+    if len(clean) > limit:
+        clean = clean[:limit] + "…"
+    return escape(clean)
+
+
+def _render_pending(chat_id, message_id=None, after=None, before=None, inclusive=False, selected=None):
+    rows, has_prev, has_next = list_pending_page(
+        after=after, before=before, limit=PENDING_PAGE_SIZE, inclusive=inclusive
+    )
+    if not rows and (after is not None or before is not None):
+        # страница опустела после массового действия — показываем начало очереди
+        rows, has_prev, has_next = list_pending_page(limit=PENDING_PAGE_SIZE)
+
+    ids = [r["id"] for r in rows]
+    selected = {i for i in (selected or set()) if i in ids}
+
+    if not rows:
+        text = "🟡 <b>Очередь модерации пуста</b>"
+        markup = None
+    else:
+        lines = ["🟡 <b>Ожидают модерации</b>"]
+        for r in rows:
+            mark = "☑" if r["id"] in selected else "☐"
+            lines.append(f"{mark} #{r['id']} | {escape(r.get('channel') or '')} | {_preview(r.get('text'))}")
+        text = "\n".join(lines)
+
+        markup = types.InlineKeyboardMarkup(row_width=5)
+        markup.add(*[
+            types.InlineKeyboardButton(
+                f"{'☑' if r['id'] in selected else '☐'} {r['id']}",
+                callback_data=f"pg:t:{r['id']}"
+            )
+            for r in rows
+        ])
+        markup.row(
+            types.InlineKeyboardButton("✅ Страницу", callback_data="pg:a:page"),
+            types.InlineKeyboardButton("❌ Страницу", callback_data="pg:x:page"),
+        )
+        if selected:
+            markup.row(
+                types.InlineKeyboardButton(f"✅ Выбранные ({len(selected)})", callback_data="pg:a:sel"),
+                types.InlineKeyboardButton(f"❌ Выбранные ({len(selected)})", callback_data="pg:x:sel"),
+            )
+        nav = []
+        if has_prev:
+            first = rows[0]
+            nav.append(types.InlineKeyboardButton("◀️", callback_data=f"pg:p:{first['created_at']}:{first['id']}"))
+        nav.append(types.InlineKeyboardButton("🔄", callback_data="pg:r"))
+        if has_next:
+            last = rows[-1]
+            nav.append(types.InlineKeyboardButton("▶️", callback_data=f"pg:n:{last['created_at']}:{last['id']}"))
+        markup.row(*nav)
+
+    if message_id is None:
+        msg = bot.send_message(chat_id, text, reply_markup=markup)
+        message_id = msg.message_id
+    else:
+        try:
+            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup)
+        except Exception as e:
+            # "message is not modified" — не ошибка
+            if "not modified" not in str(e):
+                raise
+
+    start = (rows[0]["created_at"], rows[0]["id"]) if rows else None
+    _pending_views[(chat_id, message_id)] = {"start": start, "ids": ids, "selected": selected}
+
+
+# посты, по которым уже идёт модерация: повторное нажатие кнопки ничего не делает
+_inflight = set()
+_inflight_lock = threading.Lock()
+_moderation_pool = ThreadPoolExecutor(max_workers=MODERATION_WORKERS, thread_name_prefix="moderation")
+
+
+def _claim_inflight(post_ids):
+    """Отмечает посты как обрабатываемые. Возвращает те, что ещё не были в работе."""
+    with _inflight_lock:
+        free = [pid for pid in post_ids if pid not in _inflight]
+        _inflight.update(free)
+    return free
+
+
+def _release_inflight(post_ids):
+    with _inflight_lock:
+        _inflight.difference_update(post_ids)
+
+
+def _delete_owner_messages(post_ids, role=None):
+    """Удаляет у владельца сообщения модерации пачками, а не по одному.
+
+    role='controls' — только служебные сообщения с кнопками: тело поста ещё нужно
+    publish_post для copy_message, он удалит его сам после публикации.
+    """
+    mids = []
+    for ids in get_owner_message_ids_bulk(post_ids, role).values():
+        mids.extend(ids or [])
+    for i in range(0, len(mids), 100):
+        chunk = mids[i:i + 100]
+        try:
+            bot.delete_messages(owner_id, chunk)
+        except Exception:
+            for mid in chunk:
+                try:
+                    bot.delete_message(owner_id, mid)
+                except Exception:
+                    pass
+
+
+def _bulk_moderate(post_ids, approve: bool):
+    if approve:
+        moved = bulk_update_status(post_ids, 'queued')
+    else:
+        moved = bulk_update_status(post_ids, 'rejected', reject_reason="Отклонен администратором")
+    if moved:
+        _delete_owner_messages(moved, role='controls' if approve else None)
+    if approve and moved:
+        dropped = enqueue_publication(moved, priority=PRIORITY_HIGH, max_queue=PUBLISH_QUEUE_MAX)
+        if dropped:
+            print(f"[SCHEDULER] Очередь переполнена, вытеснены: {dropped}")
+    return moved
+
+
+def _bulk_moderate_job(chat_id, message_id, view, post_ids, approve: bool):
+    try:
+        moved = _bulk_moderate(post_ids, approve)
+        if SEND_LOGS and moved and not approve:
+            bot.send_message(owner_id, f"🚫 Отклонено постов: {len(moved)}")
+        _render_pending(chat_id, message_id, after=view["start"], inclusive=True)
+    except Exception as e:
+        print(f"[MODERATION] Ошибка массовой модерации: {e}")
+    finally:
+        _release_inflight(post_ids)
+
+
+@bot.message_handler(commands=['pending'])
+def pending_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    _render_pending(message.chat.id)
+
+
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith("pg:"))
+def pending_callback(call):
+    try:
+        if call.from_user.id != owner_id:
+            return bot.answer_callback_query(call.id, "⛔ Нет доступа")
+
+        chat_id = call.message.chat.id
+        message_id = call.message.message_id
+        view = _pending_views.get((chat_id, message_id))
+        parts = call.data.split(":")
+        cmd = parts[1]
+
+        if cmd in ("n", "p"):
+            key = (int(parts[2]), int(parts[3]))
+            bot.answer_callback_query(call.id)
+            if cmd == "n":
+                _render_pending(chat_id, message_id, after=key)
+            else:
+                _render_pending(chat_id, message_id, before=key)
+            return
+
+        if view is None:
+            # бот перезапускался — состояние страницы потеряно, рисуем заново
+            bot.answer_callback_query(call.id, "Список обновлён")
+            return _render_pending(chat_id, message_id)
+
+        if cmd == "r":
+            bot.answer_callback_query(call.id)
+            return _render_pending(chat_id, message_id, after=view["start"], inclusive=True,
+                                   selected=view["selected"])
+
+        if cmd == "t":
+            post_id = int(parts[2])
+            selected = set(view["selected"])
+            selected.symmetric_difference_update({post_id})
+            bot.answer_callback_query(call.id)
+            return _render_pending(chat_id, message_id, after=view["start"], inclusive=True,
+                                   selected=selected)
+
+        if cmd in ("a", "x"):
+            ids = view["ids"] if parts[2] == "page" else sorted(view["selected"])
+            if not ids:
+                return bot.answer_callback_query(call.id, "Ничего не выбрано")
+            ids = _claim_inflight(ids)
+            if not ids:
+                return bot.answer_callback_query(call.id, "Уже обрабатывается…")
+            approve = cmd == "a"
+            try:
+                bot.answer_callback_query(call.id, f"{'Одобряю' if approve else 'Отклоняю'}: {len(ids)}")
+            finally:
+                _moderation_pool.submit(_bulk_moderate_job, chat_id, message_id, view, ids, approve)
+            return
+
+        bot.answer_callback_query(call.id, "Неизвестная команда")
+    except Exception as e:
+        try:
+            bot.answer_callback_query(call.id, f"Ошибка: {e}")
+        except:
+            pass
+
+
+# ===============================================================
+# ============= /search: ПОИСК ПО ИСТОРИИ ПОСТОВ ==================
+# ===============================================================
+
+# (chat_id, message_id) -> текст запроса: в callback_data он не помещается
+_search_views = {}
+_STATUS_MARKS = {
+    "published": "✅", "rejected": "❌", "error": "⚠️",
+    "pending": "🟡", "queued": "⏳", "ingested": "⏳", "media_ready": "⏳",
+}
+
+
+def _render_search(chat_id, query, offset=0, message_id=None):
+    started = time.perf_counter()
+    rows, total = search_posts(query, limit=SEARCH_PAGE_SIZE, offset=offset)
+    took_ms = (time.perf_counter() - started) * 1000
+
+    # архив в posts_fts не индексируется — говорим об этом прямо в ответе
+    archive_note = f"<i>Ищу только в базе: посты старше {RETENTION_DAYS} дн. ушли в архив и не находятся.</i>"
+    if not rows:
+        text = f"🔎 По запросу «{escape(query)}» ничего не найдено\n\n{archive_note}"
+        markup = None
+    else:
+        lines = [
+            f"🔎 <b>{escape(query)}</b>: {total} постов, {offset + 1}–{offset + len(rows)} "
+            f"({took_ms:.0f} мс)"
+        ]
+        for r in rows:
+            day = time.strftime("%d.%m.%y", time.localtime(r["published_at"] or r["created_at"] or 0))
+            lines.append(
+                f"{_STATUS_MARKS.get(r['status'], '•')} #{r['id']} | {r['status']} | "
+                f"{escape(r.get('channel') or '')} | {day}\n{_preview(r.get('text'), 120)}"
+            )
+        lines.append(archive_note)
+        text = "\n\n".join(lines)
+
+        nav = []
+        if offset > 0:
+            nav.append(types.InlineKeyboardButton(
+                "◀️", callback_data=f"sr:{max(0, offset - SEARCH_PAGE_SIZE)}"))
+        if offset + len(rows) < total:
+            nav.append(types.InlineKeyboardButton("▶️", callback_data=f"sr:{offset + SEARCH_PAGE_SIZE}"))
+        markup = None
+        if nav:
+            markup = types.InlineKeyboardMarkup()
+            markup.row(*nav)
+
+    if message_id is None:
+        message_id = bot.send_message(chat_id, text, reply_markup=markup).message_id
+    else:
+        bot.edit_message_text(text, chat_id, message_id, reply_markup=markup)
+    _search_views[(chat_id, message_id)] = query
+
+
+@bot.message_handler(commands=['search'])
+def search_handler(message):
+    if message.from_user.id != owner_id:
+        return
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        bot.send_message(message.chat.id, "Используй: /search &lt;слова&gt; — например, /search кофемашина delonghi")
+        return
+    _render_search(message.chat.id, parts[1].strip())
+
+
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith("sr:"))
+def search_callback(call):
+    try:
+        if call.from_user.id != owner_id:
+            return bot.answer_callback_query(call.id, "⛔ Нет доступа")
+        query = _search_views.get((call.message.chat.id, call.message.message_id))
+        if query is None:
+            # бот перезапускался — запрос не сохранился
+            return bot.answer_callback_query(call.id, "Запрос устарел, повтори /search")
+        bot.answer_callback_query(call.id)
+        _render_search(call.message.chat.id, query, int(call.data.split(":")[1]), call.message.message_id)
+    except Exception as e:
+        try:
+            bot.answer_callback_query(call.id, f"Ошибка: {e}")
+        except:
+            pass
+
+
+def _moderate_job(post_id: int, approve: bool):
+    """Фоновая часть модерации одного поста: публикация/отклонение и уборка."""
+    try:
+        # тот же путь, что и массовое одобрение: переход только из pending (второй раз
+        # не сработает), кнопки убираются сразу, а публикует планировщик из publish_queue —
+        # со слотами, лимитом в час и тихими часами
+        if not _bulk_moderate([post_id], approve):
+            print(f"[MODERATION] post {post_id} уже обработан")
+            return
+        if SEND_LOGS and not approve:
+            bot.send_message(owner_id, f"🚫 Post {post_id} отклонён.")
+    except Exception as e:
+        print(f"[MODERATION] Ошибка обработки post {post_id}: {e}")
+    finally:
+        _release_inflight([post_id])
+
+
 @bot.callback_query_handler(func=lambda call: True)
 def handle_callback(call):
     try:
@@ -213,25 +1032,22 @@ def handle_callback(call):
         post_id = int(sid)
         if call.from_user.id != owner_id:
             return bot.answer_callback_query(call.id, "⛔ Нет доступа")
+        if cmd not in ("approve", "reject"):
+            return bot.answer_callback_query(call.id, "Неизвестная команда")
 
-        # удаляем сообщения владельца (модерация)
-        owner_ids = get_owner_message_ids(post_id) or []
-        for mid in owner_ids:
-            try:
-                bot.delete_message(owner_id, mid)
-            except:
-                pass
+        if not _claim_inflight([post_id]):
+            return bot.answer_callback_query(call.id, "Уже обрабатывается…")
+        post = get_post(post_id)
+        if not post or post.get("status") != "pending":
+            _release_inflight([post_id])
+            return bot.answer_callback_query(call.id, "Пост уже обработан")
 
-        if cmd == "approve":
-            bot.answer_callback_query(call.id, "Публикую…")
-            publish_post(post_id)
-        elif cmd == "reject":
-            update_status(post_id, 'rejected', reject_reason="Отклонен администратором")
-            bot.answer_callback_query(call.id, "Отклонено")
-            if SEND_LOGS:
-                bot.send_message(owner_id, f"🚫 Post {post_id} отклонён.")
-        else:
-            bot.answer_callback_query(call.id, "Неизвестная команда")
+        # отвечаем сразу, пока не истёк таймаут кнопки; работа — в фоне
+        approve = cmd == "approve"
+        try:
+            bot.answer_callback_query(call.id, "В очереди на публикацию" if approve else "Отклонено")
+        finally:
+            _moderation_pool.submit(_moderate_job, post_id, approve)
     except Exception as e:
         try:
             bot.answer_callback_query(call.id, f"Ошибка: {e}")
@@ -239,34 +1055,11 @@ def handle_callback(call):
             pass
 
 
-def _send_media_paths_direct(chat_id, text, media_paths):
+def _send_media_paths_direct(chat_id, post, media_paths):
     """Fallback: send media files directly to channel when copy_message fails."""
     media_paths = [p for p in (media_paths or []) if p and os.path.exists(p)]
-    if media_paths:
-        media_group = []
-        files = []
-        try:
-            for i, path in enumerate(media_paths):
-                ext = os.path.splitext(path)[1].lower()
-                f = open(path, 'rb')
-                files.append(f)
-                if ext in ('.mp4', '.mov', '.mkv', '.webm'):
-                    media = types.InputMediaVideo(f)
-                else:
-                    media = types.InputMediaPhoto(f)
-                if i == 0:
-                    caption = text[:1024] + ("…" if len(text) > 1024 else "")
-                    media.caption = caption
-                media_group.append(media)
-            bot.send_media_group(chat_id, media_group)
-        finally:
-            for f in files:
-                try:
-                    f.close()
-                except:
-                    pass
-    else:
-        _send_long_message(chat_id, text)
+    text, ents = _post_body(post)
+    _send_post_body(chat_id, text, ents, media_paths)
 
 
 def publish_post(post_id: int) -> bool:
@@ -276,26 +1069,29 @@ def publish_post(post_id: int) -> bool:
         bot.send_message(owner_id, f"❌ Post {post_id} не найден в базе.")
         return False
 
-    owner_msg_ids = get_owner_message_ids(post_id) or []
-    text = post.get("text") or ""
-    try:
-        media_paths = json.loads(post.get("media_paths") or "[]")
-    except Exception:
-        media_paths = []
+    # служебное сообщение с кнопками в канал не копируем
+    owner_msg_ids = get_owner_message_ids(post_id, role='body')
+    media_paths = get_media_paths(post_id)
 
     success = False
-    # First try to copy messages that were sent to owner (this preserves original sender formatting best)
+    # сначала копируем то, что видел владелец: всё или ничего, иначе пост вышел бы дважды
     if owner_msg_ids:
-        for mid in owner_msg_ids:
-            try:
-                bot.copy_message(target_channel, owner_id, mid)
-                success = True
-            except Exception as e:
-                success = False
-    # If nothing was copied successfully, use fallback
+        copied = []
+        try:
+            for mid in owner_msg_ids:
+                copied.append(bot.copy_message(target_channel, owner_id, mid).message_id)
+            success = True
+        except Exception as e:
+            print(f"[PUBLISH] copy_message для post {post_id} не удался ({e}), отправляю заново")
+            for mid in copied:
+                try:
+                    bot.delete_message(target_channel, mid)
+                except Exception:
+                    pass
+    # если скопировать не удалось — отправляем из сохранённых текста и медиа
     if not success:
         try:
-            _send_media_paths_direct(target_channel, text, media_paths)
+            _send_media_paths_direct(target_channel, post, media_paths)
             success = True
         except Exception as e:
             update_status(post_id, 'error')
@@ -304,6 +1100,11 @@ def publish_post(post_id: int) -> bool:
             return False
 
     update_status(post_id, 'published')
+    _delete_owner_messages([post_id])
+    try:
+        _check_freshness_alert()
+    except Exception as e:
+        print(f"[FRESHNESS] {e}")
 
     # 🔥 Удаляем медиа-файлы после успешной публикации
     try:
@@ -324,30 +1125,10 @@ def send_alert(text: str, media_paths=None):
     try:
         media_paths = [p for p in (media_paths or []) if p and os.path.exists(p)]
         if media_paths:
-            media_group = []
-            files = []
-            try:
-                for i, path in enumerate(media_paths):
-                    ext = os.path.splitext(path)[1].lower()
-                    f = open(path, 'rb')
-                    files.append(f)
-                    if ext in ('.mp4', '.mov', '.mkv', '.webm'):
-                        media = types.InputMediaVideo(f)
-                    else:
-                        media = types.InputMediaPhoto(f)
-                    if i == 0:
-                        caption = text[:1024] + ("…" if len(text) > 1024 else "")
-                        media.caption = caption
-                    media_group.append(media)
-                bot.send_media_group(ALERT_TO, media_group)
-                if len(text) > 1024:
-                    bot.send_message(ALERT_TO, text[1024:])
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
+            caption = text[:1024] + ("…" if len(text) > 1024 else "")
+            _send_media_group(ALERT_TO, media_paths, caption)
+            if len(text) > 1024:
+                bot.send_message(ALERT_TO, text[1024:])
         else:
             bot.send_message(ALERT_TO, text)
     except Exception as e:
@@ -356,4 +1137,9 @@ def send_alert(text: str, media_paths=None):
 
 def run_bot():
     print("🤖 Bot thread started")
+    try:
+        # если раньше работали через webhook, getUpdates вернёт 409
+        bot.remove_webhook()
+    except Exception as e:
+        print(f"[BOT] remove_webhook: {e}")
     bot.infinity_polling(skip_pending=True)
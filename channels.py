@@ -0,0 +1,163 @@
+# channels.py
+"""Реестр каналов-источников: числовые peer id вместо имён.
+
+channels_to_parse разрешается в id один раз: известные каналы поднимаются
+из таблицы channels, по сети (get_entity) идут только новые. Обработчик
+NewMessage подписан на id, а воркеры берут имя канала из реестра по
+event.chat_id — на горячем пути нет ни get_chat, ни других запросов
+сущностей. Посты ключуются по (channel_id, orig_message_id), поэтому
+переименование канала или пропавший username не ломают дедуп. username и
+title раз в CHANNEL_REFRESH_HOURS перечитываются одним запросом; label —
+имя в posts.channel и роллапах — остаётся прежним, чтобы статистика канала
+не разваливалась на части.
+"""
+import asyncio
+import time
+
+from database import load_channels, upsert_channel
+
+
+def _normalize(ref):
+    """'@Name', 'name', 'https://t.me/name' -> 'name'; '-100123' -> -100123."""
+    if isinstance(ref, int):
+        return ref
+    ref = str(ref).strip()
+    if ref.lstrip("-").isdigit():
+        return int(ref)
+    for prefix in ("https://", "http://", "t.me/", "@"):
+        if ref.lower().startswith(prefix):
+            ref = ref[len(prefix):]
+    return ref.lower()
+
+
+class ChannelInfo:
+    __slots__ = ("id", "label", "username", "title", "resolved_at",
+                 "received", "last_message_id", "last_message_at")
+
+    def __init__(self, channel_id, label, username=None, title=None, resolved_at=None):
+        self.id = channel_id
+        self.label = label
+        self.username = username
+        self.title = title
+        self.resolved_at = resolved_at
+        # счётчики за время работы процесса
+        self.received = 0
+        self.last_message_id = None
+        self.last_message_at = None
+
+
+class ChannelRegistry:
+    def __init__(self):
+        self._by_id = {}    # peer id -> ChannelInfo
+        self._by_ref = {}   # нормализованная ссылка / username -> peer id
+        self.active = set()  # id, на которые сейчас подписан парсер
+
+    def load(self):
+        """Поднимает каналы из базы — без запросов к Telegram."""
+        for row in load_channels():
+            self._by_id[row["id"]] = ChannelInfo(
+                row["id"], row["label"], row["username"], row["title"], row["resolved_at"]
+            )
+            for ref in (row["ref"], row["username"], row["id"]):
+                if ref:
+                    self._by_ref[_normalize(ref)] = row["id"]
+        return len(self._by_id)
+
+    def get(self, chat_id):
+        return self._by_id.get(chat_id)
+
+    def known_ids(self, refs):
+        """id тех ссылок из refs, что уже разрешены."""
+        ids = []
+        for ref in refs:
+            cid = self._by_ref.get(_normalize(ref))
+            if cid in self._by_id:
+                ids.append(cid)
+        return ids
+
+    def _remember(self, entity, ref=None):
+        from telethon import utils
+
+        cid = utils.get_peer_id(entity)
+        username = getattr(entity, "username", None)
+        title = getattr(entity, "title", None)
+        label = upsert_channel(cid, username, title, None if ref is None else str(ref))
+
+        info = self._by_id.get(cid)
+        if info is None:
+            info = self._by_id[cid] = ChannelInfo(cid, label)
+        elif (info.username, info.title) != (username, title):
+            print(f"[CHANNELS] {label}: @{info.username} «{info.title}» -> @{username} «{title}»")
+        info.username, info.title, info.resolved_at = username, title, int(time.time())
+
+        self._by_ref[cid] = cid
+        if username:
+            self._by_ref[username.lower()] = cid
+        if ref is not None:
+            self._by_ref[_normalize(ref)] = cid
+        return info
+
+    async def resolve(self, client, refs):
+        """id для channels_to_parse; по сети разрешаются только неизвестные ссылки."""
+        ids = []
+        for ref in refs:
+            cid = self._by_ref.get(_normalize(ref))
+            if cid in self._by_id:
+                ids.append(cid)
+                continue
+            try:
+                ids.append(self._remember(await client.get_entity(ref), ref).id)
+            except Exception as e:
+                print(f"[CHANNELS] Не удалось разрешить {ref}: {e}")
+        return ids
+
+    async def refresh(self, client):
+        """Перечитывает username/title каналов подписки одним запросом."""
+        ids = [cid for cid in self._by_id if cid in self.active]
+        if not ids:
+            return 0
+        entities = await client.get_entity(ids)
+        for entity in entities:
+            self._remember(entity)
+        return len(entities)
+
+    async def lookup(self, event):
+        """Канал события; get_chat — только для канала, которого ещё нет в реестре."""
+        info = self._by_id.get(event.chat_id)
+        if info is None:
+            info = self._remember(await event.get_chat())
+        return info
+
+    def note_message(self, info, message_id):
+        info.received += 1
+        info.last_message_id = message_id
+        info.last_message_at = time.time()
+
+    def stats(self):
+        return [
+            {
+                "id": info.id,
+                "label": info.label,
+                "username": info.username,
+                "received": info.received,
+                "last_message_at": info.last_message_at,
+            }
+            for info in self._by_id.values() if info.id in self.active
+        ]
+
+
+registry = ChannelRegistry()
+
+
+async def refresh_loop(client, interval_seconds: float):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            count = await registry.refresh(client)
+            print(f"[CHANNELS] Обновлены данные каналов: {count}")
+        except Exception as e:
+            print(f"[CHANNELS] Ошибка обновления: {e}")
+
+
+def get_channel_stats():
+    return registry.stats()
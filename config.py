@@ -10,11 +10,52 @@ TELEGRAM_PROXY_PORT = 3128
 TELEGRAM_PROXY_TYPE = "http"
 TELEGRAM_PROXY_URL = f"http://{TELEGRAM_PROXY_HOST}:{TELEGRAM_PROXY_PORT}"
 
+# Адрес Bot API в формате telebot.apihelper.API_URL; None — api.telegram.org.
+# Для тестов без сети: python fake_bot_api.py и "http://127.0.0.1:8081/bot{0}/{1}"
+# (к localhost бот ходит без прокси).
+BOT_API_URL = None
+# Свой сервер telegram-bot-api, запущенный с --local на этой же машине: медиа
+# передаются путём file:// и не загружаются через requests (лимит 2000 МБ вместо 50).
+# Работает только вместе с BOT_API_URL; если сервер не принял путь — бот загружает файлы.
+BOT_API_LOCAL = False
+BOT_API_RETRY_429 = 3             # сколько раз повторять запрос после 429 Too Many Requests
+BOT_API_MAX_RETRY_AFTER = 60      # если Telegram просит ждать дольше — ошибка уходит вызывающему
+
+# Как бот получает апдейты: "polling" (отдельный поток) или "webhook"
+# (HTTP-сервер на том же event loop, что и парсер). Для webhook нужен
+# публичный HTTPS-адрес BOT_WEBHOOK_URL, проксируемый на LISTEN:PORT.
+BOT_RUNTIME = "polling"
+BOT_WEBHOOK_URL = ""                  # например "https://bot.example.com/tg-webhook"
+BOT_WEBHOOK_LISTEN = "127.0.0.1"
+BOT_WEBHOOK_PORT = 8443                # не 8081: его по умолчанию занимает fake_bot_api.py
+BOT_WEBHOOK_PATH = "/tg-webhook"
+BOT_WEBHOOK_SECRET = ""               # X-Telegram-Bot-Api-Secret-Token
+BOT_HANDLER_THREADS = 8               # параллельных обработчиков бота
+MODERATION_WORKERS = 2                # фоновых потоков для публикации/отклонения по кнопкам
+
 # Окно антидубликатов (в часах): сравниваем только свежие посты
 DUPLICATE_WINDOW_HOURS = 3
 
 # Порог схожести изображений (меньше = строже)
 IMAGE_DUPLICATE_THRESHOLD = 12
+# Второй порог — по dHash: картинка считается дублем, только если близки оба хэша
+# (None — сравнивать только pHash, как раньше)
+IMAGE_DHASH_THRESHOLD = 10
+
+# Минимальная сторона превью (px), по которому считается pHash до скачивания фото
+THUMB_MIN_SIDE = 60
+
+# Антидубликаты по товару: канонический ключ ссылки (wb:<артикул>, ozon:<id>, ...)
+PRODUCT_KEY_TTL_HOURS = 24        # сколько помнить увиденный товар
+LINK_RESOLVE_SHORTENERS = True    # разворачивать clck.ru, ali.click и т.п.
+LINK_RESOLVE_TIMEOUT = 3          # секунд на один редирект
+
+# Файл с настройками, которые перечитываются на лету (необязательный).
+# JSON-объект с ключами channels_to_parse, blacklist_words, stop_words,
+# alert_words, duplicate_window_hours, image_duplicate_threshold, auto_mode.
+# Значения из таблицы settings (команды бота) имеют приоритет над файлом.
+SETTINGS_FILE = "settings.json"
+SETTINGS_RELOAD_INTERVAL = 5  # секунд между проверками файла и таблицы settings
 
 
 # ID владельца и канал для публикаций
@@ -35,6 +76,9 @@ channels_to_parse = [
     '@wb_skidkamam',
     '@vandroukiru',
 ]
+# id каналов разрешаются один раз (и хранятся в таблице channels);
+# username/title перечитываются раз в столько часов — переименование не ломает дедуп
+CHANNEL_REFRESH_HOURS = 6
 
 # Фразы, которые нужно вырезать из текста
 blacklist_words = [
@@ -92,6 +136,54 @@ STOP_WORDS = [
     'erid', 'риф', 'риф гош'
 ]
 
+# Сколько воркер ждёт другого, который уже обрабатывает такой же пост (0 — сразу пропустить)
+SINGLEFLIGHT_WAIT_SECONDS = 15
+
+MEDIA_DIR = 'media'   # скачанные фото/видео постов
+
+# Отправлять ли каждый новый пост владельцу в ручном режиме. Если False —
+# посты копятся в очереди и разбираются через /pending, чат не засоряется.
+PUSH_PENDING_TO_OWNER = True
+PENDING_PAGE_SIZE = 10  # постов на странице /pending
+SEARCH_PAGE_SIZE = 10   # результатов на странице /search
+
+# Планировщик публикаций: сглаживает всплески, чтобы не упираться во flood-лимиты
+PUBLISH_SLOT_SECONDS = 60     # минимальный интервал между публикациями
+PUBLISH_MAX_PER_HOUR = 30     # не больше N публикаций в час (0 — без лимита)
+PUBLISH_QUIET_HOURS = None    # тихие часы (по локальному времени), например (1, 8)
+PUBLISH_QUEUE_MAX = 100       # при переполнении вытесняются посты с низким приоритетом
+SCHEDULER_POLL_SECONDS = 2
+
+# Хранение истории: посты старше RETENTION_DAYS переносятся в сжатый архив,
+# в основной таблице остаются только поля, нужные для антидубликатов
+RETENTION_DAYS = 14
+RETENTION_INTERVAL_HOURS = 6
+RETENTION_FIRST_DELAY_MINUTES = 10   # первый проход — не сразу при старте, а когда всё поднялось
+ARCHIVE_DB_FILE = 'bonuslab_archive.db'
+RETENTION_BATCH = 500
+VACUUM_PAGES_PER_RUN = 0      # 0 — освобождать все свободные страницы за проход
+
+# Очередь входящих сообщений: ограничивает число одновременно обрабатываемых постов
+INGEST_QUEUE_MAX = 200
+INGEST_WORKERS = 4
+INGEST_OVERFLOW_POLICY = "drop_text_first"   # "defer" | "drop_oldest" | "drop_text_first"
+
+# Свежесть: время от сообщения в канале-источнике до публикации в target_channel (/freshness)
+FRESHNESS_P95_LIMIT_SECONDS = 600      # алерт, если p95 за окно выше (0 — без алерта)
+FRESHNESS_WINDOW_MINUTES = 60          # окно для p95 алерта
+FRESHNESS_MIN_POSTS = 5                # при меньшем числе публикаций в окне не алертим
+FRESHNESS_ALERT_COOLDOWN_MINUTES = 60  # не чаще одного алерта за это время
+
+# Сторож event loop парсера: логирует блокирующие вызовы дольше порога
+LOOP_STALL_THRESHOLD_MS = 200
+LOOP_WATCHDOG_INTERVAL_MS = 100
+
+# Профилирование по командам /profile и /memsnap
+PROFILE_DIR = 'profiles'
+PROFILE_SAMPLE_MS = 5         # интервал сэмплирования стеков
+PROFILE_MAX_SECONDS = 120
+TRACEMALLOC_FRAMES = 10       # глубина стека для tracemalloc
+
 SEND_LOGS = False     # Включает/отключает уведомления владельцу о публикации и отклонении
 
 
@@ -1,63 +1,73 @@
 # database.py
+import os
+import re
 import sqlite3
 import json
+import mimetypes
 import time
-import hashlib
+import zlib
 from typing import Optional, List
-from PIL import Image
-import imagehash
 
-DB_FILE = 'bonuslab.db'
+import hashing
 
+DB_FILE = 'bonuslab.db'
 
-def get_text_hash(text: str) -> str:
-    """Получаем MD5 хэш нормализованного текста."""
-    normalized = ' '.join(text.lower().split())
-    return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+# Жизненный цикл поста: ingested (строка сохранена, медиа ещё под временными именами)
+# -> media_ready (файлы переименованы) -> pending (ждёт владельца) | queued -> published.
+# Для антидубликатов учитываются все «живые» статусы, включая незавершённые.
+LIVE_STATUSES = ('ingested', 'media_ready', 'pending', 'queued', 'published')
+_LIVE_SQL = "(" + ", ".join(f"'{s}'" for s in LIVE_STATUSES) + ")"
 
 
 def normalize_text(text: str) -> str:
     return ' '.join((text or '').lower().split())
 
 
-def is_duplicate_post(text: str, similarity_threshold: float = 0.9) -> bool:
-    """Проверяет, есть ли в базе пост с похожим текстом."""
-    import difflib
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT text FROM posts WHERE status IN ('pending', 'published')")
-    rows = cur.fetchall()
-    conn.close()
-
-    new_text = ' '.join(text.lower().split())
-    for r in rows:
-        old_text = ' '.join((r['text'] or '').lower().split())
-        ratio = difflib.SequenceMatcher(None, new_text, old_text).ratio()
-        if ratio >= similarity_threshold:
-            return True
-    return False
+def _hamming(a, b):
+    if a is None or b is None:
+        return None
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
 
 
 def get_conn():
     conn = sqlite3.connect(DB_FILE, timeout=30)
     conn.row_factory = sqlite3.Row
+    # hamming(a, b) — расстояние между 64-битными pHash прямо в SQL
+    conn.create_function("hamming", 2, _hamming, deterministic=True)
     return conn
 
 
+def phash_to_int(hex_hash: str) -> int:
+    """16-символьный hex pHash/dHash -> знаковое 64-битное целое (тип INTEGER в SQLite)."""
+    value = int(hex_hash, 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _hash_ints(item):
+    """(phash, dhash|None) целыми из пары hex или одного hex pHash; None, если не разбирается."""
+    ph, dh = item if isinstance(item, (tuple, list)) else (item, None)
+    try:
+        return phash_to_int(ph), (phash_to_int(dh) if dh else None)
+    except (TypeError, ValueError):
+        return None
+
+
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
+    # для новой базы: освобождённые страницы можно возвращать incremental_vacuum
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
     cur.execute('''
         CREATE TABLE IF NOT EXISTS posts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             channel TEXT,
             orig_message_id INTEGER,
             text TEXT,
-            media_paths TEXT,
-            image_hashes TEXT,              -- NEW
+            media_paths TEXT,               -- устарело: post_media
+            image_hashes TEXT,              -- устарело: post_image_hashes
             has_media INTEGER DEFAULT 0,
             has_video INTEGER DEFAULT 0,
-            owner_message_ids TEXT,
+            owner_message_ids TEXT,         -- устарело: post_owner_messages
             status TEXT DEFAULT 'pending',
             reject_reason TEXT,
             created_at INTEGER
@@ -73,90 +83,656 @@ def init_db():
     cols = [row["name"] for row in cur.fetchall()]
     if "reject_reason" not in cols:
         cur.execute("ALTER TABLE posts ADD COLUMN reject_reason TEXT")
+    if "published_at" not in cols:
+        cur.execute("ALTER TABLE posts ADD COLUMN published_at INTEGER")
+    if "archived" not in cols:
+        cur.execute("ALTER TABLE posts ADD COLUMN archived INTEGER DEFAULT 0")
+    if "raw_text" not in cols:
+        # текст без разметки + сущности Bot API (JSON); у старых постов — NULL, там только HTML в text
+        cur.execute("ALTER TABLE posts ADD COLUMN raw_text TEXT")
+        cur.execute("ALTER TABLE posts ADD COLUMN entities TEXT")
+    if "channel_id" not in cols:
+        # числовой peer id канала (channels.py); переживает переименование канала
+        cur.execute("ALTER TABLE posts ADD COLUMN channel_id INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_status_created ON posts(status, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_published_at ON posts(published_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_archive_scan ON posts(archived, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel_msg ON posts(channel, orig_message_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel_id_msg ON posts(channel_id, orig_message_id)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS photo_keys (
+            photo_id INTEGER,
+            post_id INTEGER,
+            created_at INTEGER
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_keys_photo ON photo_keys(photo_id, created_at)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS product_keys (
+            key TEXT PRIMARY KEY,
+            post_id INTEGER,
+            seen_at INTEGER
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_keys_seen ON product_keys(seen_at)")
+    # отклонённый или упавший пост не должен держать товар весь TTL — как и отпечатки
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_product_keys_release AFTER UPDATE OF status ON posts
+        WHEN new.status IN ('rejected', 'error') BEGIN
+            DELETE FROM product_keys WHERE post_id = new.id;
+        END
+    ''')
+    cur.execute(
+        "DELETE FROM product_keys WHERE post_id IN (SELECT id FROM posts WHERE status IN ('rejected', 'error'))"
+    )
+    # отпечатки контента живых постов: уникальный ключ не даёт двум процессам
+    # сохранить один и тот же пост, даже если оба прошли проверки дублей
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS post_fingerprints (
+            key TEXT PRIMARY KEY,
+            post_id INTEGER,
+            created_at INTEGER
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_post_fingerprints_created ON post_fingerprints(created_at)")
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_fingerprints_release AFTER UPDATE OF status ON posts
+        WHEN new.status IN ('rejected', 'error') BEGIN
+            DELETE FROM post_fingerprints WHERE post_id = new.id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS posts_archived_keys (
+            channel TEXT,
+            orig_message_id INTEGER,
+            created_at INTEGER,
+            PRIMARY KEY (channel, orig_message_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS posts_archived_ids (
+            channel_id INTEGER,
+            orig_message_id INTEGER,
+            created_at INTEGER,
+            PRIMARY KEY (channel_id, orig_message_id)
+        ) WITHOUT ROWID
+    ''')
+    _init_channels(cur)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS publish_queue (
+            post_id INTEGER PRIMARY KEY,
+            priority INTEGER DEFAULT 0,
+            enqueued_at INTEGER
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_queue_order ON publish_queue(priority, enqueued_at)")
+    _init_post_children(cur)
+    _init_post_timings(cur)
+    _init_stats_rollups(cur)
+    _init_posts_fts(cur)
+    # посты, одобренные до появления очереди, не должны потеряться
+    cur.execute(
+        "INSERT OR IGNORE INTO publish_queue(post_id, priority, enqueued_at) "
+        "SELECT id, ?, created_at FROM posts WHERE status='queued'",
+        (PRIORITY_HIGH,)
+    )
     conn.commit()
+    cur.execute("PRAGMA auto_vacuum")
+    if cur.fetchone()[0] != 2:
+        # база создана до включения auto_vacuum: переключаем один раз полным VACUUM —
+        # здесь, пока никто больше в базу не пишет, а не в фоне рядом с парсером
+        print("[DB] Включаю auto_vacuum=INCREMENTAL (полный VACUUM, один раз)...")
+        started = time.time()
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        print(f"[DB] VACUUM завершён за {time.time() - started:.1f} с")
     conn.close()
 
 
-def post_exists(channel: str, orig_message_id: int) -> bool:
+def _json_list(value):
+    try:
+        return json.loads(value or "[]") or []
+    except Exception:
+        return []
+
+
+def _init_post_children(cur):
+    """Хэши, медиа и сообщения владельца — в отдельных типизированных таблицах, а не JSON в posts."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS post_image_hashes (
+            post_id INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            phash INTEGER NOT NULL,         -- 64-битный pHash (знаковый)
+            created_at INTEGER NOT NULL,
+            dhash INTEGER,                  -- 64-битный dHash; NULL у старых постов
+            PRIMARY KEY (post_id, idx)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("PRAGMA table_info(post_image_hashes)")
+    if "dhash" not in [row["name"] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE post_image_hashes ADD COLUMN dhash INTEGER")
+    # покрывающий индекс: окно по времени читается без обращения к основной таблице
+    cur.execute("DROP INDEX IF EXISTS idx_post_image_hashes_window")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_post_image_hashes_win "
+        "ON post_image_hashes(created_at, phash, dhash, post_id)"
+    )
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS post_media (
+            post_id INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            path TEXT,
+            mime TEXT,
+            size INTEGER,
+            file_id TEXT,                   -- file_id Bot API после первой отправки
+            PRIMARY KEY (post_id, idx)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS post_owner_messages (
+            post_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            role TEXT NOT NULL DEFAULT 'body',   -- body | controls
+            PRIMARY KEY (post_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_children_ad AFTER DELETE ON posts BEGIN
+            DELETE FROM post_image_hashes WHERE post_id = old.id;
+            DELETE FROM post_media WHERE post_id = old.id;
+            DELETE FROM post_owner_messages WHERE post_id = old.id;
+        END
+    ''')
+
+    # перенос из старых JSON-колонок; после переноса они обнуляются
+    cur.execute(
+        "SELECT id, created_at, media_paths, image_hashes, owner_message_ids FROM posts "
+        "WHERE media_paths IS NOT NULL OR image_hashes IS NOT NULL OR owner_message_ids IS NOT NULL"
+    )
+    for row in cur.fetchall():
+        cur.executemany(
+            "INSERT OR IGNORE INTO post_media(post_id, idx, path, mime) VALUES (?, ?, ?, ?)",
+            [(row["id"], i, p, mimetypes.guess_type(p)[0]) for i, p in enumerate(_json_list(row["media_paths"])) if p]
+        )
+        hashes = []
+        for i, h in enumerate(_json_list(row["image_hashes"])):
+            try:
+                hashes.append((row["id"], i, phash_to_int(h), row["created_at"] or 0))
+            except (TypeError, ValueError):
+                continue
+        cur.executemany(
+            "INSERT OR IGNORE INTO post_image_hashes(post_id, idx, phash, created_at) VALUES (?, ?, ?, ?)",
+            hashes
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO post_owner_messages(post_id, message_id, role) VALUES (?, ?, 'body')",
+            [(row["id"], mid) for mid in _json_list(row["owner_message_ids"])]
+        )
+        cur.execute(
+            "UPDATE posts SET media_paths=NULL, image_hashes=NULL, owner_message_ids=NULL WHERE id=?",
+            (row["id"],)
+        )
+
+
+# вехи пути поста от сообщения в канале-источнике до публикации (колонки <веха>_ms)
+TIMING_MILESTONES = ('received', 'media', 'dedup', 'saved', 'sent', 'published')
+
+
+def _init_post_timings(cur):
+    """Одна строка на пост: дата сообщения-источника и смещения вех от неё в мс (маленькие целые)."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS post_timings (
+            post_id INTEGER PRIMARY KEY,
+            source_at INTEGER NOT NULL,     -- event.message.date, unix-время
+            received_ms INTEGER,            -- пришло в обработчик NewMessage
+            media_ms INTEGER,               -- медиа скачаны (NULL у текстовых постов)
+            dedup_ms INTEGER,               -- проверки дублей пройдены
+            saved_ms INTEGER,               -- пост сохранён
+            sent_ms INTEGER,                -- отправлен владельцу или поставлен в очередь публикаций
+            published_ms INTEGER            -- опубликован в target_channel
+        )
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS posts_timings_ad AFTER DELETE ON posts BEGIN
+            DELETE FROM post_timings WHERE post_id = old.id;
+        END
+    ''')
+
+
+def _mark_timing(cur, post_id: int, milestone: str, at: float = None):
+    """Записывает веху, если её ещё нет (повторная отправка не сдвигает время)."""
+    column = f"{milestone}_ms"
+    cur.execute(
+        f"UPDATE post_timings SET {column} = COALESCE({column}, ? - source_at * 1000) WHERE post_id=?",
+        (int((at or time.time()) * 1000), post_id)
+    )
+
+
+def _percentile(sorted_values, q: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def get_freshness_stats(since_ts: Optional[int] = None):
+    """Свежесть опубликованных постов: секунды от сообщения-источника до публикации.
+
+    {"overall": {...}, "channels": {канал: {...}}, "stages": {веха: {...}}},
+    где {...} = {"count", "p50", "p95", "max"}; stages — сколько занял переход
+    к вехе от предыдущей записанной.
+    """
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT 1 FROM posts WHERE channel=? AND orig_message_id=?", (channel, orig_message_id))
-    res = cur.fetchone()
+    cur.execute(
+        f"""
+        SELECT p.channel, {", ".join(f"t.{m}_ms" for m in TIMING_MILESTONES)}
+        FROM posts p
+        JOIN post_timings t ON t.post_id = p.id
+        WHERE p.published_at >= ? AND t.published_ms IS NOT NULL
+        """,
+        (since_ts or 0,)
+    )
+    rows = cur.fetchall()
     conn.close()
-    return res is not None
+
+    total = []
+    channels = {}
+    stages = {m: [] for m in TIMING_MILESTONES}
+    for r in rows:
+        value = r["published_ms"] / 1000
+        total.append(value)
+        channels.setdefault(r["channel"] or "?", []).append(value)
+        prev = 0
+        for m in TIMING_MILESTONES:
+            at = r[f"{m}_ms"]
+            if at is not None:
+                stages[m].append((at - prev) / 1000)
+                prev = at
+
+    def summary(values):
+        values.sort()
+        return {"count": len(values), "p50": _percentile(values, 0.5),
+                "p95": _percentile(values, 0.95), "max": values[-1] if values else None}
+
+    return {
+        "overall": summary(total),
+        "channels": {ch: summary(v) for ch, v in channels.items()},
+        "stages": {m: summary(v) for m, v in stages.items() if v},
+    }
+
+
+def _rollup_reason(alias: str) -> str:
+    return f"CASE WHEN {alias}.status='rejected' THEN COALESCE({alias}.reject_reason, '') ELSE '' END"
+
+
+def _init_stats_rollups(cur):
+    """Счётчики по (час, канал, статус, причина), которые ведут триггеры на posts."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stats_rollup (
+            hour INTEGER,
+            channel TEXT,
+            status TEXT,
+            reason TEXT NOT NULL DEFAULT '',
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, channel, status, reason)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            status TEXT PRIMARY KEY,
+            cnt INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='posts_stats_ai'")
+    if cur.fetchone() is None:
+        # первый запуск с роллапами — один раз заполняем их из истории
+        cur.execute("DELETE FROM stats_rollup")
+        cur.execute("DELETE FROM stats_totals")
+        cur.execute(f'''
+            INSERT INTO stats_rollup(hour, channel, status, reason, cnt)
+            SELECT created_at / 3600, COALESCE(channel, ''), status, {_rollup_reason("posts")}, COUNT(*)
+            FROM posts
+            GROUP BY 1, 2, 3, 4
+        ''')
+        cur.execute(
+            "INSERT INTO stats_totals(status, cnt) SELECT status, COUNT(*) FROM posts GROUP BY status"
+        )
+
+    inc = '''
+        INSERT INTO stats_rollup(hour, channel, status, reason, cnt)
+        VALUES ({a}.created_at / 3600, COALESCE({a}.channel, ''), {a}.status, {reason}, {d})
+        ON CONFLICT(hour, channel, status, reason) DO UPDATE SET cnt = cnt + ({d});
+        INSERT INTO stats_totals(status, cnt) VALUES ({a}.status, {d})
+        ON CONFLICT(status) DO UPDATE SET cnt = cnt + ({d});
+    '''
+    plus_new = inc.format(a="new", reason=_rollup_reason("new"), d=1)
+    minus_old = inc.format(a="old", reason=_rollup_reason("old"), d=-1)
+    cur.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_stats_ai AFTER INSERT ON posts BEGIN
+            {plus_new}
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_stats_au AFTER UPDATE OF status, reject_reason ON posts
+        WHEN old.status IS NOT new.status OR old.reject_reason IS NOT new.reject_reason BEGIN
+            {minus_old}
+            {plus_new}
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_stats_ad AFTER DELETE ON posts
+        WHEN old.archived IS NOT 1 BEGIN
+            {minus_old}
+        END;
+    ''')
 
 
-def save_post(channel: str, orig_message_id: int, text: str, media_paths: Optional[List[str]], has_video: bool) -> int:
+def record_skip(channel: str, reason: str):
+    """Учитывает в роллапах сообщение, отброшенное парсером до сохранения."""
     conn = get_conn()
     cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO stats_rollup(hour, channel, status, reason, cnt)
+        VALUES (?, ?, 'skipped', ?, 1)
+        ON CONFLICT(hour, channel, status, reason) DO UPDATE SET cnt = cnt + 1
+        """,
+        (int(time.time()) // 3600, channel or '', reason)
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_rollup_counts(since_ts: Optional[int] = None):
+    """Суммы роллапов по (канал, статус, причина) начиная с since_ts.
+
+    Читает только строки роллапа (часы × каналы), а не таблицу posts.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    since_hour = (since_ts // 3600) if since_ts else 0
+    cur.execute(
+        """
+        SELECT channel, status, reason, SUM(cnt) AS cnt
+        FROM stats_rollup
+        WHERE hour >= ?
+        GROUP BY channel, status, reason
+        """,
+        (since_hour,)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
 
-    # считаем хэши изображений
-    image_hash_list = []
-    if media_paths:
-        for p in media_paths:
-            h = calc_image_hash(p)
-            if h:
-                image_hash_list.append(h)
 
-    media_json = json.dumps(media_paths or [])
-    hashes_json = json.dumps(image_hash_list)
+# ===== Каналы-источники =====
+
+def _init_channels(cur):
+    """Реестр каналов: peer id -> имя для posts.channel и роллапов + свежие username/title."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            id INTEGER PRIMARY KEY,         -- peer id Telethon (-100...)
+            label TEXT NOT NULL,            -- имя в posts.channel и stats_rollup; не меняется
+            username TEXT,
+            title TEXT,
+            ref TEXT,                       -- как канал записан в channels_to_parse
+            resolved_at INTEGER
+        )
+    ''')
+
+
+def load_channels():
+    """Все известные каналы — реестр поднимается из базы без запросов к Telegram."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT id, label, username, title, ref, resolved_at FROM channels")
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def upsert_channel(channel_id: int, username: Optional[str], title: Optional[str],
+                   ref: Optional[str] = None) -> str:
+    """Запоминает свежие username/title канала и возвращает его постоянный label.
+
+    Новый канал получает label = username (или title) и привязывает к своему id
+    старые посты и ключи архива, сохранённые ещё по имени.
+    """
+    now = int(time.time())
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("SELECT label FROM channels WHERE id=?", (channel_id,))
+    row = cur.fetchone()
+    if row is not None:
+        label = row["label"]
+        cur.execute(
+            "UPDATE channels SET username=?, title=?, ref=COALESCE(?, ref), resolved_at=? WHERE id=?",
+            (username, title, ref, now, channel_id)
+        )
+    else:
+        label = username or title or str(channel_id)
+        cur.execute(
+            "INSERT INTO channels(id, label, username, title, ref, resolved_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (channel_id, label, username, title, ref, now)
+        )
+        names = [n for n in {label, username, title} if n]
+        marks = ",".join("?" * len(names))
+        cur.execute(
+            f"UPDATE posts SET channel_id=? WHERE channel_id IS NULL AND channel IN ({marks})",
+            (channel_id, *names)
+        )
+        cur.execute(
+            f"INSERT OR IGNORE INTO posts_archived_ids(channel_id, orig_message_id, created_at) "
+            f"SELECT ?, orig_message_id, created_at FROM posts_archived_keys WHERE channel IN ({marks})",
+            (channel_id, *names)
+        )
+    conn.commit()
+    conn.close()
+    return label
+
+
+def post_exists(channel: str, orig_message_id: int, channel_id: Optional[int] = None) -> bool:
+    """Был ли уже такой пост. С channel_id ключ — числовой id канала, а не имя."""
+    if channel_id is not None:
+        where, key = "channel_id=? AND orig_message_id=?", (channel_id, orig_message_id)
+        archived = "posts_archived_ids"
+    else:
+        where, key = "channel=? AND orig_message_id=?", (channel, orig_message_id)
+        archived = "posts_archived_keys"
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT 1 FROM posts WHERE {where}", key)
+    res = cur.fetchone()
+    if res is None:
+        cur.execute(f"SELECT 1 FROM {archived} WHERE {where}", key)
+        res = cur.fetchone()
+    conn.close()
+    return res is not None
+
+
+def save_post(channel: str, orig_message_id: int, text: str, media_paths: Optional[List[str]], has_video: bool,
+              photo_ids: Optional[List[int]] = None, product_keys: Optional[List[str]] = None,
+              raw_text: Optional[str] = None, entities: Optional[list] = None,
+              status: str = 'pending', fingerprints: Optional[List[str]] = None,
+              fingerprint_window: int = 0, image_hashes: Optional[list] = None,
+              timings: Optional[dict] = None, channel_id: Optional[int] = None) -> Optional[int]:
+    """Сохраняет пост. None — такой же пост (по отпечаткам) уже сохранён за fingerprint_window секунд.
+
+    image_hashes — уже посчитанные пары (phash, dhash) для media_paths; если не переданы,
+    считаются здесь одной пачкой. timings — {"source": unix-время сообщения-источника,
+    веха: unix-время} для post_timings; веху saved ставит сама функция.
+    """
+    if image_hashes is None:
+        image_hashes = hashing.image_hashes(media_paths) if media_paths else []
+    image_hash_list = [h for h in (_hash_ints(x) for x in image_hashes if x) if h]
+
+    conn = get_conn()
+    cur = conn.cursor()
 
     ts = int(time.time())
     cur.execute('''
-        INSERT INTO posts (channel, orig_message_id, text, media_paths, image_hashes, has_media, has_video, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (channel, orig_message_id, text, media_json, hashes_json,
-          1 if media_paths else 0, int(has_video), ts))
+        INSERT INTO posts (channel, orig_message_id, text, has_media, has_video, created_at,
+                           raw_text, entities, status, channel_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (channel, orig_message_id, text,
+          1 if media_paths else 0, int(has_video), ts,
+          raw_text, json.dumps(entities) if raw_text is not None else None, status, channel_id))
 
     post_id = cur.lastrowid
+    _write_media(cur, post_id, media_paths)
+    cur.executemany(
+        "INSERT INTO post_image_hashes (post_id, idx, phash, dhash, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(post_id, i, ph, dh, ts) for i, (ph, dh) in enumerate(image_hash_list)]
+    )
+    for key in fingerprints or []:
+        # старый отпечаток (вне окна) перезаписываем, свежий — значит дубль
+        cur.execute(
+            "INSERT INTO post_fingerprints (key, post_id, created_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET post_id=excluded.post_id, created_at=excluded.created_at "
+            "WHERE post_fingerprints.created_at < ?",
+            (key, post_id, ts, ts - int(fingerprint_window))
+        )
+        if cur.rowcount == 0:
+            conn.rollback()
+            conn.close()
+            return None
+    if timings and timings.get("source"):
+        source_ms = int(timings["source"]) * 1000
+        marks = dict(timings, saved=time.time())
+        cur.execute(
+            f"INSERT INTO post_timings (post_id, source_at, {', '.join(f'{m}_ms' for m in TIMING_MILESTONES)}) "
+            f"VALUES (?, ?{', ?' * len(TIMING_MILESTONES)})",
+            (post_id, int(timings["source"]),
+             *[int(marks[m] * 1000) - source_ms if marks.get(m) else None for m in TIMING_MILESTONES])
+        )
+    if photo_ids:
+        cur.executemany(
+            "INSERT INTO photo_keys (photo_id, post_id, created_at) VALUES (?, ?, ?)",
+            [(pid, post_id, ts) for pid in photo_ids]
+        )
+    if product_keys:
+        cur.executemany(
+            "INSERT INTO product_keys (key, post_id, seen_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET post_id=excluded.post_id, seen_at=excluded.seen_at",
+            [(k, post_id, ts) for k in product_keys]
+        )
     conn.commit()
     conn.close()
     return post_id
 
 
-def update_media_paths(post_id: int, media_paths: List[str]):
+def _write_media(cur, post_id: int, media_paths):
+    cur.execute("DELETE FROM post_media WHERE post_id=?", (post_id,))
+    rows = []
+    for i, p in enumerate(media_paths or []):
+        try:
+            size = os.path.getsize(p)
+        except OSError:
+            size = None
+        rows.append((post_id, i, p, mimetypes.guess_type(p)[0], size))
+    cur.executemany("INSERT INTO post_media (post_id, idx, path, mime, size) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def mark_media_ready(post_id: int, media_paths: List[str]) -> bool:
+    """ingested -> media_ready вместе с окончательными путями файлов. False — переход уже был."""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute(
-        "UPDATE posts SET media_paths=?, has_media=? WHERE id=?",
-        (json.dumps(media_paths), 1 if media_paths else 0, post_id)
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("UPDATE posts SET status='media_ready' WHERE id=? AND status='ingested'", (post_id,))
+    changed = cur.rowcount > 0
+    if changed:
+        _write_media(cur, post_id, media_paths)
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def get_media_paths(post_id: int) -> List[str]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM post_media WHERE post_id=? ORDER BY idx", (post_id,))
+    paths = [r["path"] for r in cur.fetchall() if r["path"]]
+    conn.close()
+    return paths
+
+
+def set_media_file_ids(post_id: int, file_ids: List[Optional[str]]):
+    """Запоминает file_id, выданные Bot API при первой отправке медиа."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany(
+        "UPDATE post_media SET file_id=? WHERE post_id=? AND idx=?",
+        [(fid, post_id, i) for i, fid in enumerate(file_ids) if fid]
     )
     conn.commit()
     conn.close()
 
 
-def set_owner_message_ids(post_id: int, message_ids: List[int]):
+def list_posts_in_status(statuses):
+    marks = ",".join("?" * len(statuses))
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        "UPDATE posts SET owner_message_ids=? WHERE id=?",
-        (json.dumps(message_ids), post_id)
+        f"SELECT id, channel, status, has_media, "
+        f"EXISTS(SELECT 1 FROM post_owner_messages m WHERE m.post_id = posts.id) AS sent_to_owner "
+        f"FROM posts WHERE status IN ({marks}) ORDER BY created_at, id",
+        tuple(statuses)
+    )
+    rows = [dict(r) for r in cur.fetchall()]
+    for row in rows:
+        cur.execute("SELECT path FROM post_media WHERE post_id=? ORDER BY idx", (row["id"],))
+        row["media_paths"] = [r["path"] for r in cur.fetchall() if r["path"]]
+    conn.close()
+    return rows
+
+
+def get_referenced_media_paths() -> set:
+    """Все пути к файлам, на которые ссылаются посты основной базы."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM post_media WHERE path IS NOT NULL")
+    paths = {os.path.normpath(r["path"]) for r in cur.fetchall()}
+    conn.close()
+    return paths
+
+
+def set_owner_message_ids(post_id: int, message_ids: List[int], control_ids: List[int] = ()):
+    """Сообщения, отправленные владельцу: сам пост (body) и служебное с кнопками (controls)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM post_owner_messages WHERE post_id=?", (post_id,))
+    cur.executemany(
+        "INSERT OR REPLACE INTO post_owner_messages (post_id, message_id, role) VALUES (?, ?, ?)",
+        [(post_id, mid, 'body') for mid in message_ids] + [(post_id, mid, 'controls') for mid in control_ids]
     )
+    _mark_timing(cur, post_id, 'sent')
     conn.commit()
     conn.close()
 
 
-def get_owner_message_ids(post_id: int) -> List[int]:
+def get_owner_message_ids(post_id: int, role: str = None) -> List[int]:
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT owner_message_ids FROM posts WHERE id=?", (post_id,))
-    row = cur.fetchone()
+    if role:
+        cur.execute(
+            "SELECT message_id FROM post_owner_messages WHERE post_id=? AND role=? ORDER BY message_id",
+            (post_id, role)
+        )
+    else:
+        cur.execute("SELECT message_id FROM post_owner_messages WHERE post_id=? ORDER BY message_id", (post_id,))
+    ids = [r["message_id"] for r in cur.fetchall()]
     conn.close()
-    if not row or not row["owner_message_ids"]:
-        return []
-    try:
-        return json.loads(row["owner_message_ids"])
-    except Exception:
-        return []
+    return ids
 
 
 def update_status(post_id: int, status: str, reject_reason: str = None):
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        "UPDATE posts SET status=?, reject_reason=? WHERE id=?",
-        (status, reject_reason if status == "rejected" else None, post_id)
+        "UPDATE posts SET status=?, reject_reason=?, "
+        "published_at=CASE WHEN ?='published' THEN ? ELSE published_at END WHERE id=?",
+        (status, reject_reason if status == "rejected" else None, status, int(time.time()), post_id)
     )
+    if status == 'published':
+        _mark_timing(cur, post_id, 'published')
     conn.commit()
     conn.close()
 
@@ -170,62 +746,233 @@ def get_post(post_id: int):
     return dict(row) if row else None
 
 
-def list_pending(limit=50):
+def list_pending_page(after=None, before=None, limit: int = 10, inclusive: bool = False):
+    """Keyset-пагинация pending-постов по (created_at, id), от старых к новым.
+
+    after/before — ключ (created_at, id) соседней страницы. Возвращает
+    (rows, has_prev, has_next).
+    """
     conn = get_conn()
     cur = conn.cursor()
+    cols = "SELECT id, channel, text, created_at FROM posts WHERE status='pending'"
+    if before is not None:
+        cur.execute(
+            cols + " AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+            (before[0], before[1], limit + 1)
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+        has_prev = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        has_next = True
+    else:
+        if after is not None:
+            op = ">=" if inclusive else ">"
+            cur.execute(
+                cols + f" AND (created_at, id) {op} (?, ?) ORDER BY created_at, id LIMIT ?",
+                (after[0], after[1], limit + 1)
+            )
+        else:
+            cur.execute(cols + " ORDER BY created_at, id LIMIT ?", (limit + 1,))
+        rows = [dict(r) for r in cur.fetchall()]
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = False
+        if rows:
+            cur.execute(
+                "SELECT 1 FROM posts WHERE status='pending' AND (created_at, id) < (?, ?) LIMIT 1",
+                (rows[0]["created_at"], rows[0]["id"])
+            )
+            has_prev = cur.fetchone() is not None
+    conn.close()
+    return rows, has_prev, has_next
+
+
+def bulk_update_status(post_ids: List[int], status: str, reject_reason: str = None,
+                       from_status: str = 'pending') -> List[int]:
+    """Переводит пачку постов из from_status в status одной транзакцией.
+
+    Возвращает id, которые действительно сменили статус (повторный клик
+    по уже обработанным постам ничего не делает).
+    """
+    if not post_ids:
+        return []
+    conn = get_conn()
+    cur = conn.cursor()
+    marks = ",".join("?" * len(post_ids))
+    cur.execute("BEGIN IMMEDIATE")
     cur.execute(
-        "SELECT id, channel, text, created_at FROM posts WHERE status='pending' ORDER BY created_at DESC LIMIT ?",
-        (limit,)
+        f"SELECT id FROM posts WHERE status=? AND id IN ({marks}) ORDER BY created_at, id",
+        (from_status, *post_ids)
     )
-    rows = cur.fetchall()
+    ids = [r["id"] for r in cur.fetchall()]
+    if ids:
+        marks = ",".join("?" * len(ids))
+        cur.execute(
+            f"UPDATE posts SET status=?, reject_reason=? WHERE id IN ({marks})",
+            (status, reject_reason if status == "rejected" else None, *ids)
+        )
+    conn.commit()
     conn.close()
-    return [dict(r) for r in rows]
+    return ids
 
 
-def get_status_counts():
+def get_owner_message_ids_bulk(post_ids: List[int], role: str = None) -> dict:
+    if not post_ids:
+        return {}
     conn = get_conn()
     cur = conn.cursor()
+    marks = ",".join("?" * len(post_ids))
+    role_sql = " AND role=?" if role else ""
     cur.execute(
-        """
-        SELECT status, COUNT(*) AS cnt
-        FROM posts
-        GROUP BY status
-        """
+        f"SELECT post_id, message_id FROM post_owner_messages WHERE post_id IN ({marks}){role_sql} "
+        f"ORDER BY post_id, message_id",
+        (*post_ids, role) if role else tuple(post_ids)
+    )
+    result = {pid: [] for pid in post_ids}
+    for row in cur.fetchall():
+        result[row["post_id"]].append(row["message_id"])
+    conn.close()
+    return result
+
+
+# ===== Очередь публикаций =====
+
+PRIORITY_LOW = 0      # автопост без медиа
+PRIORITY_NORMAL = 1   # автопост с фото
+PRIORITY_HIGH = 2     # одобрен владельцем
+
+
+def enqueue_publication(post_ids: List[int], priority: int = PRIORITY_NORMAL,
+                        max_queue: int = 0) -> List[int]:
+    """Ставит посты в очередь публикаций (статус 'queued').
+
+    Если в очереди больше max_queue элементов, вытесняются самые старые
+    элементы с наименьшим приоритетом — они помечаются отклонёнными.
+    Возвращает id вытесненных постов.
+    """
+    if not post_ids:
+        return []
+    ts = int(time.time())
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    for post_id in post_ids:
+        cur.execute(
+            "INSERT INTO publish_queue(post_id, priority, enqueued_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(post_id) DO UPDATE SET priority=MAX(priority, excluded.priority)",
+            (post_id, priority, ts)
+        )
+        cur.execute("UPDATE posts SET status='queued', reject_reason=NULL WHERE id=?", (post_id,))
+        _mark_timing(cur, post_id, 'sent')
+
+    dropped = []
+    if max_queue > 0:
+        cur.execute("SELECT COUNT(*) AS cnt FROM publish_queue")
+        excess = cur.fetchone()["cnt"] - max_queue
+        if excess > 0:
+            cur.execute(
+                "SELECT post_id FROM publish_queue ORDER BY priority ASC, enqueued_at ASC, post_id ASC LIMIT ?",
+                (excess,)
+            )
+            dropped = [r["post_id"] for r in cur.fetchall()]
+            for post_id in dropped:
+                cur.execute("DELETE FROM publish_queue WHERE post_id=?", (post_id,))
+                cur.execute(
+                    "UPDATE posts SET status='rejected', reject_reason=? WHERE id=?",
+                    ("Очередь публикаций переполнена", post_id)
+                )
+    conn.commit()
+    conn.close()
+    return dropped
+
+
+def next_queued_publication():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT post_id, priority, enqueued_at FROM publish_queue "
+        "ORDER BY priority DESC, enqueued_at ASC, post_id ASC LIMIT 1"
+    )
+    row = cur.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def dequeue_publication(post_id: int):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM publish_queue WHERE post_id=?", (post_id,))
+    conn.commit()
+    conn.close()
+
+
+def get_publish_queue_size() -> int:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) AS cnt FROM publish_queue")
+    cnt = cur.fetchone()["cnt"]
+    conn.close()
+    return cnt
+
+
+def get_publish_times_since(since_ts: int) -> List[int]:
+    """Времена публикаций начиная с since_ts (по возрастанию)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT published_at FROM posts WHERE published_at >= ? ORDER BY published_at",
+        (since_ts,)
     )
     rows = cur.fetchall()
     conn.close()
-    counts = {"pending": 0, "published": 0, "rejected": 0, "error": 0}
+    return [r["published_at"] for r in rows]
+
+
+def get_last_published_at() -> Optional[int]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(published_at) AS ts FROM posts")
+    row = cur.fetchone()
+    conn.close()
+    return row["ts"] if row else None
+
+
+def get_status_counts():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT status, cnt FROM stats_totals")
+    rows = cur.fetchall()
+    conn.close()
+    counts = {"pending": 0, "queued": 0, "published": 0, "rejected": 0, "error": 0}
     for row in rows:
         counts[row["status"]] = row["cnt"]
     return counts
 
 
-def set_auto_mode(enabled: bool):
+def get_settings() -> dict:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT key, value FROM settings")
+    rows = cur.fetchall()
+    conn.close()
+    return {r["key"]: r["value"] for r in rows}
+
+
+def set_setting(key: str, value: str):
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """
         INSERT INTO settings(key, value)
-        VALUES('auto_mode', ?)
+        VALUES(?, ?)
         ON CONFLICT(key) DO UPDATE SET value=excluded.value
         """,
-        ("1" if enabled else "0",)
+        (key, value)
     )
     conn.commit()
     conn.close()
 
 
-def get_auto_mode(default: bool = False) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT value FROM settings WHERE key='auto_mode'")
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return bool(default)
-    return str(row["value"]).strip() in ("1", "true", "True", "on", "yes")
-
-
 def list_recent_reviewed_posts(limit: int = 50):
     conn = get_conn()
     cur = conn.cursor()
@@ -252,50 +999,289 @@ def delete_post(post_id):
     conn.close()
 
 
-def calc_image_hash(path: str) -> str:
+# ===== Полнотекстовый поиск =====
+
+# текст поста для индекса: без разметки, если есть; «ё» ищется как «е»
+_FTS_BODY = "replace(replace(COALESCE({0}.raw_text, {0}.text, ''), 'ё', 'е'), 'Ё', 'Е')"
+_FTS_TERM_RE = re.compile(r"\w+")
+
+
+def _init_posts_fts(cur):
+    """FTS5-индекс текста постов; триггеры держат его в синхронизации с posts.
+
+    Таблица contentless (content=''): сам текст лежит только в posts, в индексе —
+    токены. unicode61 приводит регистр и снимает диакритику, prefix='2 3 4'
+    ускоряет поиск по началу слова — русские окончания покрываются запросом «слово*».
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='posts_fts'")
+    exists = cur.fetchone() is not None
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            body,
+            content='',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    ''')
+    new_body, old_body = _FTS_BODY.format("new"), _FTS_BODY.format("old")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts(rowid, body) VALUES (new.id, {new_body});
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, body) VALUES ('delete', old.id, {old_body});
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF text, raw_text ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, body) VALUES ('delete', old.id, {old_body});
+            INSERT INTO posts_fts(rowid, body) VALUES (new.id, {new_body});
+        END
+    ''')
+    if not exists:
+        cur.execute(f"INSERT INTO posts_fts(rowid, body) SELECT id, {_FTS_BODY.format('posts')} FROM posts")
+
+
+def _fts_query(query: str) -> str:
+    """Запрос пользователя -> MATCH: все слова обязательны, каждое — как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (AND, NEAR, *, ^) из
+    запроса не интерпретируются и не дают синтаксических ошибок.
+    """
+    terms = _FTS_TERM_RE.findall((query or "").lower().replace("ё", "е"))
+    return " ".join(f'"{t}"*' for t in terms[:16])
+
+
+def search_posts(query: str, limit: int = 10, offset: int = 0):
+    """Посты по запросу, от самых релевантных (bm25). Возвращает (rows, total)."""
+    match = _fts_query(query)
+    if not match:
+        return [], 0
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) AS cnt FROM posts_fts WHERE posts_fts MATCH ?", (match,))
+    total = cur.fetchone()["cnt"]
+    cur.execute(
+        """
+        SELECT p.id, p.channel, p.status, p.created_at, p.published_at,
+               COALESCE(p.raw_text, p.text) AS text
+        FROM posts_fts f JOIN posts p ON p.id = f.rowid
+        WHERE posts_fts MATCH ?
+        ORDER BY bm25(posts_fts), p.id DESC
+        LIMIT ? OFFSET ?
+        """,
+        (match, limit, offset)
+    )
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows, total
+
+
+# ===== Архив =====
+
+ARCHIVE_FINAL_STATUSES = ('published', 'rejected', 'error')
+
+
+def archive_old_posts(cutoff_ts: int, archive_file: str, batch: int = 500):
+    """Переносит старые посты из горячей таблицы в сжатый архив.
+
+    Строка целиком уходит в archive_file одним zlib-сжатым JSON, а в
+    горячей базе остаётся только ключ (channel, orig_message_id) в
+    posts_archived_keys (и (channel_id, orig_message_id) в posts_archived_ids) —
+    его хватает для post_exists; статистика уже
+    лежит в роллапах. Старые строки идут подряд по id, поэтому их
+    удаление освобождает целые страницы, которые потом возвращает
+    incremental_vacuum. Перенос пачки атомарен (ATTACH + одна транзакция).
+    Возвращает (число постов, media_paths этих постов) — оставшиеся файлы
+    удаляет вызывающий.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS archive.posts_archive (
+            id INTEGER PRIMARY KEY,
+            channel TEXT,
+            orig_message_id INTEGER,
+            status TEXT,
+            created_at INTEGER,
+            archived_at INTEGER,
+            payload BLOB
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_created ON posts_archive(created_at)")
+
+    marks = ",".join("?" * len(ARCHIVE_FINAL_STATUSES))
+    archived = 0
+    leftover_media = []
+    now = int(time.time())
+    while True:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            f"""
+            SELECT * FROM posts
+            WHERE archived=0 AND created_at < ? AND status IN ({marks})
+            ORDER BY created_at
+            LIMIT ?
+            """,
+            (cutoff_ts, *ARCHIVE_FINAL_STATUSES, batch)
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+        if not rows:
+            conn.commit()
+            break
+        for r in rows:
+            cur.execute("SELECT idx, path, mime, size, file_id FROM post_media WHERE post_id=? ORDER BY idx", (r["id"],))
+            r["media"] = [dict(m) for m in cur.fetchall()]
+            cur.execute("SELECT phash, dhash FROM post_image_hashes WHERE post_id=? ORDER BY idx", (r["id"],))
+            hashes = cur.fetchall()
+            r["phashes"] = [h["phash"] for h in hashes]
+            r["dhashes"] = [h["dhash"] for h in hashes]
+            cur.execute("SELECT * FROM post_timings WHERE post_id=?", (r["id"],))
+            timing = cur.fetchone()
+            r["timings"] = dict(timing) if timing else None
+
+        cur.executemany(
+            "INSERT OR REPLACE INTO archive.posts_archive"
+            "(id, channel, orig_message_id, status, created_at, archived_at, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (r["id"], r["channel"], r["orig_message_id"], r["status"], r["created_at"], now,
+                 zlib.compress(json.dumps(r, ensure_ascii=False).encode("utf-8"), 9))
+                for r in rows
+            ]
+        )
+        ids = [(r["id"],) for r in rows]
+        cur.executemany(
+            "INSERT OR IGNORE INTO posts_archived_keys(channel, orig_message_id, created_at) VALUES (?, ?, ?)",
+            [(r["channel"], r["orig_message_id"], r["created_at"]) for r in rows]
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO posts_archived_ids(channel_id, orig_message_id, created_at) VALUES (?, ?, ?)",
+            [(r["channel_id"], r["orig_message_id"], r["created_at"]) for r in rows if r["channel_id"] is not None]
+        )
+        # archived=1 перед удалением: триггер статистики не вычитает архивные посты;
+        # дочерние строки (медиа, хэши, сообщения владельца) удаляет триггер posts_children_ad
+        cur.executemany("UPDATE posts SET archived=1 WHERE id=?", ids)
+        cur.executemany("DELETE FROM posts WHERE id=?", ids)
+        conn.commit()
+
+        archived += len(rows)
+        for r in rows:
+            leftover_media.extend(m["path"] for m in r["media"] if m["path"])
+
+    cur.execute("DETACH DATABASE archive")
+    cur.execute("DELETE FROM photo_keys WHERE created_at < ?", (cutoff_ts,))
+    conn.commit()
+    conn.close()
+    return archived, leftover_media
+
+
+def get_archived_post(post_id: int, archive_file: str):
+    conn = sqlite3.connect(archive_file, timeout=30)
+    cur = conn.cursor()
     try:
-        img = Image.open(path)
-        return str(imagehash.phash(img))
-    except Exception:
+        cur.execute("SELECT payload FROM posts_archive WHERE id=?", (post_id,))
+        row = cur.fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+    if not row:
         return None
+    return json.loads(zlib.decompress(row[0]).decode("utf-8"))
 
 
-def is_similar_image_duplicate(new_paths, threshold=12) -> bool:
+def incremental_vacuum(pages: int = 0) -> int:
+    """Возвращает ОС свободные страницы; pages=0 — все. Возвращает число свободных страниц до."""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT image_hashes FROM posts WHERE image_hashes IS NOT NULL")
-    rows = cur.fetchall()
+    cur.execute("PRAGMA auto_vacuum")
+    if cur.fetchone()[0] != 2:
+        # полный VACUUM рядом с работающими воркерами не делаем: его выполняет init_db
+        conn.close()
+        return 0
+    cur.execute("PRAGMA freelist_count")
+    free = cur.fetchone()[0]
+    # executescript прогоняет прагму до конца; execute освободил бы одну страницу
+    if pages > 0:
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    else:
+        conn.executescript("PRAGMA incremental_vacuum;")
     conn.close()
+    return free
 
-    # читаем хэши новых изображений
-    new_hashes = []
-    for p in new_paths:
-        h = calc_image_hash(p)
-        if h:
-            new_hashes.append(imagehash.hex_to_hash(h))
 
-    if not new_hashes:
+def is_product_key_recent(keys: List[str], within_seconds: int) -> bool:
+    """Был ли недавно пост с тем же товаром (поиск по первичному ключу)."""
+    if not keys:
         return False
+    since_ts = int(time.time()) - int(within_seconds)
+    marks = ",".join("?" * len(keys))
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT 1 FROM product_keys WHERE key IN ({marks}) AND seen_at >= ? LIMIT 1",
+        (*keys, since_ts)
+    )
+    res = cur.fetchone()
+    conn.close()
+    return res is not None
 
-    # сравниваем с существующими
-    for row in rows:
-        if not row["image_hashes"]:
-            continue
 
-        try:
-            old_hashes = json.loads(row["image_hashes"])
-        except:
-            continue
-
-        for oh in old_hashes:
-            old_h = imagehash.hex_to_hash(oh)
-            for nh in new_hashes:
-                dist = old_h - nh
-                if dist <= threshold:
-                    print(f"[IMG DUP] расстояние = {dist}")
-                    return True
+def prune_product_keys(ttl_seconds: int) -> int:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM product_keys WHERE seen_at < ?", (int(time.time()) - int(ttl_seconds),))
+    removed = cur.rowcount
+    conn.commit()
+    conn.close()
+    return removed
 
-    return False
+
+def find_fingerprint_collision(fingerprints: List[str], window_seconds: int) -> Optional[str]:
+    """Первый из отпечатков, который уже занят живым постом за window_seconds (из-за него save_post вернул None)."""
+    if not fingerprints:
+        return None
+    conn = get_conn()
+    cur = conn.cursor()
+    marks = ",".join("?" * len(fingerprints))
+    cur.execute(
+        f"SELECT key FROM post_fingerprints WHERE key IN ({marks}) AND created_at >= ? ORDER BY key LIMIT 1",
+        (*fingerprints, int(time.time()) - int(window_seconds))
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row["key"] if row else None
+
+
+def prune_fingerprints(older_than_seconds: int) -> int:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM post_fingerprints WHERE created_at < ?",
+                (int(time.time()) - int(older_than_seconds),))
+    removed = cur.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+
+def is_photo_key_recent(photo_ids: List[int], within_seconds: int) -> bool:
+    """Точное совпадение по id фото Telegram: репост того же файла."""
+    if not photo_ids:
+        return False
+    since_ts = int(time.time()) - int(within_seconds)
+    marks = ",".join("?" * len(photo_ids))
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT 1 FROM photo_keys WHERE photo_id IN ({marks}) AND created_at >= ? LIMIT 1",
+        (*photo_ids, since_ts)
+    )
+    res = cur.fetchone()
+    conn.close()
+    return res is not None
 
 
 def is_exact_duplicate_recent(text: str, within_seconds: int) -> bool:
@@ -308,11 +1294,11 @@ def is_exact_duplicate_recent(text: str, within_seconds: int) -> bool:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        """
+        f"""
         SELECT text
         FROM posts
         WHERE created_at >= ?
-          AND status IN ('pending', 'published')
+          AND status IN {_LIVE_SQL}
         """,
         (since_ts,)
     )
@@ -325,48 +1311,64 @@ def is_exact_duplicate_recent(text: str, within_seconds: int) -> bool:
     return False
 
 
-def is_similar_image_duplicate_recent(new_paths, threshold=12, within_seconds=10800) -> bool:
-    """Проверяет дубликаты изображений только в свежем окне времени."""
-    since_ts = int(time.time()) - int(within_seconds)
+def is_similar_image_duplicate_recent(new_paths, threshold=12, within_seconds=10800,
+                                     dhash_threshold=None, image_hashes=None) -> bool:
+    """Проверяет дубликаты изображений только в свежем окне времени.
+
+    image_hashes — уже посчитанные пары (phash, dhash) для new_paths, чтобы не декодировать их повторно.
+    """
+    if image_hashes is None:
+        image_hashes = hashing.image_hashes(new_paths)
+    return is_similar_hash_duplicate_recent([h for h in image_hashes if h], threshold=threshold,
+                                            within_seconds=within_seconds, dhash_threshold=dhash_threshold)
+
+
+def _find_similar_hash(new_hashes, threshold: int, since_ts: int, dhash_threshold: Optional[int] = None):
+    """(post_id, расстояние pHash) ближайшего живого поста не дальше threshold или None.
+
+    new_hashes — пары hex (phash, dhash) или просто hex pHash. С dhash_threshold
+    совпадение засчитывается, только если близки оба хэша; у старых строк без
+    dHash (и у новых хэшей без него) проверяется один pHash.
+    Фильтр идёт внутри SQLite: окно по created_at читается покрывающим индексом
+    idx_post_image_hashes_win, расстояние считает функция hamming().
+    """
+    new_ints = [h for h in (_hash_ints(x) for x in new_hashes or []) if h]
+    if not new_ints:
+        return None
+
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT image_hashes
-        FROM posts
-        WHERE image_hashes IS NOT NULL
-          AND created_at >= ?
-          AND status IN ('pending', 'published')
-        """,
-        (since_ts,)
-    )
-    rows = cur.fetchall()
+    found = None
+    for ph, dh in new_ints:
+        check_d = int(dh is not None and dhash_threshold is not None)
+        cur.execute(
+            f"""
+            SELECT h.post_id, hamming(h.phash, ?) AS dist
+            FROM post_image_hashes h
+            JOIN posts p ON p.id = h.post_id
+            WHERE h.created_at >= ?
+              AND hamming(h.phash, ?) <= ?
+              AND (? = 0 OR h.dhash IS NULL OR hamming(h.dhash, ?) <= ?)
+              AND p.status IN {_LIVE_SQL}
+            ORDER BY dist
+            LIMIT 1
+            """,
+            (ph, since_ts, ph, threshold, check_d, dh, dhash_threshold)
+        )
+        row = cur.fetchone()
+        if row:
+            found = (row["post_id"], row["dist"])
+            break
     conn.close()
+    return found
 
-    new_hashes = []
-    for p in new_paths:
-        h = calc_image_hash(p)
-        if h:
-            new_hashes.append(imagehash.hex_to_hash(h))
 
-    if not new_hashes:
-        return False
-
-    for row in rows:
-        if not row["image_hashes"]:
-            continue
+def is_similar_hash_duplicate_recent(new_hashes, threshold=12, within_seconds=10800, dhash_threshold=None) -> bool:
+    """То же по уже посчитанным хэшам (пары hex phash/dhash) — например, по превью до скачивания."""
+    found = _find_similar_hash(new_hashes, threshold, int(time.time()) - int(within_seconds), dhash_threshold)
+    if found:
+        print(f"[IMG DUP RECENT] post {found[0]}, расстояние = {found[1]}")
+        return True
+    return False
 
-        try:
-            old_hashes = json.loads(row["image_hashes"])
-        except Exception:
-            continue
-
-        for oh in old_hashes:
-            old_h = imagehash.hex_to_hash(oh)
-            for nh in new_hashes:
-                dist = old_h - nh
-                if dist <= threshold:
-                    print(f"[IMG DUP RECENT] расстояние = {dist}")
-                    return True
 
-    return False
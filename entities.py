@@ -0,0 +1,216 @@
+# entities.py
+"""Форматирование постов нативными сущностями Bot API вместо HTML.
+
+Telethon отдаёт текст и список сущностей со смещениями в UTF-16 — ровно
+в том виде, который принимает Bot API (entities / caption_entities).
+Поэтому текст поста хранится как есть, сущности — списком словарей
+{"type", "offset", "length", ...}, и при отправке ничего не экранируется
+и не парсится. Все длины и смещения здесь — в UTF-16 code units, как
+в Telegram: лимиты 1024 (подпись) и 4096 (сообщение) считаются так же.
+"""
+from html import escape
+
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+# имя класса Telethon -> тип сущности Bot API
+_TELETHON_TYPES = {
+    "MessageEntityBold": "bold",
+    "MessageEntityItalic": "italic",
+    "MessageEntityUnderline": "underline",
+    "MessageEntityStrike": "strikethrough",
+    "MessageEntitySpoiler": "spoiler",
+    "MessageEntityBlockquote": "blockquote",
+    "MessageEntityCode": "code",
+    "MessageEntityPre": "pre",
+    "MessageEntityTextUrl": "text_link",
+    "MessageEntityUrl": "url",
+    "MessageEntityEmail": "email",
+    "MessageEntityPhone": "phone_number",
+    "MessageEntityMention": "mention",
+    "MessageEntityHashtag": "hashtag",
+    "MessageEntityCashtag": "cashtag",
+    "MessageEntityBotCommand": "bot_command",
+    "MessageEntityMentionName": "text_mention",
+}
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _utf16_positions(text: str):
+    """positions[i] — смещение в UTF-16 перед символом text[i]; последний элемент — длина."""
+    positions = [0]
+    for ch in text:
+        positions.append(positions[-1] + (2 if ord(ch) >= 0x10000 else 1))
+    return positions
+
+
+def from_telethon(entities):
+    """Сущности Telethon -> список словарей Bot API. Неизвестные типы отбрасываются."""
+    result = []
+    for ent in entities or []:
+        kind = _TELETHON_TYPES.get(type(ent).__name__)
+        if not kind or ent.length <= 0:
+            continue
+        item = {"type": kind, "offset": ent.offset, "length": ent.length}
+        if kind == "text_link":
+            item["url"] = ent.url
+        elif kind == "pre" and getattr(ent, "language", None):
+            item["language"] = ent.language
+        elif kind == "text_mention":
+            item["user"] = {"id": ent.user_id, "is_bot": False, "first_name": ""}
+        result.append(item)
+    result.sort(key=lambda e: (e["offset"], -e["length"]))
+    return result
+
+
+def shift(entities, delta: int):
+    return [dict(e, offset=e["offset"] + delta) for e in entities or []]
+
+
+def delete_spans(text: str, entities, spans):
+    """Удаляет из текста участки spans (индексы Python, [start, end)) и сдвигает сущности.
+
+    Сущность, попавшая в удалённый участок целиком, пропадает; частично — укорачивается.
+    """
+    spans = sorted((s, e) for s, e in spans if e > s)
+    if not spans:
+        return text, list(entities or [])
+    positions = _utf16_positions(text)
+    removed = [(positions[s], positions[e]) for s, e in spans]
+
+    def new_pos(x):
+        gone = 0
+        for s, e in removed:
+            if s >= x:
+                break
+            gone += min(e, x) - s
+        return x - gone
+
+    result = []
+    for ent in entities or []:
+        start = new_pos(ent["offset"])
+        end = new_pos(ent["offset"] + ent["length"])
+        if end > start:
+            result.append(dict(ent, offset=start, length=end - start))
+
+    parts = []
+    last = 0
+    for s, e in spans:
+        if s > last:
+            parts.append(text[last:s])
+        last = max(last, e)
+    parts.append(text[last:])
+    return "".join(parts), result
+
+
+def strip(text: str, entities):
+    """str.strip() с пересчётом сущностей."""
+    head = len(text) - len(text.lstrip())
+    tail = len(text.rstrip())
+    if head >= tail:
+        return "", []
+    return delete_spans(text, entities, [(0, head), (tail, len(text))])
+
+
+def _clip(entities, start: int, end: int):
+    result = []
+    for ent in entities:
+        s = max(ent["offset"], start)
+        e = min(ent["offset"] + ent["length"], end)
+        if e > s:
+            result.append(dict(ent, offset=s - start, length=e - s))
+    return result
+
+
+def _break_point(text: str, positions, start: int, limit: int) -> int:
+    """Индекс Python, на котором резать кусок, начинающийся с start, чтобы уложиться в limit."""
+    hard = start
+    while hard < len(text) and positions[hard + 1] - positions[start] <= limit:
+        hard += 1
+    if hard >= len(text):
+        return len(text)
+    if hard == start:
+        return start + 1
+    # не режем посреди строки/слова, если можно иначе, но и не дробим слишком мелко
+    floor = start + (hard - start) // 2
+    for sep in ("\n", " "):
+        br = text.rfind(sep, floor, hard)
+        if br > start:
+            return br
+    return hard
+
+
+def split(text: str, entities, limit: int = MESSAGE_LIMIT, first_limit: int = None):
+    """Режет текст на куски не длиннее limit UTF-16 (первый — first_limit).
+
+    Возвращает [(текст, сущности)], сущности каждого куска смещены к его началу;
+    сущность на стыке продолжается в следующем куске.
+    """
+    entities = list(entities or [])
+    positions = _utf16_positions(text)
+    chunks = []
+    start = 0
+    current = first_limit or limit
+    while start < len(text):
+        while start < len(text) and text[start].isspace():
+            start += 1
+        if start >= len(text):
+            break
+        end = _break_point(text, positions, start, current)
+        stop = end
+        while stop > start and text[stop - 1].isspace():
+            stop -= 1
+        chunks.append((text[start:stop], _clip(entities, positions[start], positions[stop])))
+        start = end
+        current = limit
+    return chunks
+
+
+def to_html(text: str, entities) -> str:
+    """HTML для предпросмотров и сравнения дублей (пересекающиеся сущности не вкладываются)."""
+    positions = _utf16_positions(text)
+    index = {u: i for i, u in enumerate(positions)}
+    html = ""
+    last = 0
+    for ent in sorted(entities or [], key=lambda e: e["offset"]):
+        start = index.get(ent["offset"])
+        end = index.get(ent["offset"] + ent["length"])
+        if start is None or end is None or end <= last:
+            continue
+        start = max(start, last)
+
+        html += escape(text[last:start])
+        part = escape(text[start:end])
+        kind = ent["type"]
+        if kind == "text_link":
+            html += f'<a href="{escape(ent["url"])}">{part}</a>'
+        elif kind == "url":
+            html += f'<a href="{part}">{part}</a>'
+        elif kind == "bold":
+            html += f"<b>{part}</b>"
+        elif kind == "italic":
+            html += f"<i>{part}</i>"
+        elif kind == "code":
+            html += f"<code>{part}</code>"
+        elif kind == "pre":
+            html += f"<pre>{part}</pre>"
+        elif kind == "text_mention":
+            html += f'<a href="tg://user?id={ent["user"]["id"]}">{part}</a>'
+        elif kind == "phone_number":
+            html += f'<a href="tel:{part}">{part}</a>'
+        elif kind == "email":
+            html += f'<a href="mailto:{part}">{part}</a>'
+        elif kind == "strikethrough":
+            html += f"<s>{part}</s>"
+        elif kind == "underline":
+            html += f"<u>{part}</u>"
+        else:
+            html += part
+        last = end
+
+    if last < len(text):
+        html += escape(text[last:])
+    return html
@@ -0,0 +1,399 @@
+# fake_bot_api.py
+"""Локальная замена Bot API для нагрузочных тестов публикации без сети.
+
+    python fake_bot_api.py [--port 8081] [--latency 80] [--jitter 30]
+
+и в config.py: BOT_API_URL = "http://127.0.0.1:8081/bot{0}/{1}".
+
+Реализованы методы, которыми пользуется bot.py: sendMessage, sendMediaGroup,
+copyMessage, deleteMessage(s), answerCallbackQuery, getUpdates, а также
+editMessageText, sendDocument, getMe, setWebhook/deleteWebhook. Ответы —
+в формате Bot API, так что telebot разбирает их как настоящие.
+
+Ограничения как у Telegram: в личный чат не чаще chat_rate сообщений в
+секунду (с запасом chat_burst), в группу/канал — group_per_minute в минуту,
+всего — global_rate в секунду; альбом считается по числу файлов. При
+превышении — 429 Too Many Requests с parameters.retry_after.
+
+С local=True (--local) сервер, как telegram-bot-api --local, принимает
+медиа путём file:///... и сам читает файл; без него такой путь — 400.
+
+Служебные адреса: GET /_stats — счётчики запросов, 429 и сообщений по
+чатам; POST /_updates — положить апдейт (JSON) в очередь getUpdates.
+Сервер можно поднять и из кода: FakeBotAPI(...).start().
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# методы, которые Telegram считает отправкой сообщений
+_SEND_METHODS = {"sendmessage", "sendmediagroup", "copymessage", "senddocument", "sendphoto"}
+
+
+class _Bucket:
+    """Token bucket: rate токенов в секунду, не больше burst."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, n: float = 1) -> float:
+        """Списывает n токенов; если не хватает — ничего не списывает и возвращает, сколько ждать.
+
+        Пачка больше burst (альбом из 10 фото) проходит при полном ведре и уводит его в минус.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        need = min(n, self.burst)
+        if self.tokens >= need:
+            self.tokens -= n
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, description: str, retry_after: int = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency_ms: float = 0,
+                 jitter_ms: float = 0, chat_rate: float = 1.0, chat_burst: float = 3,
+                 group_per_minute: float = 20, global_rate: float = 30, max_poll: float = 2.0,
+                 local: bool = False):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_poll = max_poll
+        self.local = local
+
+        self._lock = threading.Lock()
+        self._global = _Bucket(global_rate, global_rate)
+        self._chats = {}
+        self._next_id = defaultdict(lambda: itertools.count(1))
+        self._messages = defaultdict(dict)       # чат -> {message_id: сообщение}
+        self._file_ids = itertools.count(1)
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._updates_cond = threading.Condition(self._lock)
+
+        self.requests = Counter()                # метод -> запросов
+        self.flood = Counter()                   # метод -> ответов 429
+        self.sent = Counter()                    # чат -> отправленных сообщений
+        self._server = None
+        self._thread = None
+
+    # ---------- запуск ----------
+
+    def start(self):
+        """Запускает сервер в фоновом потоке; port=0 — любой свободный."""
+        api = self
+
+        class Handler(_Handler):
+            fake = api
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def api_url(self) -> str:
+        """Значение для telebot.apihelper.API_URL / BOT_API_URL."""
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "flood_429": dict(self.flood),
+                "sent_per_chat": {str(k): v for k, v in self.sent.items()},
+                "pending_updates": len(self._updates),
+            }
+
+    def inject_update(self, update: dict):
+        """Кладёт апдейт (message, callback_query, ...) в очередь getUpdates."""
+        with self._updates_cond:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+        return update["update_id"]
+
+    # ---------- ограничения ----------
+
+    @staticmethod
+    def _chat_type(chat_id) -> str:
+        text = str(chat_id)
+        if text.startswith("@") or text.startswith("-100"):
+            return "channel"
+        return "group" if text.startswith("-") else "private"
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if self._chat_type(chat_id) == "private":
+                bucket = _Bucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = _Bucket(self.group_per_minute / 60.0, self.group_per_minute / 6.0)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _throttle(self, method: str, chat_id, count: int):
+        wait = self._global.take(count)
+        if not wait:
+            wait = self._chat_bucket(chat_id).take(count)
+            if wait:
+                self._global.tokens += count     # глобальный лимит не тратим на отказ
+        if wait:
+            self.flood[method] += 1
+            retry_after = max(1, math.ceil(wait))
+            raise ApiError(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+
+    # ---------- сообщения ----------
+
+    def _chat(self, chat_id):
+        kind = self._chat_type(chat_id)
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            return {"id": -1000000000000 - zlib.crc32(chat_id.encode()), "type": kind, "username": chat_id[1:]}
+        return {"id": int(chat_id), "type": kind}
+
+    def _file(self, kind: str):
+        file_id = f"fake-{kind}-{next(self._file_ids)}"
+        return {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}
+
+    def _store(self, chat_id, **content):
+        message_id = next(self._next_id[chat_id])
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": {"id": 1, "is_bot": True, "first_name": "fake"},
+        }
+        message.update({k: v for k, v in content.items() if v is not None})
+        self._messages[chat_id][message_id] = message
+        self.sent[chat_id] += 1
+        return message
+
+    def _media_message(self, chat_id, item: dict, files: dict):
+        kind = item.get("type", "photo")
+        media = item.get("media", "")
+        if isinstance(media, str) and media.startswith("attach://") and media[9:] not in files:
+            raise ApiError(400, f"Bad Request: file {media} not found in the request")
+        if isinstance(media, str) and media.startswith("file://"):
+            if not self.local:
+                raise ApiError(400, "Bad Request: wrong remote file identifier specified: "
+                                    "Wrong character in the string")
+            try:
+                with open(media[7:], "rb") as f:
+                    f.read()
+            except OSError:
+                raise ApiError(400, "Bad Request: file not found")
+        content = {"caption": item.get("caption"), "caption_entities": item.get("caption_entities")}
+        if kind == "photo":
+            content["photo"] = [self._file("photo")]
+        else:
+            content[kind] = dict(self._file(kind), mime_type=f"{kind}/fake")
+        return self._store(chat_id, **content)
+
+    def call(self, method: str, params: dict, files: dict):
+        """Выполняет метод Bot API. Возвращает result или бросает ApiError."""
+        name = method.lower()
+        # из query string приходят строки, из JSON — числа: ключи чатов всегда строки
+        chat_id = str(params["chat_id"]) if params.get("chat_id") is not None else None
+        with self._lock:
+            self.requests[method] += 1
+            if name in _SEND_METHODS:
+                if chat_id is None:
+                    raise ApiError(400, "Bad Request: chat_id is empty")
+                media = json.loads(params.get("media") or "[]") if name == "sendmediagroup" else []
+                if name == "sendmediagroup" and not 2 <= len(media) <= 10:
+                    raise ApiError(400, "Bad Request: wrong number of media in the group")
+                self._throttle(method, chat_id, max(1, len(media)))
+
+            if name == "sendmessage":
+                if not (params.get("text") or "").strip():
+                    raise ApiError(400, "Bad Request: message text is empty")
+                if len(params["text"].encode("utf-16-le")) // 2 > 4096:
+                    raise ApiError(400, "Bad Request: message is too long")
+                return self._store(chat_id, text=params["text"], entities=_json(params.get("entities")),
+                                   reply_markup=_json(params.get("reply_markup")))
+            if name == "sendmediagroup":
+                return [self._media_message(chat_id, item, files) for item in media]
+            if name in ("senddocument", "sendphoto"):
+                kind = "document" if name == "senddocument" else "photo"
+                return self._media_message(chat_id, {"type": kind, "caption": params.get("caption")}, files)
+            if name == "copymessage":
+                source = self._messages[str(params.get("from_chat_id"))].get(int(params.get("message_id", 0)))
+                if source is None:
+                    raise ApiError(400, "Bad Request: message to copy not found")
+                copy = {k: v for k, v in source.items() if k not in ("message_id", "date", "chat")}
+                return {"message_id": self._store(chat_id, **copy)["message_id"]}
+            if name == "deletemessage":
+                if self._messages[chat_id].pop(int(params.get("message_id", 0)), None) is None:
+                    raise ApiError(400, "Bad Request: message to delete not found")
+                return True
+            if name == "deletemessages":
+                for mid in _json(params.get("message_ids")) or []:
+                    self._messages[chat_id].pop(int(mid), None)
+                return True
+            if name == "editmessagetext":
+                message = self._messages[chat_id].get(int(params.get("message_id", 0)))
+                if message is None:
+                    raise ApiError(400, "Bad Request: message to edit not found")
+                message["text"] = params.get("text")
+                message["reply_markup"] = _json(params.get("reply_markup"))
+                return message
+            if name == "answercallbackquery":
+                return True
+            if name in ("setwebhook", "deletewebhook"):
+                return True
+            if name == "getme":
+                return {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+            if name == "getupdates":
+                return self._get_updates(params)
+        raise ApiError(404, "Not Found: method not found")
+
+    def _get_updates(self, params):
+        """Вызывается под self._lock. Long polling — не дольше max_poll секунд."""
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        timeout = min(float(params.get("timeout") or 0), self.max_poll)
+        if not self._updates and timeout > 0:
+            self._updates_cond.wait(timeout)
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+
+def _json(value):
+    if value is None or not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None   # FakeBotAPI, подставляется в start()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_request(self):
+        """Параметры из query string и тела (urlencoded, JSON или multipart) + имена файлов."""
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        files = {}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        ctype = self.headers.get("Content-Type") or ""
+        if body and ctype.startswith("multipart/form-data"):
+            message = BytesParser(policy=email_policy).parsebytes(
+                b"Content-Type: " + ctype.encode("latin-1") + b"\r\n\r\n" + body
+            )
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename() is not None:
+                    files[name] = len(part.get_payload(decode=True) or b"")
+                else:
+                    params[name] = part.get_content()
+        elif body and ctype.startswith("application/json"):
+            params.update(json.loads(body.decode("utf-8")))
+        elif body:
+            params.update(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+        return url.path, params, files
+
+    def _handle(self):
+        path, params, files = self._read_request()
+        fake = self.fake
+        if path == "/_stats":
+            return self._reply(200, fake.stats())
+        if path == "/_updates":
+            return self._reply(200, {"ok": True, "result": fake.inject_update(params)})
+
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+        if fake.latency_ms or fake.jitter_ms:
+            delay = fake.latency_ms + random.uniform(-fake.jitter_ms, fake.jitter_ms)
+            time.sleep(max(0.0, delay) / 1000.0)
+        try:
+            result = fake.call(parts[1], params, files)
+        except ApiError as e:
+            payload = {"ok": False, "error_code": e.code, "description": e.description}
+            if e.retry_after is not None:
+                payload["parameters"] = {"retry_after": e.retry_after}
+            return self._reply(e.code, payload)
+        except (ValueError, TypeError, KeyError) as e:
+            return self._reply(400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"})
+        self._reply(200, {"ok": True, "result": result})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Локальная замена Bot API для тестов без сети")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency", type=float, default=0, help="задержка ответа, мс")
+    ap.add_argument("--jitter", type=float, default=0, help="разброс задержки, ± мс")
+    ap.add_argument("--chat-rate", type=float, default=1.0, help="сообщений/с в личный чат")
+    ap.add_argument("--chat-burst", type=float, default=3)
+    ap.add_argument("--group-per-minute", type=float, default=20, help="сообщений/мин в группу или канал")
+    ap.add_argument("--global-rate", type=float, default=30, help="сообщений/с всего")
+    ap.add_argument("--local", action="store_true", help="принимать медиа путём file:// (как --local)")
+    args = ap.parse_args()
+
+    fake = FakeBotAPI(args.host, args.port, args.latency, args.jitter, args.chat_rate,
+                      args.chat_burst, args.group_per_minute, args.global_rate, local=args.local).start()
+    print(f"🧪 Fake Bot API слушает {args.host}:{fake.port}")
+    print(f"   BOT_API_URL = \"{fake.api_url}\"")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# hashing.py
+"""Перцептивные хэши картинок: pHash и dHash пачкой на numpy.
+
+Раньше каждая фотография декодировалась в полном разрешении только ради
+того, чтобы imagehash ужал её до 32×32. Здесь JPEG декодируется сразу
+уменьшенным (draft-режим Pillow: декодер пропускает высокие частоты и
+цветность), а DCT для pHash и разности для dHash считаются одной
+матричной операцией на весь альбом.
+
+Алгоритмы те же, что в imagehash (phash: DCT 32×32 -> 8×8 против медианы,
+dhash: соседние пиксели 9×8), и hex тот же по формату, поэтому новые хэши
+сравнимы со старыми; расхождение из-за уменьшенного декодирования — пара бит.
+
+numpy и Pillow импортируются при первом хэшировании (или в warmup() в
+фоновом потоке после запуска), а не при импорте database, — иначе они
+задерживают старт бота и парсера.
+"""
+import io
+import threading
+import time
+
+HASH_SIZE = 8
+_PHASH_SIDE = HASH_SIZE * 4       # как highfreq_factor=4 в imagehash
+_DRAFT_SIDE = _PHASH_SIDE * 2     # декодер JPEG не уменьшает картинку меньше этого
+
+np = None
+Image = None
+_DCT = None
+_load_lock = threading.Lock()
+
+
+def _load():
+    global np, Image, _DCT
+    if _DCT is not None:
+        return
+    with _load_lock:
+        if _DCT is not None:
+            return
+        import numpy
+        from PIL import Image as pil_image
+        np, Image = numpy, pil_image
+        # матрица DCT-II (как scipy.fftpack.dct без нормировки), нужны только первые 8 частот
+        n = numpy.arange(_PHASH_SIDE)
+        _DCT = 2 * numpy.cos(
+            numpy.pi * numpy.arange(HASH_SIZE)[:, None] * (2 * n[None, :] + 1) / (2 * _PHASH_SIDE)
+        )
+
+
+def _decode(source):
+    """(пиксели 32×32 для pHash, пиксели 8×9 для dHash) или None, если картинка не читается."""
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        img.draft("L", (_DRAFT_SIDE, _DRAFT_SIDE))   # для не-JPEG ничего не делает
+        img = img.convert("L")
+        p = img.resize((_PHASH_SIDE, _PHASH_SIDE), Image.LANCZOS)
+        d = img.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+        return np.asarray(p, dtype=np.float64), np.asarray(d, dtype=np.int16)
+    except Exception as e:
+        print(f"[HASH ERROR] {e}")
+        return None
+
+
+def _to_hex(bits):
+    """(N, 8, 8) bool -> hex-строки в формате str(imagehash.ImageHash)."""
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [row.tobytes().hex() for row in packed]
+
+
+def image_hashes(sources):
+    """[(phash_hex, dhash_hex) | None] для списка путей или bytes, в том же порядке."""
+    _load()
+    decoded = [_decode(s) for s in sources or []]
+    ok = [i for i, d in enumerate(decoded) if d is not None]
+    result = [None] * len(decoded)
+    if not ok:
+        return result
+
+    pixels = np.stack([decoded[i][0] for i in ok])            # (N, 32, 32)
+    low = _DCT @ pixels @ _DCT.T                                # (N, 8, 8)
+    med = np.median(low.reshape(len(ok), -1), axis=1)
+    phashes = _to_hex(low > med[:, None, None])
+
+    small = np.stack([decoded[i][1] for i in ok])              # (N, 8, 9)
+    dhashes = _to_hex(small[:, :, 1:] > small[:, :, :-1])
+
+    for i, ph, dh in zip(ok, phashes, dhashes):
+        result[i] = (ph, dh)
+    return result
+
+
+def phash(source):
+    """pHash одной картинки (hex) или None."""
+    pair = image_hashes([source])[0]
+    return pair[0] if pair else None
+
+
+def warmup():
+    """Загружает numpy/Pillow и прогоняет одну картинку, чтобы первый пост не ждал импорта."""
+    started = time.perf_counter()
+    _load()
+    buf = io.BytesIO()
+    Image.new("RGB", (_DRAFT_SIDE * 4, _DRAFT_SIDE * 4), (128, 64, 32)).save(buf, "JPEG")
+    image_hashes([buf.getvalue()])
+    return time.perf_counter() - started
+
+
+def start_warmup(on_done=None):
+    """warmup() в фоновом потоке; on_done(секунды) вызывается по завершении."""
+    def run():
+        try:
+            elapsed = warmup()
+        except Exception as e:
+            print(f"[HASH ERROR] Прогрев не удался: {e}")
+            return
+        if on_done:
+            on_done(elapsed)
+
+    t = threading.Thread(target=run, name="hashing-warmup", daemon=True)
+    t.start()
+    return t
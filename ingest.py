@@ -0,0 +1,170 @@
+# ingest.py
+"""Ограниченная очередь входящих сообщений с честным обходом каналов.
+
+Обработчик NewMessage больше ничего не скачивает сам: он кладёт событие
+в FairQueue, а её разбирают INGEST_WORKERS воркеров. У каждого канала своя
+подочередь, воркеры берут сообщения по кругу, поэтому всплеск в одном
+шумном канале не задерживает тихие. Размер очереди ограничен
+INGEST_QUEUE_MAX; при переполнении действует INGEST_OVERFLOW_POLICY:
+
+- "defer" — обработчик ждёт, пока освободится место;
+- "drop_oldest" — выбрасывается самое старое сообщение;
+- "drop_text_first" — сначала выбрасываются самые старые сообщения без
+  медиа, и только если таких нет — самое старое вообще.
+"""
+import asyncio
+import time
+from collections import deque
+
+from config import INGEST_QUEUE_MAX, INGEST_WORKERS, INGEST_OVERFLOW_POLICY
+from database import record_skip
+
+POLICIES = ("defer", "drop_oldest", "drop_text_first")
+
+
+class FairQueue:
+    def __init__(self, maxsize: int, policy: str = "defer", on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"неизвестная политика переполнения: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+        self._channels = {}        # канал -> deque[(enqueued_at, has_media, item)]
+        self._order = deque()      # каналы, у которых есть сообщения, в порядке обхода
+        self._size = 0
+        self._cond = asyncio.Condition()
+
+        self.max_depth = 0
+        self.dropped = 0
+        self.waits = deque(maxlen=500)  # сколько сообщения пролежали в очереди, с
+
+    def __len__(self):
+        return self._size
+
+    def _remove(self, channel, entry):
+        q = self._channels[channel]
+        q.remove(entry)
+        if not q:
+            del self._channels[channel]
+            self._order.remove(channel)
+        self._size -= 1
+
+    def _victim(self, has_media: bool):
+        """(канал, запись) для вытеснения или None — тогда выбрасывается новое сообщение."""
+        oldest = None
+        oldest_text = None
+        for channel, q in self._channels.items():
+            if oldest is None or q[0][0] < oldest[1][0]:
+                oldest = (channel, q[0])
+            if self.policy == "drop_text_first":
+                for entry in q:
+                    if not entry[1]:
+                        if oldest_text is None or entry[0] < oldest_text[1][0]:
+                            oldest_text = (channel, entry)
+                        break
+        if self.policy == "drop_text_first":
+            if oldest_text is not None:
+                return oldest_text
+            if not has_media:
+                return None
+        return oldest
+
+    def _drop(self, channel, item):
+        self.dropped += 1
+        if self.on_drop:
+            self.on_drop(channel, item)
+
+    async def put(self, channel, item, has_media: bool = False) -> bool:
+        """Кладёт сообщение в очередь. False — сообщение выброшено из-за переполнения."""
+        async with self._cond:
+            if self._size >= self.maxsize:
+                if self.policy == "defer":
+                    await self._cond.wait_for(lambda: self._size < self.maxsize)
+                else:
+                    victim = self._victim(has_media)
+                    if victim is None:
+                        self._drop(channel, item)
+                        return False
+                    self._remove(*victim)
+                    self._drop(victim[0], victim[1][2])
+
+            if channel not in self._channels:
+                self._channels[channel] = deque()
+                self._order.append(channel)
+            self._channels[channel].append((time.monotonic(), has_media, item))
+            self._size += 1
+            self.max_depth = max(self.max_depth, self._size)
+            self._cond.notify_all()
+            return True
+
+    async def get(self):
+        """Следующее сообщение: по одному из каждого канала по кругу."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._size > 0)
+            channel = self._order.popleft()
+            q = self._channels[channel]
+            enqueued_at, _, item = q.popleft()
+            if q:
+                self._order.append(channel)
+            else:
+                del self._channels[channel]
+            self._size -= 1
+            self.waits.append(time.monotonic() - enqueued_at)
+            self._cond.notify_all()
+            return item
+
+
+def _log_drop(channel, item):
+    print(f"[INGEST] Очередь переполнена, сообщение из @{channel} пропущено")
+    try:
+        record_skip(channel, "overload")
+    except Exception as e:
+        print(f"[STATS ERROR] {e}")
+
+
+async def _worker(queue: FairQueue, process, gate=None):
+    if gate is not None:
+        # сообщения копятся в очереди, пока не закончится восстановление после сбоя
+        await gate
+    while True:
+        event = await queue.get()
+        try:
+            await process(event)
+        except Exception as e:
+            print(f"[INGEST] Ошибка обработки: {e}")
+
+
+_queue = None
+_workers = []
+
+
+def start_ingest(process, workers: int = INGEST_WORKERS, gate=None):
+    """Создаёт очередь и пул воркеров на текущем loop. process — корутина(элемент очереди).
+
+    gate — awaitable, до завершения которого воркеры не берут сообщения.
+    """
+    global _queue
+    if _queue is None:
+        _queue = FairQueue(INGEST_QUEUE_MAX, INGEST_OVERFLOW_POLICY, on_drop=_log_drop)
+        for i in range(max(1, workers)):
+            _workers.append(asyncio.create_task(_worker(_queue, process, gate), name=f"ingest-{i}"))
+    return _queue
+
+
+async def submit(channel, event, has_media: bool = False) -> bool:
+    return await _queue.put(channel, event, has_media)
+
+
+def get_ingest_stats():
+    if _queue is None:
+        return None
+    waits = sorted(_queue.waits)
+    p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+    return {
+        "depth": len(_queue),
+        "max_depth": _queue.max_depth,
+        "dropped": _queue.dropped,
+        "workers": len(_workers),
+        "wait_avg_ms": int(1000 * sum(waits) / len(waits)) if waits else 0,
+        "wait_p95_ms": int(1000 * p95),
+    }
@@ -0,0 +1,173 @@
+# links.py
+"""Извлечение ссылок на товары и приведение их к каноническому ключу.
+
+Разные каналы постят один и тот же товар WB/Ozon/AliExpress через разные
+партнёрские обёртки, UTM-хвосты и сокращатели. Ключ вида "wb:12345678"
+не зависит от обёртки, поэтому повтор товара ловится до скачивания медиа.
+"""
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import requests
+from telethon.tl.types import MessageEntityUrl, MessageEntityTextUrl
+
+from config import LINK_RESOLVE_SHORTENERS, LINK_RESOLVE_TIMEOUT
+
+# параметры, в которых партнёрские сети передают настоящую ссылку
+_WRAPPER_PARAMS = ("ulp", "url", "u", "to", "redirect", "redirect_url", "target", "link", "r", "dl")
+
+SHORTENER_HOSTS = {
+    "clck.ru", "ali.click", "s.click.aliexpress.com", "a.aliexpress.com",
+    "click.aliexpress.com", "bit.ly", "goo.su", "vk.cc", "fas.st", "got.by",
+    "cutt.ly", "tinyurl.com", "wb.click", "ozon.click",
+}
+# у Ozon короткие ссылки живут на основном домене: ozon.ru/t/AbCdEf
+_OZON_SHORT_RE = re.compile(r"^/t/[\w-]+/?$")
+
+_WB_RE = re.compile(r"/catalog/(\d{5,})")
+_OZON_PRODUCT_RE = re.compile(r"/product/(?:[^/]*-)?(\d{5,})")
+_OZON_CONTEXT_RE = re.compile(r"/context/detail/id/(\d{5,})")
+_ALI_RE = re.compile(r"/item/(?:[^/]*/)?(\d{6,})\.html")
+_YM_RE = re.compile(r"/(?:product(?:--[^/]*)?|card/[^/]+)/(\d{4,})")
+
+# читается и меняется из потоков executor'а — только под _resolved_lock
+_resolved_cache = OrderedDict()
+_resolved_lock = threading.Lock()
+_RESOLVED_CACHE_MAX = 2048
+
+
+def _host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _utf16_slice(text: str, offset: int, length: int) -> str:
+    raw = text.encode("utf-16-le")
+    return raw[offset * 2:(offset + length) * 2].decode("utf-16-le", errors="ignore")
+
+
+def extract_urls(message, text: str = None):
+    """Ссылки из MessageEntityUrl/MessageEntityTextUrl сообщения.
+
+    text — исходный текст, если message.message уже изменён (blacklist):
+    смещения сущностей считаются по оригиналу.
+    """
+    text = message.message if text is None else text
+    urls = []
+    for ent in (getattr(message, 'entities', None) or []):
+        if isinstance(ent, MessageEntityTextUrl):
+            urls.append(ent.url)
+        elif isinstance(ent, MessageEntityUrl):
+            urls.append(_utf16_slice(text or "", ent.offset, ent.length))
+    return [u.strip() for u in urls if u and u.strip()]
+
+
+def canonical_product_key(url: str, _depth: int = 0):
+    """'wb:123', 'ozon:123', 'ali:123', 'ym:123' или None."""
+    if not url or _depth > 3:
+        return None
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = _host(url)
+    path = unquote(parts.path or "")
+
+    if host.endswith(("wildberries.ru", "wildberries.by", "wildberries.kz", "wb.ru")):
+        m = _WB_RE.search(path)
+        if m:
+            return f"wb:{m.group(1)}"
+    elif host.endswith(("ozon.ru", "ozon.by", "ozon.kz")):
+        m = _OZON_PRODUCT_RE.search(path) or _OZON_CONTEXT_RE.search(path)
+        if m:
+            return f"ozon:{m.group(1)}"
+    elif "aliexpress." in host:
+        m = _ALI_RE.search(path)
+        if m:
+            return f"ali:{m.group(1)}"
+    elif host == "market.yandex.ru":
+        m = _YM_RE.search(path)
+        if m:
+            return f"ym:{m.group(1)}"
+
+    # партнёрская обёртка: настоящая ссылка лежит в параметре
+    query = parse_qs(parts.query or "")
+    for name in _WRAPPER_PARAMS:
+        for value in query.get(name, []):
+            if "." in value:
+                key = canonical_product_key(unquote(value), _depth + 1)
+                if key:
+                    return key
+    return None
+
+
+def is_shortened(url: str) -> bool:
+    host = _host(url if "://" in url else "https://" + url)
+    if host in SHORTENER_HOSTS:
+        return True
+    return host.endswith("ozon.ru") and bool(_OZON_SHORT_RE.match(urlsplit(url).path or ""))
+
+
+def resolve_short_url(url: str, max_hops: int = 5) -> str:
+    """Разворачивает сокращённую ссылку по Location (блокирующий вызов)."""
+    with _resolved_lock:
+        if url in _resolved_cache:
+            _resolved_cache.move_to_end(url)
+            return _resolved_cache[url]
+
+    current = url if "://" in url else "https://" + url
+    for _ in range(max_hops):
+        if canonical_product_key(current):
+            break
+        try:
+            resp = requests.head(current, allow_redirects=False, timeout=LINK_RESOLVE_TIMEOUT)
+            if resp.status_code in (405, 403):
+                resp = requests.get(current, allow_redirects=False, timeout=LINK_RESOLVE_TIMEOUT, stream=True)
+                resp.close()
+        except Exception:
+            break
+        location = resp.headers.get("Location")
+        if not location:
+            break
+        if location.startswith("/"):
+            p = urlsplit(current)
+            location = f"{p.scheme}://{p.netloc}{location}"
+        current = location
+
+    with _resolved_lock:
+        _resolved_cache[url] = current
+        _resolved_cache.move_to_end(url)
+        if len(_resolved_cache) > _RESOLVED_CACHE_MAX:
+            _resolved_cache.popitem(last=False)
+    return current
+
+
+async def product_keys_for_messages(messages, text_overrides=None):
+    """Набор канонических ключей товаров для сообщений поста."""
+    text_overrides = text_overrides or {}
+    keys = set()
+    short = []
+    for m in messages:
+        for url in extract_urls(m, text_overrides.get(m.id)):
+            key = canonical_product_key(url)
+            if key:
+                keys.add(key)
+            elif LINK_RESOLVE_SHORTENERS and is_shortened(url):
+                short.append(url)
+
+    if short:
+        resolved = await asyncio.gather(
+            *[asyncio.to_thread(resolve_short_url, u) for u in short],
+            return_exceptions=True
+        )
+        for full in resolved:
+            if isinstance(full, str):
+                key = canonical_product_key(full)
+                if key:
+                    keys.add(key)
+    return sorted(keys)
@@ -0,0 +1,123 @@
+# loop_watchdog.py
+"""Сторож event loop парсера: замечает блокирующие вызовы и называет их.
+
+Корутина на loop раз в LOOP_WATCHDOG_INTERVAL_MS обновляет «пульс» и меряет
+задержку своего пробуждения. Отдельный поток следит за пульсом: если loop
+не отвечает дольше LOOP_STALL_THRESHOLD_MS, он снимает стек потока loop
+через sys._current_frames() — это и есть функция, которая блокирует loop.
+Когда loop оживает, в лог пишется длительность зависания и виновник.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import LOOP_STALL_THRESHOLD_MS, LOOP_WATCHDOG_INTERVAL_MS
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopWatchdog:
+    def __init__(self, loop, threshold_ms=LOOP_STALL_THRESHOLD_MS, interval_ms=LOOP_WATCHDOG_INTERVAL_MS):
+        self.loop = loop
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.loop_thread_id = None
+        self._beat = time.monotonic()
+        self._stall_stack = None
+        self._stall_started = None
+
+        self.max_lag_ms = 0.0
+        self.stall_count = 0
+        self.recent_stalls = deque(maxlen=20)  # (ts, duration_ms, culprit)
+
+    async def _heartbeat(self):
+        self.loop_thread_id = threading.get_ident()
+        while True:
+            started = time.monotonic()
+            self._beat = started
+            await asyncio.sleep(self.interval)
+            lag_ms = (time.monotonic() - started - self.interval) * 1000
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+
+    def _capture_stack(self):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return None
+        return traceback.extract_stack(frame)
+
+    def _monitor(self):
+        check_every = max(self.interval / 2, 0.01)
+        while True:
+            time.sleep(check_every)
+            if self.loop_thread_id is None:
+                continue
+            beat = self._beat
+            silent = time.monotonic() - beat
+
+            if silent > self.threshold:
+                if self._stall_started != beat:
+                    # новое зависание — снимаем стек, пока блокирующий вызов ещё идёт
+                    self._stall_started = beat
+                    self._stall_stack = self._capture_stack()
+                continue
+
+            if self._stall_started is not None and self._beat != self._stall_started:
+                self._report(self._beat - self._stall_started - self.interval, self._stall_stack)
+                self._stall_started = None
+                self._stall_stack = None
+
+    def _report(self, duration, stack):
+        duration_ms = duration * 1000
+        culprit, lines = describe_stack(stack)
+        self.stall_count += 1
+        self.recent_stalls.append((int(time.time()), int(duration_ms), culprit))
+        print(f"[LOOP STALL] {duration_ms:.0f} мс — {culprit}")
+        for line in lines:
+            print(f"    {line}")
+
+    def start(self):
+        self.loop.create_task(self._heartbeat())
+        t = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        t.start()
+        return t
+
+
+def describe_stack(stack, depth: int = 8):
+    """(виновник, строки стека): самый глубокий кадр проекта и хвост стека."""
+    if not stack:
+        return "стек недоступен", []
+    own = [f for f in stack if f.filename.startswith(_PROJECT_DIR)]
+    innermost = stack[-1]
+    culprit = f"{os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}"
+    if own and own[-1] is not innermost:
+        o = own[-1]
+        culprit += f" ← {os.path.basename(o.filename)}:{o.lineno} {o.name}"
+    lines = [f"{os.path.basename(f.filename)}:{f.lineno} {f.name}: {(f.line or '').strip()}"
+             for f in stack[-depth:]]
+    return culprit, lines
+
+
+_watchdog = None
+
+
+def start_loop_watchdog(loop=None):
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = LoopWatchdog(loop or asyncio.get_running_loop())
+        _watchdog.start()
+    return _watchdog
+
+
+def get_watchdog_stats():
+    if _watchdog is None:
+        return None
+    return {
+        "max_lag_ms": int(_watchdog.max_lag_ms),
+        "stall_count": _watchdog.stall_count,
+        "recent": list(_watchdog.recent_stalls),
+    }
@@ -1,23 +1,70 @@
 # main.py
 import os
-import threading
+import sys
 import asyncio
 from config import TELEGRAM_PROXY_URL
+import profiler
+
+# python main.py --profile-startup — отчёт о времени импортов и запуска
+startup = profiler.startup
+startup.enabled = "--profile-startup" in sys.argv
 
 # Принудительно направляем все HTTP(S)-запросы процесса через прокси.
 os.environ["HTTP_PROXY"] = TELEGRAM_PROXY_URL
 os.environ["HTTPS_PROXY"] = TELEGRAM_PROXY_URL
 os.environ["ALL_PROXY"] = TELEGRAM_PROXY_URL
+# локальные сервисы (fake_bot_api.py, свой Bot API сервер) — напрямую
+os.environ["NO_PROXY"] = "localhost,127.0.0.1,::1"
+
+with startup.timed("import database"):
+    from database import init_db
+with startup.timed("import bot, recovery (telebot)"):
+    from recovery import recover_unfinished
+with startup.timed("import parser (telethon)"):
+    from parser import start_parser, client
+with startup.timed("import scheduler, retention, webhook"):
+    from scheduler import start_scheduler
+    from retention import start_retention
+    from webhook import start_bot_runtime
+import hashing
+
+
+def _warmed(seconds: float):
+    startup.add("прогрев хэширования (numpy, Pillow)", seconds)
+    if startup.enabled:
+        print(f"⏱ Прогрев хэширования: {seconds * 1000:.0f} мс")
+
+
+async def _recover():
+    with startup.timed("восстановление прерванных постов"):
+        try:
+            await asyncio.to_thread(recover_unfinished)
+        except Exception as e:
+            print(f"[RECOVERY] {e}")
+
+
+async def _start_bot():
+    with startup.timed("бот: webhook/polling"):
+        return await start_bot_runtime()
+
+
+async def main():
+    # бот, подключение Telethon и восстановление прошлых постов идут параллельно;
+    # новые сообщения воркеры начнут разбирать, когда восстановление закончится
+    recovery = asyncio.create_task(_recover())
+    await asyncio.gather(_start_bot(), start_parser(ingest_gate=recovery), recovery)
+    startup.dump()
+    # numpy/Pillow грузятся в фоне уже после старта, а не перед ним
+    hashing.start_warmup(on_done=_warmed)
+    await client.run_until_disconnected()
 
-from database import init_db
-from bot import run_bot
-from parser import run_parser
 
 if __name__ == "__main__":
-    init_db()
+    with startup.timed("init_db"):
+        init_db()
     print("📁 База данных инициализирована")
 
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
+    start_scheduler()
+    start_retention()
 
-    asyncio.run(run_parser())
+    asyncio.run(main())
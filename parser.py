@@ -1,30 +1,37 @@
 # parser.py
 import os
+import time
 import asyncio
-import re
 import socks
-from html import escape
 from telethon import TelegramClient, events
 from telethon.tl.types import (
-    MessageEntityTextUrl, MessageEntityUrl, MessageEntityBold,
-    MessageEntityItalic, MessageEntityCode, MessageEntityPre,
-    MessageEntityMentionName, MessageEntityStrike, MessageEntityUnderline,
-    MessageEntityPhone, MessageEntityEmail, MessageEntityMention, MessageEntityBotCommand
+    MessageEntityTextUrl, MessageEntityUrl,
+    PhotoSize, PhotoCachedSize, PhotoSizeProgressive, PhotoStrippedSize
 )
 from config import (
-    api_id, api_hash, channels_to_parse, blacklist_words,
-    AUTO_MODE, STOP_WORDS, ALERT_WORDS,
+    api_id, api_hash,
     TELEGRAM_PROXY_HOST, TELEGRAM_PROXY_PORT, TELEGRAM_PROXY_TYPE,
-    DUPLICATE_WINDOW_HOURS, IMAGE_DUPLICATE_THRESHOLD
+    THUMB_MIN_SIDE, PRODUCT_KEY_TTL_HOURS, MEDIA_DIR, IMAGE_DHASH_THRESHOLD,
+    CHANNEL_REFRESH_HOURS,
 )
 from database import (
-    post_exists, save_post, update_media_paths,
+    post_exists, save_post,
     is_exact_duplicate_recent, is_similar_image_duplicate_recent,
-    get_auto_mode
+    is_similar_hash_duplicate_recent, is_photo_key_recent,
+    is_product_key_recent, record_skip, find_fingerprint_collision,
 )
-from bot import send_post_for_approval, publish_post, send_alert
+from bot import send_alert
+from recovery import finalize_media, route_post
+from links import product_keys_for_messages
+from loop_watchdog import start_loop_watchdog
+import channels
+import entities
+import hashing
+import ingest
+import profiler
+import settings
+import singleflight
 
-MEDIA_DIR = "media"
 _PROXY_TYPES = {
     "http": socks.HTTP,
     "socks4": socks.SOCKS4,
@@ -53,94 +60,23 @@ def ensure_media_dir():
 
 def remove_blacklist_phrases(full_text: str) -> str:
     """Удаляет все фразы из blacklist из всего текста безопасно."""
-    if not full_text:
-        return full_text
-
-    cleaned = full_text
-    for bad in blacklist_words:
-        if not bad or not bad.strip():
-            continue
-
-        pattern = re.escape(bad)
-        pattern = pattern.replace(r'\ ', r'[\s\u00A0]+')
-        pattern = pattern.replace(r'\n', r'[\s\u00A0]*')
-        try:
-            cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE)
-        except re.error:
-            cleaned = cleaned.replace(bad, '')
-
-    cleaned = re.sub(r'(\n\s*)+$', '', cleaned)
-    return cleaned
-
-
-def utf16_to_python_index(s, utf16_index):
-    idx = 0
-    count = 0
-    while idx < len(s) and count < utf16_index:
-        c = s[idx]
-        code = ord(c)
-        count += 2 if code >= 0x10000 else 1
-        idx += 1
-    return idx
+    return settings.current().remove_blacklist_phrases(full_text)
 
 
-def message_to_html(message):
-    text = message.message or ""
-    html = ""
-    last = 0
+def _record_skip(channel, reason):
+    try:
+        record_skip(channel, reason)
+    except Exception as e:
+        print(f"[STATS ERROR] {e}")
 
-    for ent in sorted(message.entities or [], key=lambda e: e.offset):
-        start = utf16_to_python_index(text, ent.offset)
-        end = utf16_to_python_index(text, ent.offset + ent.length)
 
-        # --- FIX: защита от перекрывающихся/повторных сущностей ---
-        if end <= last:
-            continue
-        if start < last:
-            start = last
-        # ---------------------------------------------------------
-
-
-        html += escape(text[last:start])
-        part = text[start:end]
-
-        if isinstance(ent, MessageEntityTextUrl):
-            html += f'<a href="{escape(ent.url)}">{escape(part)}</a>'
-        elif isinstance(ent, MessageEntityUrl):
-            html += f'<a href="{escape(part)}">{escape(part)}</a>'
-        elif isinstance(ent, MessageEntityBold):
-            html += f"<b>{escape(part)}</b>"
-        elif isinstance(ent, MessageEntityItalic):
-            html += f"<i>{escape(part)}</i>"
-        elif isinstance(ent, MessageEntityCode):
-            html += f"<code>{escape(part)}</code>"
-        elif isinstance(ent, MessageEntityPre):
-            html += f"<pre>{escape(part)}</pre>"
-        elif isinstance(ent, MessageEntityMentionName):
-            uid = getattr(ent, 'user_id', None)
-            html += f'<a href="tg://user?id={uid}">{escape(part)}</a>' if uid else escape(part)
-        elif isinstance(ent, MessageEntityMention):
-            html += escape(part)
-        elif isinstance(ent, MessageEntityPhone):
-            html += f'<a href="tel:{escape(part)}">{escape(part)}</a>'
-        elif isinstance(ent, MessageEntityEmail):
-            html += f'<a href="mailto:{escape(part)}">{escape(part)}</a>'
-        elif isinstance(ent, MessageEntityBotCommand):
-            html += escape(part)
-        elif isinstance(ent, MessageEntityStrike):
-            html += f"<s>{escape(part)}</s>"
-        elif isinstance(ent, MessageEntityUnderline):
-            html += f"<u>{escape(part)}</u>"
-        else:
-            html += escape(part)
-        last = end
-
-    # html += escape(remove_blacklist_phrases(text[last:]))
-
-    if last < len(text):
-        html += escape(text[last:])
-
-    return html
+def _discard_media(paths):
+    """Удаляет скачанные файлы поста, который отсеян после скачивания."""
+    for p in paths or []:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
 
 
 async def download_media_from_messages(msgs):
@@ -170,7 +106,8 @@ async def download_media_from_messages(msgs):
         except Exception:
             ext = '.jpg'
 
-        path = os.path.join(MEDIA_DIR, f"{m.id}{ext}")
+        # id сообщений у разных каналов совпадают, а воркеры работают параллельно
+        path = os.path.join(MEDIA_DIR, f"{abs(m.chat_id or 0)}_{m.id}{ext}")
         try:
             await m.download_media(file=path)
             if os.path.exists(path):
@@ -180,46 +117,108 @@ async def download_media_from_messages(msgs):
     return paths
 
 
+def _message_photo(m):
+    return getattr(m, 'photo', None) or (getattr(m, 'media', None) and getattr(m.media, 'photo', None))
+
+
+def _pick_thumb(photo):
+    """Самое маленькое превью, которого хватает для pHash (иначе — stripped)."""
+    sizes = [s for s in (getattr(photo, 'sizes', None) or [])
+             if isinstance(s, (PhotoSize, PhotoCachedSize, PhotoSizeProgressive))]
+    big_enough = [s for s in sizes if min(s.w, s.h) >= THUMB_MIN_SIDE]
+    if big_enough:
+        return min(big_enough, key=lambda s: s.w * s.h)
+    if sizes:
+        return max(sizes, key=lambda s: s.w * s.h)
+    for s in (getattr(photo, 'sizes', None) or []):
+        if isinstance(s, PhotoStrippedSize):
+            return s
+    return None
+
+
+async def compute_thumb_hashes(msgs):
+    """Пары (pHash, dHash) по маленьким превью фото — без скачивания оригиналов.
+
+    Превью скачиваются по очереди, а хэши считаются одной пачкой в потоке,
+    чтобы декодирование не занимало event loop.
+    """
+    thumbs = []
+    for m in msgs:
+        photo = _message_photo(m)
+        if not photo:
+            continue
+        thumb = _pick_thumb(photo)
+        if thumb is None:
+            continue
+        try:
+            data = await client.download_media(m, file=bytes, thumb=thumb)
+        except Exception as e:
+            print(f"[THUMB ERROR] {e}")
+            continue
+        if data:
+            thumbs.append(data)
+    if not thumbs:
+        return []
+    return [h for h in await asyncio.to_thread(hashing.image_hashes, thumbs) if h]
+
+
 # ===============================================================
 # ============= ОБРАБОТЧИК НОВЫХ СООБЩЕНИЙ ======================
 # ===============================================================
 
-@client.on(events.NewMessage(chats=channels_to_parse))
 async def handler(event):
+    """Обработчик NewMessage: только ставит сообщение в очередь, работу делают воркеры ingest."""
+    info = channels.registry.get(event.chat_id)
+    channel = info.label if info else str(event.chat_id)
+    # время получения едет вместе с событием: ожидание в очереди тоже входит в свежесть
+    await ingest.submit(channel, (event, time.time()), has_media=bool(getattr(event.message, 'media', None)))
+
+
+async def process_message(event, received_at: float = None):
+    claim = None
     try:
-        chat = await event.get_chat()
-        channel = getattr(chat, 'username', None) or getattr(chat, 'title', 'unknown')
+        rules = settings.current()
+        source = await channels.registry.lookup(event)
+        channel, channel_id = source.label, source.id
         orig_message_id = event.message.id
+        channels.registry.note_message(source, orig_message_id)
 
         if event.message.fwd_from:
             print(f"[SKIP] Пересланное сообщение в @{channel}")
+            _record_skip(channel, "forward")
             return
 
-        # чистим blacklist
-        raw_text = event.message.message or ""
-        event.message.message = remove_blacklist_phrases(raw_text)
-        text_html = message_to_html(event.message)
-        cleaned_text = text_html.strip()
+        # чистим blacklist; сущности сдвигаются вместе с текстом
+        post_text, post_entities = rules.remove_blacklist_with_entities(
+            event.message.message or "", entities.from_telethon(event.message.entities)
+        )
+        # HTML — только для стоп-слов, алертов, предпросмотра и сравнения дублей
+        cleaned_text = entities.to_html(post_text, post_entities).strip()
 
         if not cleaned_text.strip():
+            _record_skip(channel, "empty")
             return
 
         # стоп-слова
-        if any(word.lower() in cleaned_text.lower() for word in STOP_WORDS):
+        if rules.find_stop_word(cleaned_text):
+            _record_skip(channel, "stop_word")
             return
 
-        for word in ALERT_WORDS:
-            if word.lower() in cleaned_text.lower():
-                alert_text = f"⚠️ Найдено ключевое слово <b>{word}</b> в посте из @{channel or 'неизвестного канала'}:\n\n{cleaned_text}"
-                try:
-                    send_alert(alert_text, None)
-                except Exception as e:
-                    print(f"[ALERT ERROR] {e}")
-                break
+        word = rules.find_alert_word(cleaned_text)
+        if word:
+            alert_text = f"⚠️ Найдено ключевое слово <b>{word}</b> в посте из @{channel or 'неизвестного канала'}:\n\n{cleaned_text}"
+            try:
+                send_alert(alert_text, None)
+            except Exception as e:
+                print(f"[ALERT ERROR] {e}")
 
-        if post_exists(channel, orig_message_id):
+        if post_exists(channel, orig_message_id, channel_id):
             return
 
+        # вехи для post_timings: от даты сообщения в источнике до сохранения
+        source_date = getattr(event.message, 'date', None)
+        timings = {"source": source_date.timestamp() if source_date else None, "received": received_at}
+
 
 
         grouped_id = getattr(event.message, 'grouped_id', None)
@@ -244,6 +243,7 @@ async def handler(event):
         # если нет ссылок И нет фото — пропускаем
         if not has_link and not has_photo:
             print(f"[SKIP] Нет ссылок и фото — @{channel}")
+            _record_skip(channel, "no_link_photo")
             return
         # ----------------------------------------------------------
 
@@ -260,22 +260,81 @@ async def handler(event):
         # если есть видео — пропускаем
         if  has_video:
             print(f"[SKIP] Виде в посте — @{channel}")
+            _record_skip(channel, "video")
+            return
+
+        duplicate_window_seconds = rules.duplicate_window_seconds
+
+        # отпечатки поста: текст, артикулы товаров, id фото Telegram — всё без скачивания
+        product_keys = await product_keys_for_messages(messages_for_post)
+        photo_ids = [p.id for p in (_message_photo(m) for m in messages_for_post) if p]
+        fingerprints = singleflight.content_fingerprints(cleaned_text, product_keys, photo_ids)
+
+        # резерв: такой же пост, который прямо сейчас обрабатывает другой воркер,
+        # дождётся его результата, а не пройдёт проверки параллельно с ним
+        claim = await singleflight.acquire(fingerprints)
+        if claim.duplicate_reason:
+            print(f"[SKIP] Такой же пост уже обрабатывается — @{channel}")
+            _record_skip(channel, claim.duplicate_reason)
+            return
+
+        # до скачивания: тот же товар (артикул WB/Ozon/Ali) уже недавно был
+        if is_product_key_recent(product_keys, PRODUCT_KEY_TTL_HOURS * 3600):
+            print(f"[SKIP] Товар уже был ({', '.join(product_keys)}) — @{channel}")
+            _record_skip(channel, "dup_product")
+            return
+
+        # до скачивания: точный репост того же фото по его id в Telegram
+        if is_photo_key_recent(photo_ids, duplicate_window_seconds):
+            print(f"[SKIP] То же фото уже было — @{channel}")
+            _record_skip(channel, "dup_photo_id")
+            return
+
+        # превью качаем только для постов, переживших дешёвые проверки
+        thumb_hashes = await compute_thumb_hashes(messages_for_post)
+        image_keys = singleflight.content_fingerprints("", image_hashes=[ph for ph, _ in thumb_hashes])
+        if image_keys:
+            # не ждём чужой резерв, держа свой (иначе два альбома с перекрёстными текстом
+            # и картинками ждут друг друга): отпускаем и берём все ключи одним вызовом
+            claim.release()
+            fingerprints = fingerprints + image_keys
+            claim = await singleflight.acquire(fingerprints)
+            if claim.duplicate_reason:
+                print(f"[SKIP] Такой же пост уже обрабатывается — @{channel}")
+                _record_skip(channel, claim.duplicate_reason)
+                return
+
+        # до скачивания: pHash по маленькому превью
+        if thumb_hashes and is_similar_hash_duplicate_recent(
+            thumb_hashes,
+            threshold=rules.image_duplicate_threshold,
+            within_seconds=duplicate_window_seconds,
+            dhash_threshold=IMAGE_DHASH_THRESHOLD
+        ):
+            print(f"[SKIP] Похожее изображение (по превью) — @{channel}")
+            _record_skip(channel, "dup_image")
             return
 
         media_paths = []
         if not has_video:
             media_paths = await download_media_from_messages(messages_for_post)
+        if media_paths:
+            timings["media"] = time.time()
 
+        # хэши скачанных фото — одной пачкой; они же уйдут в save_post
+        media_hashes = await asyncio.to_thread(hashing.image_hashes, media_paths) if media_paths else []
 
-        duplicate_window_seconds = max(1, int(DUPLICATE_WINDOW_HOURS * 3600))
-
-        # проверка по изображению только в недавнем окне
-        if media_paths and is_similar_image_duplicate_recent(
+        # полноразмерная проверка — только если превью получить не удалось
+        if media_paths and not thumb_hashes and is_similar_image_duplicate_recent(
             media_paths,
-            threshold=IMAGE_DUPLICATE_THRESHOLD,
-            within_seconds=duplicate_window_seconds
+            threshold=rules.image_duplicate_threshold,
+            within_seconds=duplicate_window_seconds,
+            dhash_threshold=IMAGE_DHASH_THRESHOLD,
+            image_hashes=media_hashes
         ):
             print(f"[SKIP] Похожее изображение найдено — @{channel}")
+            _record_skip(channel, "dup_image")
+            _discard_media(media_paths)
             return
 
         # источник
@@ -288,7 +347,10 @@ async def handler(event):
         # проверка на точный дубликат только в недавнем окне
         if is_exact_duplicate_recent(cleaned_text, within_seconds=duplicate_window_seconds):
             print(f"[SKIP] Точный дубликат — @{channel}")
+            _record_skip(channel, "dup_text")
+            _discard_media(media_paths)
             return
+        timings["dedup"] = time.time()
 
 
         # проверка на 92%+ похожий дубликат
@@ -297,45 +359,90 @@ async def handler(event):
         #     return
 
         # сохраняем
-        post_id = save_post(channel, orig_message_id, cleaned_text, media_paths or [], has_video)
+        post_id = save_post(channel, orig_message_id, cleaned_text, media_paths or [], has_video,
+                            photo_ids=photo_ids, product_keys=product_keys,
+                            raw_text=post_text, entities=post_entities, status='ingested',
+                            fingerprints=fingerprints, fingerprint_window=duplicate_window_seconds,
+                            image_hashes=media_hashes, timings=timings, channel_id=channel_id)
+        if post_id is None:
+            # тот же пост успел сохранить другой процесс; причина — по виду совпавшего отпечатка
+            key = find_fingerprint_collision(fingerprints, duplicate_window_seconds)
+            reason = singleflight.reason_for(key) if key else "dup_text"
+            print(f"[SKIP] Дубликат (отпечаток уже в базе: {reason}) — @{channel}")
+            _record_skip(channel, reason)
+            _discard_media(media_paths)
+            return
+        claim.release(saved=True)
 
-        # переименование медиа
-        if media_paths:
-            new_paths = []
-            for idx, p in enumerate(media_paths):
-                if not os.path.exists(p):
-                    continue
-                ext = os.path.splitext(p)[1].lower()
-                new_name = os.path.join(MEDIA_DIR, f"post_{post_id}_{idx}{ext}")
-                try:
-                    os.replace(p, new_name)
-                except Exception:
-                    import shutil
-                    shutil.copy2(p, new_name)
-                    try:
-                        os.remove(p)
-                    except:
-                        pass
-                new_paths.append(new_name)
-            update_media_paths(post_id, new_paths)
-            media_paths = new_paths
-
-        # публикация / отправка на модерацию
-        if get_auto_mode(default=AUTO_MODE):
-            publish_post(post_id)
-        else:
-            send_post_for_approval(post_id, cleaned_text, media_paths)
+        # ingested -> media_ready -> queued | pending: каждый шаг записан в базе,
+        # после сбоя recovery.recover_unfinished() продолжит с того же места
+        media_paths = finalize_media(post_id, media_paths)
+        route_post(post_id, rules.auto_mode, media_paths)
 
     except Exception as e:
         print(f"[ERROR parser handler] {e}")
+    finally:
+        if claim is not None:
+            claim.release()
 
 
 # ===============================================================
 # ============= ЗАПУСК ПАРСЕРА =================================
 # ===============================================================
 
-async def run_parser():
+_subscribed_event = None
+_refresh_task = None
+
+
+def subscribe_channels(channel_ids):
+    """(Пере)регистрирует обработчик на id каналов без переподключения.
+
+    Подписка на числовые id, а не на @username: Telethon не разрешает их
+    по сети, а переименование канала её не ломает.
+    """
+    global _subscribed_event
+    if _subscribed_event is not None:
+        client.remove_event_handler(handler, _subscribed_event)
+    _subscribed_event = events.NewMessage(chats=list(channel_ids))
+    client.add_event_handler(handler, _subscribed_event)
+    channels.registry.active = set(channel_ids)
+    print(f"📡 Подписка на каналы: {len(channel_ids)}")
+
+
+async def resubscribe(refs):
+    """Разрешает новые ссылки из channels_to_parse (известные — без сети) и переподписывается."""
+    subscribe_channels(await channels.registry.resolve(client, refs))
+
+
+def _on_settings_changed(loop, old, new):
+    if old.channels_to_parse != new.channels_to_parse:
+        asyncio.run_coroutine_threadsafe(resubscribe(new.channels_to_parse), loop)
+
+
+async def start_parser(ingest_gate=None):
+    """Подключает Telethon и запускает воркеров; сообщения они берут после ingest_gate."""
+    global _refresh_task
     ensure_media_dir()
-    await client.start()
+    loop = asyncio.get_running_loop()
+    start_loop_watchdog(loop)
+    ingest.start_ingest(lambda item: process_message(*item), gate=ingest_gate)
+    # уже известные каналы слушаем сразу, новые — после подключения
+    channels.registry.load()
+    refs = settings.current().channels_to_parse
+    subscribe_channels(channels.registry.known_ids(refs))
+    settings.subscribe(lambda old, new: _on_settings_changed(loop, old, new))
+    settings.start_watcher()
+    with profiler.startup.timed("Telethon: подключение"):
+        await client.start()
+    if len(channels.registry.active) < len(refs):
+        with profiler.startup.timed("каналы: разрешение id"):
+            await resubscribe(refs)
+    _refresh_task = asyncio.create_task(
+        channels.refresh_loop(client, CHANNEL_REFRESH_HOURS * 3600), name="channels-refresh"
+    )
     print("✅ Парсер запущен и слушает каналы...")
+
+
+async def run_parser(ingest_gate=None):
+    await start_parser(ingest_gate)
     await client.run_until_disconnected()
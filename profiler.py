@@ -0,0 +1,188 @@
+# profiler.py
+"""Профилирование «на живую»: сэмплирующий профиль потоков и снимки памяти.
+
+Ничего не нужно перезапускать: профиль собирается отдельным потоком,
+который раз в PROFILE_SAMPLE_MS снимает стеки всех потоков процесса
+(event loop парсера, поток бота, планировщик и т.д.) через
+sys._current_frames(). Результат — файл в формате collapsed stacks
+(подходит для flamegraph.pl / speedscope) и top-N функций.
+
+startup — замеры запуска (импорты и инициализация) для main.py --profile-startup.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from config import PROFILE_DIR, PROFILE_SAMPLE_MS, TRACEMALLOC_FRAMES
+
+_profile_lock = threading.Lock()
+_mem_lock = threading.Lock()
+_mem_baseline = None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame) -> list:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def sample_threads(seconds: float, interval_ms: float = PROFILE_SAMPLE_MS):
+    """Сэмплирует все потоки, кроме текущего. Возвращает (Counter стеков, число проходов)."""
+    own = threading.get_ident()
+    interval = interval_ms / 1000.0
+    stacks = Counter()
+    passes = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            thread = names.get(ident, str(ident)).replace(";", "_").replace(" ", "_")
+            stacks[";".join([thread] + _collapse(frame))] += 1
+        passes += 1
+        time.sleep(interval)
+    return stacks, passes
+
+
+def _top_self(stacks: Counter, top: int):
+    """Функции, которые чаще всего оказываются на вершине стека."""
+    leaf = Counter()
+    for stack, cnt in stacks.items():
+        parts = stack.split(";")
+        leaf[f"{parts[0]} {parts[-1]}"] += cnt
+    return leaf.most_common(top)
+
+
+def run_profile(seconds: float, top: int = 15):
+    """Собирает профиль и пишет его в файл. Возвращает (путь, текст сводки).
+
+    Одновременно идёт только один профиль; если уже идёт — (None, причина).
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None, "Профилирование уже идёт"
+    try:
+        stacks, passes = sample_threads(seconds)
+    finally:
+        _profile_lock.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile_{int(time.time())}.collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, cnt in stacks.most_common():
+            f.write(f"{stack} {cnt}\n")
+
+    lines = [f"Проходов: {passes}, интервал {PROFILE_SAMPLE_MS} мс"]
+    total = sum(stacks.values()) or 1
+    for name, cnt in _top_self(stacks, top):
+        lines.append(f"{100 * cnt / total:5.1f}%  {name}")
+    return path, "\n".join(lines)
+
+
+def memory_snapshot(top: int = 30):
+    """Снимок tracemalloc и разница с предыдущим. Возвращает (путь или None, текст)."""
+    global _mem_baseline
+    with _mem_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _mem_baseline = tracemalloc.take_snapshot()
+            return None, "tracemalloc запущен. Повтори команду, чтобы получить разницу."
+
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(_mem_baseline, "lineno")
+        _mem_baseline = snapshot
+
+    current, peak = tracemalloc.get_traced_memory()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"memdiff_{int(time.time())}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"traced: {current / 1024:.0f} KiB, peak: {peak / 1024:.0f} KiB\n\n")
+        for stat in stats[:top]:
+            f.write(f"{stat}\n")
+            for line in stat.traceback.format()[-TRACEMALLOC_FRAMES * 2:]:
+                f.write(f"    {line}\n")
+
+    lines = [f"Сейчас: {current / 1024:.0f} KiB, пик: {peak / 1024:.0f} KiB"]
+    for stat in stats[:10]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+.0f} KiB  {os.path.basename(frame.filename)}:{frame.lineno}")
+    return path, "\n".join(lines)
+
+
+def stop_memory_tracing():
+    global _mem_baseline
+    with _mem_lock:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _mem_baseline = None
+
+
+class StartupProfile:
+    """Сколько занял каждый этап запуска и сколько модулей он подгрузил.
+
+    Этапы могут идти параллельно (бот, Telethon, восстановление), поэтому
+    у каждого свои начало и длительность, а не разница с предыдущим.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.enabled = False
+        self.phases = []    # (этап, начало от старта, длительность, новых модулей)
+        self._lock = threading.Lock()
+
+    def _record(self, phase, begin, modules_before):
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((phase, begin - self.started, now - begin, len(sys.modules) - modules_before))
+
+    @contextmanager
+    def timed(self, phase):
+        """with startup.timed("import bot"): ... — работает и вокруг await."""
+        begin = time.perf_counter()
+        modules = len(sys.modules)
+        try:
+            yield
+        finally:
+            self._record(phase, begin, modules)
+
+    def add(self, phase, seconds):
+        """Этап, длительность которого измерена в другом месте (например, в фоновом потоке)."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((phase, now - seconds - self.started, seconds, 0))
+
+    def report(self) -> str:
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = [f"⏱ Запуск: {time.perf_counter() - self.started:.2f} с, модулей загружено: {len(sys.modules)}"]
+        for phase, begin, took, modules in phases:
+            extra = f", +{modules} модулей" if modules else ""
+            lines.append(f"  {begin:6.2f} с  {took * 1000:8.1f} мс  {phase}{extra}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """Печатает отчёт и сохраняет его в PROFILE_DIR. Ничего не делает без --profile-startup."""
+        if not self.enabled:
+            return None
+        text = self.report()
+        print(text)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"startup_{int(time.time())}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        return path
+
+
+startup = StartupProfile()
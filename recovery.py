@@ -0,0 +1,117 @@
+# recovery.py
+"""Переходы поста между состояниями и восстановление после сбоя.
+
+Пост сохраняется сразу после скачивания медиа в статусе ingested, потом
+файлы переименовываются и пост переходит в media_ready, затем — в очередь
+публикаций (queued) или на модерацию (pending; отправлен владельцу, когда
+его сообщения записаны в post_owner_messages). Каждый шаг можно безопасно
+повторить, поэтому при запуске recover_unfinished() доводит до конца всё,
+что прервал сбой, ничего не скачивая заново, и удаляет из MEDIA_DIR файлы,
+на которые не ссылается ни один пост.
+"""
+import os
+import shutil
+
+from config import MEDIA_DIR, PUSH_PENDING_TO_OWNER, PUBLISH_QUEUE_MAX
+from database import (
+    mark_media_ready, bulk_update_status, enqueue_publication, update_status,
+    list_posts_in_status, get_referenced_media_paths,
+    PRIORITY_NORMAL, PRIORITY_LOW
+)
+from bot import send_post_for_approval
+import settings
+
+
+def final_media_path(post_id: int, idx: int, path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return os.path.join(MEDIA_DIR, f"post_{post_id}_{idx}{ext}")
+
+
+def finalize_media(post_id: int, media_paths):
+    """Переименовывает скачанные файлы в post_<id>_<n> и переводит пост в media_ready.
+
+    Повторный вызов ничего не ломает: уже перенесённый файл просто находится на новом месте.
+    """
+    new_paths = []
+    for idx, p in enumerate(media_paths or []):
+        target = final_media_path(post_id, idx, p)
+        if p != target and os.path.exists(p):
+            try:
+                os.replace(p, target)
+            except Exception:
+                shutil.copy2(p, target)
+                try:
+                    os.remove(p)
+                except:
+                    pass
+        if os.path.exists(target):
+            new_paths.append(target)
+    mark_media_ready(post_id, new_paths)
+    return new_paths
+
+
+def route_post(post_id: int, auto_mode: bool, media_paths=None):
+    """media_ready -> queued (авторежим) или pending (+ отправка владельцу)."""
+    if auto_mode:
+        priority = PRIORITY_NORMAL if media_paths else PRIORITY_LOW
+        dropped = enqueue_publication([post_id], priority=priority, max_queue=PUBLISH_QUEUE_MAX)
+        if dropped:
+            print(f"[SCHEDULER] Очередь переполнена, вытеснены: {dropped}")
+        return
+    if bulk_update_status([post_id], 'pending', from_status='media_ready') and PUSH_PENDING_TO_OWNER:
+        send_post_for_approval(post_id, media_paths=media_paths)
+
+
+def _sweep_orphan_media():
+    if not os.path.isdir(MEDIA_DIR):
+        return 0
+    referenced = get_referenced_media_paths()
+    removed = 0
+    for name in os.listdir(MEDIA_DIR):
+        path = os.path.normpath(os.path.join(MEDIA_DIR, name))
+        if path in referenced or not os.path.isfile(path):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except Exception as e:
+            print(f"[RECOVERY] Не удалось удалить {path}: {e}")
+    return removed
+
+
+def recover_unfinished():
+    """Вызывается при старте до запуска парсера: доводит прерванные посты до конца."""
+    auto_mode = settings.current().auto_mode
+    resumed = 0
+
+    for row in list_posts_in_status(('ingested', 'media_ready')):
+        post_id = row["id"]
+        try:
+            if row["status"] == 'ingested':
+                media_paths = finalize_media(post_id, row["media_paths"])
+            else:
+                media_paths = [p for p in row["media_paths"] if os.path.exists(p)]
+            if row["has_media"] and not media_paths:
+                # медиа пропали вместе со сбоем, а заново не скачиваем
+                update_status(post_id, 'error')
+                print(f"[RECOVERY] post {post_id}: медиа потеряны, помечен как error")
+                continue
+            route_post(post_id, auto_mode, media_paths)
+            resumed += 1
+        except Exception as e:
+            print(f"[RECOVERY] post {post_id}: {e}")
+
+    if PUSH_PENDING_TO_OWNER:
+        for row in list_posts_in_status(('pending',)):
+            if row["sent_to_owner"]:
+                continue
+            try:
+                media_paths = [p for p in row["media_paths"] if os.path.exists(p)]
+                send_post_for_approval(row["id"], media_paths=media_paths)
+                resumed += 1
+            except Exception as e:
+                print(f"[RECOVERY] post {row['id']}: {e}")
+
+    removed = _sweep_orphan_media()
+    if resumed or removed:
+        print(f"♻️ Восстановление: доведено постов {resumed}, удалено лишних файлов {removed}")
@@ -0,0 +1,57 @@
+# retention.py
+"""Фоновая чистка: старые посты уходят в сжатый архив, база остаётся маленькой."""
+import os
+import threading
+import time
+
+from config import (
+    RETENTION_DAYS, RETENTION_INTERVAL_HOURS, RETENTION_FIRST_DELAY_MINUTES, ARCHIVE_DB_FILE,
+    RETENTION_BATCH, VACUUM_PAGES_PER_RUN, PRODUCT_KEY_TTL_HOURS
+)
+from database import archive_old_posts, incremental_vacuum, prune_product_keys, prune_fingerprints
+import settings
+
+
+def run_retention_once():
+    # не архивируем то, что ещё может понадобиться антидубликатам
+    max_age = max(RETENTION_DAYS * 86400, settings.current().duplicate_window_seconds)
+    cutoff = int(time.time()) - int(max_age)
+
+    started = time.time()
+    archived, leftover_media = archive_old_posts(cutoff, ARCHIVE_DB_FILE, batch=RETENTION_BATCH)
+
+    removed = 0
+    for path in leftover_media:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+
+    prune_product_keys(PRODUCT_KEY_TTL_HOURS * 3600)
+    prune_fingerprints(max(PRODUCT_KEY_TTL_HOURS * 3600, settings.current().duplicate_window_seconds))
+
+    free_pages = incremental_vacuum(VACUUM_PAGES_PER_RUN)
+    if archived or removed or free_pages:
+        print(
+            f"[RETENTION] В архив: {archived}, удалено файлов: {removed}, "
+            f"свободных страниц: {free_pages}, {time.time() - started:.1f} с"
+        )
+    return archived
+
+
+def _retention_loop():
+    time.sleep(RETENTION_FIRST_DELAY_MINUTES * 60)
+    while True:
+        try:
+            run_retention_once()
+        except Exception as e:
+            print(f"[RETENTION] {e}")
+        time.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+def start_retention():
+    t = threading.Thread(target=_retention_loop, name="retention", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,103 @@
+# scheduler.py
+"""Планировщик публикаций: раскладывает всплески постов по слотам.
+
+Очередь хранится в таблице publish_queue, поэтому переживает перезапуск.
+Публикация идёт не чаще одного поста в PUBLISH_SLOT_SECONDS, не более
+PUBLISH_MAX_PER_HOUR в час и не в PUBLISH_QUIET_HOURS.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import (
+    PUBLISH_SLOT_SECONDS, PUBLISH_MAX_PER_HOUR, PUBLISH_QUIET_HOURS,
+    SCHEDULER_POLL_SECONDS
+)
+from database import (
+    get_post, next_queued_publication, dequeue_publication,
+    get_publish_times_since, get_last_published_at
+)
+from bot import publish_post
+
+
+def _quiet_hours_left(now: datetime) -> float:
+    """Сколько секунд осталось до конца тихих часов (0 — сейчас не тихие часы)."""
+    if not PUBLISH_QUIET_HOURS:
+        return 0
+    start, end = PUBLISH_QUIET_HOURS
+    hour = now.hour
+    if start == end:
+        return 0
+    if start < end:
+        inside = start <= hour < end
+    else:  # интервал через полночь, например (23, 7)
+        inside = hour >= start or hour < end
+    if not inside:
+        return 0
+    until = now.replace(hour=end, minute=0, second=0, microsecond=0)
+    if until <= now:
+        until += timedelta(days=1)
+    return (until - now).total_seconds()
+
+
+def seconds_until_next_slot(now_ts: float = None) -> float:
+    """0, если публиковать можно прямо сейчас, иначе — сколько ждать."""
+    now_ts = time.time() if now_ts is None else now_ts
+
+    wait = _quiet_hours_left(datetime.fromtimestamp(now_ts))
+    if wait:
+        return wait
+
+    last = get_last_published_at()
+    if last and PUBLISH_SLOT_SECONDS > 0:
+        wait = max(wait, last + PUBLISH_SLOT_SECONDS - now_ts)
+
+    if PUBLISH_MAX_PER_HOUR > 0:
+        recent = get_publish_times_since(int(now_ts) - 3600)
+        if len(recent) >= PUBLISH_MAX_PER_HOUR:
+            # ждём, пока самая старая публикация из лимита выйдет из часового окна
+            oldest = recent[len(recent) - PUBLISH_MAX_PER_HOUR]
+            wait = max(wait, oldest + 3600 - now_ts)
+
+    return max(0.0, wait)
+
+
+def _publish_next() -> bool:
+    item = next_queued_publication()
+    if not item:
+        return False
+
+    post_id = item["post_id"]
+    post = get_post(post_id)
+    if not post or post.get("status") != "queued":
+        # пост отклонён или удалён, пока ждал своей очереди
+        dequeue_publication(post_id)
+        return True
+
+    try:
+        publish_post(post_id)
+    except Exception as e:
+        print(f"[SCHEDULER] Ошибка публикации post {post_id}: {e}")
+    dequeue_publication(post_id)
+    return True
+
+
+def run_scheduler():
+    print("🗓 Планировщик публикаций запущен")
+    while True:
+        try:
+            wait = seconds_until_next_slot()
+            if wait > 0:
+                time.sleep(min(wait, 60))
+                continue
+            if not _publish_next():
+                time.sleep(SCHEDULER_POLL_SECONDS)
+        except Exception as e:
+            print(f"[SCHEDULER] {e}")
+            time.sleep(SCHEDULER_POLL_SECONDS)
+
+
+def start_scheduler():
+    t = threading.Thread(target=run_scheduler, name="publish-scheduler", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,251 @@
+# settings.py
+"""Настройки, которые меняются на лету без перезапуска сессии Telethon.
+
+Значения по умолчанию берутся из config.py, поверх них накладывается
+необязательный JSON-файл SETTINGS_FILE, а поверх файла — таблица settings
+(её меняют команды бота). Все значения и скомпилированные регулярки живут
+в неизменяемом снимке Snapshot, который при перезагрузке подменяется
+целиком одной операцией присваивания, поэтому чтение на каждое сообщение
+ничего не стоит и всегда видит согласованный набор правил.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+import config
+import entities
+from database import get_settings, set_setting
+
+SETTINGS_FILE = getattr(config, "SETTINGS_FILE", "settings.json")
+SETTINGS_RELOAD_INTERVAL = getattr(config, "SETTINGS_RELOAD_INTERVAL", 5)
+
+DEFAULTS = {
+    "channels_to_parse": list(config.channels_to_parse),
+    "blacklist_words": list(config.blacklist_words),
+    "stop_words": list(config.STOP_WORDS),
+    "alert_words": list(config.ALERT_WORDS),
+    "duplicate_window_hours": config.DUPLICATE_WINDOW_HOURS,
+    "image_duplicate_threshold": config.IMAGE_DUPLICATE_THRESHOLD,
+    "auto_mode": config.AUTO_MODE,
+}
+
+LIST_KEYS = ("channels_to_parse", "blacklist_words", "stop_words", "alert_words")
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip() in ("1", "true", "True", "on", "yes")
+
+
+def _coerce(key: str, value):
+    """Приводит значение из файла/БД к типу значения по умолчанию."""
+    default = DEFAULTS[key]
+    if isinstance(default, bool):
+        return _to_bool(value)
+    if isinstance(default, list):
+        if not isinstance(value, list):
+            raise ValueError(f"{key}: ожидается список")
+        return [str(v) for v in value]
+    if isinstance(default, (int, float)):
+        number = float(value)
+        # nan/inf и отрицательные ломают int(часы * 3600) при сборке снимка
+        if not math.isfinite(number) or number < 0:
+            raise ValueError(f"{key}: ожидается неотрицательное число")
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def _parse_raw(raw: str):
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return raw
+
+
+def _compile_blacklist(words):
+    patterns = []
+    for bad in words:
+        if not bad or not bad.strip():
+            continue
+        pattern = re.escape(bad)
+        pattern = pattern.replace(r'\ ', r'[\s\u00A0]+')
+        pattern = pattern.replace(r'\n', r'[\s\u00A0]*')
+        try:
+            patterns.append(re.compile(pattern, re.IGNORECASE))
+        except re.error:
+            continue
+    return tuple(patterns)
+
+
+def _compile_any(words):
+    """Одна регулярка вместо цикла `word in text` по всему списку."""
+    words = [w for w in words if w]
+    if not words:
+        return None
+    # длинные фразы первыми, чтобы при совпадении возвращалась самая полная
+    words = sorted(set(words), key=len, reverse=True)
+    return re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+
+class Snapshot:
+    """Неизменяемый набор правил; создаётся целиком при каждой перезагрузке."""
+
+    def __init__(self, values: dict):
+        self.values = values
+        self.channels_to_parse = tuple(values["channels_to_parse"])
+        self.blacklist_words = tuple(values["blacklist_words"])
+        self.blacklist_patterns = _compile_blacklist(self.blacklist_words)
+        self.stop_words = tuple(values["stop_words"])
+        self.stop_re = _compile_any(self.stop_words)
+        self.alert_words = tuple(values["alert_words"])
+        self.alert_re = _compile_any(self.alert_words)
+        self.duplicate_window_hours = values["duplicate_window_hours"]
+        self.duplicate_window_seconds = max(1, int(self.duplicate_window_hours * 3600))
+        self.image_duplicate_threshold = int(values["image_duplicate_threshold"])
+        self.auto_mode = bool(values["auto_mode"])
+
+    def remove_blacklist_phrases(self, full_text: str) -> str:
+        """Удаляет все фразы из blacklist из всего текста безопасно."""
+        if not full_text:
+            return full_text
+        cleaned = full_text
+        for pattern in self.blacklist_patterns:
+            cleaned = pattern.sub('', cleaned)
+        cleaned = re.sub(r'(\n\s*)+$', '', cleaned)
+        return cleaned
+
+    def remove_blacklist_with_entities(self, full_text: str, ents):
+        """То же, что remove_blacklist_phrases, но со сдвигом сущностей. -> (текст, сущности)."""
+        text, ents = full_text or "", list(ents or [])
+        for pattern in self.blacklist_patterns:
+            text, ents = entities.delete_spans(text, ents, [m.span() for m in pattern.finditer(text)])
+        return entities.strip(text, ents)
+
+    def find_stop_word(self, text: str):
+        if self.stop_re is None or not text:
+            return None
+        m = self.stop_re.search(text)
+        return m.group(0) if m else None
+
+    def find_alert_word(self, text: str):
+        if self.alert_re is None or not text:
+            return None
+        m = self.alert_re.search(text)
+        return m.group(0) if m else None
+
+
+_lock = threading.Lock()
+_listeners = []
+_current = None
+_signature = None
+
+
+def _read_file():
+    if not SETTINGS_FILE or not os.path.exists(SETTINGS_FILE):
+        return None, {}
+    mtime = os.path.getmtime(SETTINGS_FILE)
+    try:
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[SETTINGS] Не удалось прочитать {SETTINGS_FILE}: {e}")
+        return mtime, {}
+    if not isinstance(data, dict):
+        print(f"[SETTINGS] {SETTINGS_FILE}: ожидается JSON-объект")
+        return mtime, {}
+    return mtime, data
+
+
+def _build(file_values: dict, db_rows: dict) -> dict:
+    values = {k: (list(v) if isinstance(v, list) else v) for k, v in DEFAULTS.items()}
+    for source in (file_values, {k: _parse_raw(v) for k, v in db_rows.items()}):
+        for key, raw in source.items():
+            if key not in DEFAULTS:
+                continue
+            try:
+                values[key] = _coerce(key, raw)
+            except (TypeError, ValueError) as e:
+                print(f"[SETTINGS] Некорректное значение {key}: {e}")
+    return values
+
+
+def reload(force: bool = False) -> "Snapshot":
+    """Перечитывает файл и таблицу settings; подменяет снимок, если что-то изменилось."""
+    global _current, _signature
+    with _lock:
+        mtime, file_values = _read_file()
+        db_rows = get_settings()
+        signature = (mtime, tuple(sorted(db_rows.items())))
+        if not force and _current is not None and signature == _signature:
+            return _current
+
+        old = _current
+        new = Snapshot(_build(file_values, db_rows))
+        _current = new
+        _signature = signature
+
+    if old is not None and old.values != new.values:
+        print("[SETTINGS] Настройки перезагружены")
+        for callback in list(_listeners):
+            try:
+                callback(old, new)
+            except Exception as e:
+                print(f"[SETTINGS] Ошибка обработчика изменений: {e}")
+    return new
+
+
+def current() -> "Snapshot":
+    snap = _current
+    if snap is None:
+        snap = reload()
+    return snap
+
+
+def subscribe(callback):
+    """callback(old, new) вызывается после каждой подмены снимка."""
+    _listeners.append(callback)
+
+
+def set_value(key: str, value):
+    if key not in DEFAULTS:
+        raise KeyError(key)
+    value = _coerce(key, value)
+    set_setting(key, json.dumps(value, ensure_ascii=False))
+    return reload()
+
+
+def add_to_list(key: str, item: str) -> bool:
+    items = list(current().values[key])
+    if item in items:
+        return False
+    items.append(item)
+    set_value(key, items)
+    return True
+
+
+def remove_from_list(key: str, item: str) -> bool:
+    items = list(current().values[key])
+    if item not in items:
+        return False
+    set_value(key, [i for i in items if i != item])
+    return True
+
+
+def _watch_loop():
+    while True:
+        time.sleep(SETTINGS_RELOAD_INTERVAL)
+        try:
+            reload()
+        except Exception as e:
+            print(f"[SETTINGS] Ошибка перезагрузки: {e}")
+
+
+def start_watcher():
+    current()
+    t = threading.Thread(target=_watch_loop, name="settings-watcher", daemon=True)
+    t.start()
+    return t
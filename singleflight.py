@@ -0,0 +1,88 @@
+# singleflight.py
+"""Резервирование контента, пока пост обрабатывается.
+
+Когда несколько каналов почти одновременно репостят одну акцию, их
+воркеры проходят проверки дублей раньше, чем кто-то из них успеет
+сохранить пост. Поэтому перед проверками воркер резервирует отпечатки
+поста (хэш нормализованного текста, ключи товаров, id фото, pHash превью).
+Первый забирает ключи себе, остальные ждут его результата (до
+SINGLEFLIGHT_WAIT_SECONDS): если пост сохранён — пропускаются как дубль
+сразу, без скачивания; если нет — пробуют снова. Между процессами то же
+самое гарантирует уникальный ключ таблицы post_fingerprints (save_post).
+"""
+import asyncio
+import hashlib
+
+from config import SINGLEFLIGHT_WAIT_SECONDS
+from database import normalize_text
+
+# префикс отпечатка -> причина пропуска для статистики
+_REASONS = {"text": "dup_text", "product": "dup_product", "photo": "dup_photo_id", "img": "dup_image"}
+
+
+def content_fingerprints(text: str, product_keys=(), photo_ids=(), image_hashes=()):
+    keys = []
+    norm = normalize_text(text)
+    if norm:
+        keys.append("text:" + hashlib.sha1(norm.encode("utf-8")).hexdigest())
+    keys.extend(f"product:{k}" for k in product_keys or ())
+    keys.extend(f"photo:{p}" for p in photo_ids or ())
+    keys.extend(f"img:{h}" for h in image_hashes or ())
+    return sorted(set(keys))
+
+
+def reason_for(key: str) -> str:
+    return _REASONS.get(key.split(":", 1)[0], "dup_text")
+
+
+class Claim:
+    """Результат резервирования: либо ключи наши, либо duplicate_reason."""
+
+    def __init__(self, flight, keys, future, duplicate_reason=None):
+        self._flight = flight
+        self.keys = keys
+        self._future = future
+        self.duplicate_reason = duplicate_reason
+
+    def release(self, saved: bool = False):
+        """Снимает резерв и сообщает ждущим, сохранён ли пост. Повторный вызов ничего не делает."""
+        if self._future is None or self._future.done():
+            return
+        for key in self.keys:
+            if self._flight._inflight.get(key) is self._future:
+                del self._flight._inflight[key]
+        self._future.set_result(saved)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}   # отпечаток -> future держателя (True — пост сохранён)
+
+    async def acquire(self, keys, wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS) -> Claim:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_seconds
+        while True:
+            busy = next((k for k in keys if k in self._inflight), None)
+            if busy is None:
+                future = loop.create_future()
+                for key in keys:
+                    self._inflight[key] = future
+                return Claim(self, list(keys), future)
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return Claim(self, [], None, duplicate_reason=reason_for(busy))
+            try:
+                saved = await asyncio.wait_for(asyncio.shield(self._inflight[busy]), remaining)
+            except asyncio.TimeoutError:
+                return Claim(self, [], None, duplicate_reason=reason_for(busy))
+            if saved:
+                return Claim(self, [], None, duplicate_reason=reason_for(busy))
+            # держатель пост отбросил — пробуем зарезервировать сами
+
+
+_flight = SingleFlight()
+
+
+async def acquire(keys, wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS) -> Claim:
+    return await _flight.acquire(keys, wait_seconds)
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
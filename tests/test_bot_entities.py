@@ -0,0 +1,40 @@
+# tests/test_bot_entities.py
+import html
+import json
+
+import bot
+
+
+def test_text_mention_serializes_as_user_link():
+    ents = [
+        {"type": "bold", "offset": 0, "length": 4},
+        {"type": "text_mention", "offset": 5, "length": 4,
+         "user": {"id": 42, "is_bot": False, "first_name": ""}},
+    ]
+    dumped = [e.to_dict() for e in bot._message_entities(ents)]
+    assert dumped[0]["type"] == "bold"
+    assert dumped[1]["type"] == "text_link"
+    assert dumped[1]["url"] == "tg://user?id=42"
+    assert (dumped[1]["offset"], dumped[1]["length"]) == (5, 4)
+    json.dumps(dumped)
+
+
+def test_no_entities():
+    assert bot._message_entities([]) is None
+
+
+def test_pre_chunks_keep_tags_balanced():
+    summary = "\n".join(f"{i:5d}  <module> & func_{i}()" for i in range(2000))
+    parts = bot._pre_chunks(summary)
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= 4096
+        assert part.startswith("<pre>") and part.endswith("</pre>")
+        assert part.count("<pre>") == 1 and part.count("</pre>") == 1
+    assert "".join(html.unescape(p[5:-6]) for p in parts) == summary
+
+
+def test_pre_chunks_split_overlong_line():
+    parts = bot._pre_chunks("<&>" * 3000)
+    assert all(len(p) <= 4096 for p in parts)
+    assert "".join(html.unescape(p[5:-6]) for p in parts) == "<&>" * 3000
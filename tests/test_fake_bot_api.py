@@ -0,0 +1,34 @@
+# tests/test_fake_bot_api.py
+import config
+import database
+from fake_bot_api import FakeBotAPI
+
+
+def test_publish_post_retries_429(tmp_path, monkeypatch):
+    fake = FakeBotAPI(port=0, group_per_minute=120).start()
+    try:
+        monkeypatch.setattr(config, "BOT_API_URL", fake.api_url)
+        monkeypatch.setenv("NO_PROXY", "localhost,127.0.0.1,::1")
+        monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "test.db"))
+        database.init_db()
+
+        import bot
+        from telebot import apihelper
+        # bot мог быть импортирован раньше — направляем его на fake-сервер явно
+        monkeypatch.setattr(apihelper, "API_URL", fake.api_url)
+        monkeypatch.setattr(apihelper, "proxy", None)
+
+        text = "Скидка 50% https://example.com/item"
+        post_id = database.save_post("test", 1, text, [], False, raw_text=text, entities=[],
+                                     status="queued", image_hashes=[])
+        # канал только что получил сообщение: следующее упрётся во флуд-лимит
+        fake._chat_bucket(config.target_channel).tokens = 0
+        retries = bot.flood_stats["retries"]
+
+        assert bot.publish_post(post_id)
+        assert database.get_post(post_id)["status"] == "published"
+        assert bot.flood_stats["retries"] > retries
+        assert fake.stats()["flood_429"].get("sendMessage", 0) >= 1
+        assert fake.stats()["sent_per_chat"][config.target_channel] == 1
+    finally:
+        fake.stop()
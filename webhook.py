@@ -0,0 +1,127 @@
+# webhook.py
+"""Приём апдейтов бота через webhook на том же event loop, что и парсер.
+
+Вместо infinity_polling в отдельном потоке Telegram сам присылает апдейты
+POST-запросом на BOT_WEBHOOK_LISTEN:BOT_WEBHOOK_PORT (снаружи — через
+reverse proxy на BOT_WEBHOOK_URL). Сервер — обычный asyncio.start_server,
+он сразу отвечает 200 и передаёт апдейт в bot.process_new_updates;
+TeleBot в режиме threaded выполняет обработчики в пуле из
+BOT_HANDLER_THREADS потоков, поэтому медленная загрузка альбома не задерживает
+нажатие кнопки модерации. Если webhook не настроен или не поднялся —
+возвращаемся к polling в отдельном потоке.
+"""
+import asyncio
+import json
+import threading
+
+from telebot import types
+
+from config import (
+    BOT_RUNTIME, BOT_WEBHOOK_URL, BOT_WEBHOOK_LISTEN, BOT_WEBHOOK_PORT,
+    BOT_WEBHOOK_PATH, BOT_WEBHOOK_SECRET
+)
+from bot import bot, run_bot
+
+MAX_BODY = 1024 * 1024
+
+_server = None
+
+_RESPONSES = {
+    200: b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: keep-alive\r\n\r\n",
+    403: b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    413: b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+}
+
+
+def _dispatch(body: bytes):
+    try:
+        update = types.Update.de_json(json.loads(body.decode("utf-8")))
+    except Exception as e:
+        print(f"[WEBHOOK] Некорректный апдейт: {e}")
+        return
+    # в threaded-режиме обработчики уходят в пул потоков TeleBot — вызов не блокирует loop
+    bot.process_new_updates([update])
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                writer.write(_RESPONSES[400])
+                break
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY:
+                writer.write(_RESPONSES[413])
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            if method != "POST" or path.split("?", 1)[0] != BOT_WEBHOOK_PATH:
+                writer.write(_RESPONSES[404])
+                break
+            if BOT_WEBHOOK_SECRET and headers.get("x-telegram-bot-api-secret-token") != BOT_WEBHOOK_SECRET:
+                writer.write(_RESPONSES[403])
+                break
+
+            # отвечаем сразу: Telegram не ждёт, пока отработает обработчик
+            writer.write(_RESPONSES[200])
+            await writer.drain()
+            _dispatch(body)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        print(f"[WEBHOOK] {e}")
+    finally:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+async def start_webhook():
+    global _server
+    server = await asyncio.start_server(_handle_connection, BOT_WEBHOOK_LISTEN, BOT_WEBHOOK_PORT)
+    try:
+        await asyncio.to_thread(
+            bot.set_webhook,
+            url=BOT_WEBHOOK_URL,
+            secret_token=BOT_WEBHOOK_SECRET or None,
+            drop_pending_updates=True,
+        )
+    except Exception:
+        server.close()
+        raise
+    _server = server
+    print(f"🤖 Bot webhook слушает {BOT_WEBHOOK_LISTEN}:{BOT_WEBHOOK_PORT}{BOT_WEBHOOK_PATH}")
+    return server
+
+
+def _start_polling_thread():
+    t = threading.Thread(target=run_bot, name="bot", daemon=True)
+    t.start()
+    return t
+
+
+async def start_bot_runtime():
+    """Поднимает webhook на текущем loop; при ошибке или без настроек — polling."""
+    if BOT_RUNTIME == "webhook" and BOT_WEBHOOK_URL:
+        try:
+            return await start_webhook()
+        except Exception as e:
+            print(f"[WEBHOOK] Не удалось запустить webhook ({e}), переключаюсь на polling")
+    return _start_polling_thread()